@@ -2,45 +2,101 @@
 """
 Script to generate description embeddings for products in the product_data.json file.
 Concatenates product name and description to create embeddings using Azure OpenAI.
-This script is restartable - it will skip products that already have embeddings.
+This script is restartable - it will skip products whose embedding is up to date.
+
+Vectors are written to the binary sidecar store (embedding_store.py) keyed by SKU,
+together with the content hash of the text each was embedded from. Products whose
+name or description changed since then are re-embedded, and vectors for unchanged
+content are restored from the shared embedding cache (embedding_cache.py) rather
+than requested again. Embeddings still found inline in product_data.json from older
+runs are moved into the sidecar.
+
+Products are embedded in batches (up to the API's input limit per request) by a
+bounded pool of async workers. Rate-limited requests are retried with backoff that
+honours the service's Retry-After hint. Every finished batch is appended to a small
+checkpoint journal and the sidecar is rewritten only periodically, so an interrupted
+run loses at most one batch of work.
+
+USAGE:
+    python add_description_embeddings.py [--batch-size 256] [--concurrency 4]
+                                         [--checkpoint-every 10] [--max-retries 6]
+
+To test offline, start fake_openai_server.py and point the script at it:
+    AZURE_OPENAI_ENDPOINT=http://localhost:8089 AZURE_OPENAI_API_KEY=fake \\
+        python add_description_embeddings.py
 """
 
+import argparse
+import asyncio
 import json
 import os
+import random
 import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from embedding_cache import EmbeddingCache
+from embedding_store import DESCRIPTION_EMBEDDINGS, EmbeddingStore
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    RateLimitError,
+)
+
+# Azure OpenAI accepts at most 2048 inputs per embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
 
 
 class DescriptionEmbeddingProcessor:
-    def __init__(self, data_directory_path: str) -> None:
+    def __init__(
+        self,
+        data_directory_path: str,
+        batch_size: int = 256,
+        concurrency: int = 4,
+        checkpoint_every: int = 10,
+        max_retries: int = 6,
+        cache_path: Optional[str] = None,
+    ) -> None:
         """
         Initialize the description embedding processor.
-        
+
         Args:
             data_directory_path: Path to the data directory containing product_data.json
+            batch_size: Number of products sent per embeddings request
+            concurrency: Number of embeddings requests in flight at once
+            checkpoint_every: Rewrite the sidecar store after this many completed batches
+            max_retries: Retries per batch for rate limits and transient errors
+            cache_path: Optional path to the shared embedding cache
         """
         self.data_directory_path = Path(data_directory_path)
         self.json_file_path = self.data_directory_path / "product_data.json"
-        
+        self.checkpoint_path = self.data_directory_path / "product_data.description_embeddings.jsonl"
+
+        # Batching and concurrency settings
+        self.batch_size = max(1, min(batch_size, MAX_INPUTS_PER_REQUEST))
+        self.concurrency = max(1, concurrency)
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.max_retries = max(0, max_retries)
+
         # Load environment variables
         self._load_environment()
-        
+
         # Configuration
         self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "<ENDPOINT_URL>")
         self.model_name = "text-embedding-3-small"
         self.deployment = "text-embedding-3-small"
-        
+
         # Check if endpoint is configured
         if self.endpoint == "<ENDPOINT_URL>":
             print("Error: Please set the AZURE_OPENAI_ENDPOINT environment variable!")
             print("Example: export AZURE_OPENAI_ENDPOINT='https://your-openai-resource.openai.azure.com/'")
             sys.exit(1)
-        
+
         # Initialize Azure OpenAI client
         print("Setting up Azure OpenAI client...")
         try:
@@ -49,10 +105,18 @@ class DescriptionEmbeddingProcessor:
         except Exception as e:
             print(f"Failed to initialize Azure OpenAI client: {e}")
             sys.exit(1)
-        
-        # Load the product data
+
+        # Content-addressed cache shared with the other embedding tools
+        self.cache = EmbeddingCache(cache_path)
+
+        # Binary sidecar holding the vectors, keyed by SKU
+        self.store = EmbeddingStore(str(self.data_directory_path), DESCRIPTION_EMBEDDINGS)
+        self.product_data_changed = False
+
+        # Load the product data and replay any unsaved checkpoint batches
         self.load_product_data()
-    
+        self.replay_checkpoint()
+
     def _load_environment(self) -> None:
         """Load environment variables from .env files."""
         script_dir = Path(__file__).parent
@@ -68,21 +132,32 @@ class DescriptionEmbeddingProcessor:
         else:
             # Fallback to default behavior
             load_dotenv()
-    
-    def _setup_azure_openai_client(self) -> AzureOpenAI:
-        """Setup and return Azure OpenAI client with token provider."""
+
+    def _setup_azure_openai_client(self) -> AsyncAzureOpenAI:
+        """Setup and return Azure OpenAI client with token provider or API key."""
+        api_version = "2024-02-01"
+
+        # Retries are handled by get_description_embeddings so the backoff can honour Retry-After
+        api_key = os.getenv("AZURE_OPENAI_API_KEY")
+        if api_key:
+            return AsyncAzureOpenAI(
+                api_version=api_version,
+                azure_endpoint=self.endpoint,
+                api_key=api_key,
+                max_retries=0,
+            )
+
         token_provider = get_bearer_token_provider(
-            DefaultAzureCredential(), 
+            DefaultAzureCredential(),
             "https://cognitiveservices.azure.com/.default"
         )
-        api_version = "2024-02-01"
-        
-        return AzureOpenAI(
+        return AsyncAzureOpenAI(
             api_version=api_version,
             azure_endpoint=self.endpoint,
             azure_ad_token_provider=token_provider,
+            max_retries=0,
         )
-    
+
     def load_product_data(self) -> None:
         """Load the product data from JSON file."""
         try:
@@ -95,156 +170,332 @@ class DescriptionEmbeddingProcessor:
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON file: {e}")
             sys.exit(1)
-    
+
     def save_product_data(self) -> None:
-        """Save the product data back to JSON file."""
+        """Save the product data back to JSON file (only needed when inline embeddings were migrated)."""
         try:
-            with self.json_file_path.open('w', encoding='utf-8') as f:
+            temp_path = self.json_file_path.with_suffix('.json.tmp')
+            with temp_path.open('w', encoding='utf-8') as f:
                 json.dump(self.product_data, f, indent=2, ensure_ascii=False)
-            
+            os.replace(temp_path, self.json_file_path)
+            self.product_data_changed = False
             print(f"Saved updated product data to {self.json_file_path}")
         except Exception as e:
             print(f"Error saving JSON file: {e}")
             sys.exit(1)
-    
-    def get_description_embedding(self, product_name: str, description: str) -> Optional[List[float]]:
-        """
-        Generate embedding for a product description.
-        
-        Args:
-            product_name: Name of the product
-            description: Description of the product
-            
-        Returns:
-            List of float values representing the embedding
-        """
+
+    def save_embeddings(self) -> None:
+        """Write the sidecar store and reset the checkpoint journal."""
         try:
-            # Concatenate name and description
-            combined_text = f"{product_name}. {description}"
-            
-            # Generate embedding using Azure OpenAI
-            response = self.client.embeddings.create(
-                input=[combined_text],
-                model=self.deployment
-            )
-            
-            # Extract embedding from response
-            return response.data[0].embedding
-            
+            self.store.save()
+            # Everything in the journal is now in the sidecar
+            self.checkpoint_path.unlink(missing_ok=True)
         except Exception as e:
-            print(f"Error generating embedding for {product_name}: {e}")
-            return None
-    
-    def process_product(self, product: Dict[str, Any]) -> bool:
+            print(f"Error saving embedding store: {e}")
+            sys.exit(1)
+
+    def iter_products(self):
+        """Yield (product_key, product) for every product dictionary in the catalogue."""
+        for category_name, category_data in self.product_data.get('main_categories', {}).items():
+            for subcategory_name, products in category_data.items():
+                # Skip non-product items (like seasonal multipliers)
+                if not isinstance(products, list):
+                    continue
+                for index, product in enumerate(products):
+                    if isinstance(product, dict):
+                        yield f"{category_name}/{subcategory_name}/{index}", product
+
+    def append_checkpoint(self, results: List[Tuple[str, str, List[float]]]) -> None:
+        """Append a finished batch to the checkpoint journal (one JSON line per product)."""
+        with self.checkpoint_path.open('a', encoding='utf-8') as f:
+            for sku, content_hash, embedding in results:
+                f.write(json.dumps({'sku': sku, 'hash': content_hash, 'embedding': embedding}) + '\n')
+
+    def replay_checkpoint(self) -> None:
+        """Apply embeddings from a journal left behind by an interrupted run."""
+        if not self.checkpoint_path.exists():
+            return
+
+        replayed = 0
+        with self.checkpoint_path.open('r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted write - ignore it
+                    continue
+                sku = entry.get('sku')
+                if sku and self.store.get_hash(sku) != entry.get('hash'):
+                    self.store.set(sku, entry['embedding'], entry.get('hash'))
+                    replayed += 1
+
+        if replayed:
+            print(f"Recovered {replayed} embeddings from checkpoint {self.checkpoint_path.name}")
+            self.save_embeddings()
+        else:
+            self.checkpoint_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def build_embedding_text(product_name: str, description: str) -> str:
+        """Concatenate name and description into the text that gets embedded."""
+        return f"{product_name}. {description}"
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Work out how long to wait before retrying, preferring the server's hint."""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after_ms = response.headers.get('retry-after-ms')
+            if retry_after_ms:
+                try:
+                    return float(retry_after_ms) / 1000.0
+                except ValueError:
+                    pass
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+
+        # Exponential backoff with full jitter, capped at 60 seconds
+        return random.uniform(0, min(60.0, 2 ** attempt))
+
+    async def get_description_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
-        Process a single product to add description embedding.
-        
+        Generate embeddings for a batch of product texts in a single request.
+
         Args:
-            product: Product dictionary
-            
+            texts: Combined name/description strings, at most MAX_INPUTS_PER_REQUEST
+
         Returns:
-            True if embedding was added, False if skipped or failed
+            List of embeddings in the same order as texts
         """
-        # Check if product already has a valid embedding (non-empty)
-        if product.get('description_embedding'):
-            print(f"Skipping {product.get('name', 'Unknown')} - already has embedding")
-            return False
-        
-        # Check if product has name and description
-        if 'name' not in product or 'description' not in product:
-            print(f"Warning: {product.get('name', 'Unknown')} missing name or description")
-            return False
-        
-        product_name = product['name']
-        description = product['description']
-        
-        print(f"Processing: {product_name}")
-        
-        # Generate embedding
-        embedding = self.get_description_embedding(product_name, description)
-        
-        if embedding is not None:
-            product['description_embedding'] = embedding
-            print(f"✓ Added embedding for {product_name} (dimension: {len(embedding)})")
-            return True
-        print(f"✗ Failed to generate embedding for {product_name}")
-        return False
-    
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.embeddings.create(
+                    input=texts,
+                    model=self.deployment
+                )
+                ordered = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in ordered]
+
+            except (RateLimitError, APIConnectionError, APITimeoutError) as e:
+                error = e
+            except APIStatusError as e:
+                # Client errors other than 429 will not succeed on retry
+                if e.status_code < 500:
+                    raise
+                error = e
+
+            if attempt == self.max_retries:
+                raise error
+            delay = self._retry_delay(attempt, error)
+            print(f"  ↻ {type(error).__name__}, retrying batch of {len(texts)} in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+        return []
+
+    def content_hash(self, product: Dict[str, Any]) -> str:
+        """Hash of the model and the exact text that gets embedded for a product."""
+        text = self.build_embedding_text(product['name'], product['description'])
+        return EmbeddingCache.text_key(self.model_name, text)
+
+    def collect_pending_products(self) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, int]]:
+        """Find the products whose embedding is missing or stale, resolving what we can from the cache."""
+        candidates = []
+        counts = {'total': 0, 'skipped': 0, 'invalid': 0, 'stale': 0, 'cached': 0, 'migrated': 0}
+        seeded = []
+
+        for _, product in self.iter_products():
+            counts['total'] += 1
+
+            # Check if product has name and description
+            if 'name' not in product or 'description' not in product:
+                print(f"Warning: {product.get('name', 'Unknown')} missing name or description")
+                counts['invalid'] += 1
+                continue
+
+            sku = product.get('sku')
+            if not sku:
+                print(f"Warning: {product['name']} has no SKU - run generate_skus.py first")
+                counts['invalid'] += 1
+                continue
+
+            content_hash = self.content_hash(product)
+
+            # Move vectors left inline in product_data.json by older runs into the sidecar
+            legacy_embedding = product.pop('description_embedding', None)
+            legacy_hash = product.pop('description_embedding_hash', None)
+            if legacy_embedding is not None or legacy_hash is not None:
+                self.product_data_changed = True
+            if legacy_embedding and sku not in self.store:
+                self.store.set(sku, legacy_embedding, legacy_hash)
+                counts['migrated'] += 1
+
+            recorded_hash = self.store.get_hash(sku)
+
+            if sku in self.store and recorded_hash == content_hash:
+                counts['skipped'] += 1
+                continue
+
+            if sku in self.store and recorded_hash is None:
+                # Embedded before hashes were recorded - adopt the vector as-is
+                embedding = self.store.get(sku)
+                self.store.set(sku, embedding, content_hash)
+                seeded.append((content_hash, self.model_name, embedding.tolist()))
+                counts['skipped'] += 1
+                continue
+
+            if sku in self.store:
+                print(f"Stale embedding for {product['name']} - content changed since it was embedded")
+                counts['stale'] += 1
+
+            candidates.append((sku, product, content_hash))
+
+        if seeded:
+            self.cache.put_many(seeded)
+
+        # Anything whose content is already in the cache needs no API call
+        cached = self.cache.get_many([content_hash for _, _, content_hash in candidates])
+        pending = []
+        for sku, product, content_hash in candidates:
+            if content_hash in cached:
+                self.store.set(sku, cached[content_hash], content_hash)
+                counts['cached'] += 1
+            else:
+                pending.append((sku, product))
+
+        return pending, counts
+
+    async def _process_batches(self, pending: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """Run the worker pool over all pending products."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(0, len(pending), self.batch_size):
+            queue.put_nowait(pending[i:i + self.batch_size])
+        total_batches = queue.qsize()
+
+        stats = {'processed': 0, 'failed': 0, 'batches': 0}
+        save_lock = asyncio.Lock()
+
+        async def worker() -> None:
+            while True:
+                try:
+                    batch = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                texts = [self.build_embedding_text(p['name'], p['description']) for _, p in batch]
+                try:
+                    embeddings = await self.get_description_embeddings(texts)
+                except Exception as e:
+                    print(f"✗ Failed batch of {len(batch)} products: {e}")
+                    stats['failed'] += len(batch)
+                    continue
+
+                results = [(sku, self.content_hash(product), embedding)
+                           for (sku, product), embedding in zip(batch, embeddings)]
+
+                # Staged under the lock: save_embeddings() runs in a thread, reads the staged
+                # vectors and then clears them along with the journal
+                async with save_lock:
+                    for sku, content_hash, embedding in results:
+                        self.store.set(sku, embedding, content_hash)
+                    self.cache.put_many([(h, self.model_name, e) for _, h, e in results])
+                    await asyncio.to_thread(self.append_checkpoint, results)
+                    stats['processed'] += len(results)
+                    stats['batches'] += 1
+                    print(f"✓ Batch {stats['batches']}/{total_batches}: "
+                          f"{len(results)} embeddings (total {stats['processed']})")
+
+                    # Periodically fold the journal back into the sidecar store
+                    if stats['batches'] % self.checkpoint_every == 0:
+                        await asyncio.to_thread(self.save_embeddings)
+                        print(f"  → Saved progress ({stats['processed']} embeddings added)")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, total_batches))))
+        await self.client.close()
+        return stats
+
     def process_all_products(self) -> None:
         """Process all products in the JSON file to add description embeddings."""
-        total_products = 0
-        processed_products = 0
-        skipped_products = 0
-        failed_products = 0
-        
         print("Starting description embedding processing...")
+        print(f"Batch size: {self.batch_size}, concurrency: {self.concurrency}, "
+              f"checkpoint every {self.checkpoint_every} batches")
         print("=" * 50)
-        
-        # Iterate through all categories and subcategories
-        for category_name, category_data in self.product_data.get('main_categories', {}).items():
-            print(f"\nProcessing category: {category_name}")
-            
-            for subcategory_name, products in category_data.items():
-                # Skip non-product items (like seasonal multipliers)
-                if not isinstance(products, list):
-                    continue
-                
-                print(f"  Subcategory: {subcategory_name} ({len(products)} products)")
-                
-                for product in products:
-                    if not isinstance(product, dict):
-                        continue
-                    
-                    total_products += 1
-                    
-                    # Check if already has a valid embedding (non-empty)
-                    if product.get('description_embedding'):
-                        skipped_products += 1
-                        continue
-                    
-                    # Process the product
-                    success = self.process_product(product)
-                    
-                    if success:
-                        processed_products += 1
-                        # Save after each successful embedding
-                        self.save_product_data()
-                        print(f"  → Saved progress ({processed_products} embeddings added)")
-                    else:
-                        print(f"  → Failed to process {product.get('name', 'Unknown')}")
-                        failed_products += 1
-        
+
+        pending, counts = self.collect_pending_products()
+
+        started = time.perf_counter()
+        stats = {'processed': 0, 'failed': 0, 'batches': 0}
+        if pending:
+            stats = asyncio.run(self._process_batches(pending))
+        self.save_embeddings()
+        if self.product_data_changed:
+            self.save_product_data()
+        elapsed = time.perf_counter() - started
+        self.cache.close()
+
         # Print summary
         print("\n" + "=" * 50)
         print("PROCESSING COMPLETE")
         print("=" * 50)
-        print(f"Total products found: {total_products}")
-        print(f"Products processed: {processed_products}")
-        print(f"Products skipped (already had embeddings): {skipped_products}")
-        print(f"Products failed: {failed_products}")
+        print(f"Total products found: {counts['total']}")
+        print(f"Products processed: {stats['processed']}")
+        print(f"Products restored from cache: {counts['cached']}")
+        if counts['migrated']:
+            print(f"Inline embeddings moved to sidecar: {counts['migrated']}")
+        print(f"Stale embeddings detected: {counts['stale']}")
+        print(f"Products skipped (embedding up to date): {counts['skipped']}")
+        print(f"Products failed: {stats['failed'] + counts['invalid']}")
+        if stats['processed'] and elapsed > 0:
+            print(f"Throughput: {stats['processed'] / elapsed:.1f} embeddings/s "
+                  f"over {stats['batches']} requests ({elapsed:.1f}s)")
+        print(f"Embedding store: {len(self.store)} vectors in {self.store.matrix_path.name} "
+              f"({self.store.file_size() / (1024 * 1024):.1f} MB)")
         print("Final save completed!")
 
 
 def main() -> None:
     """Main function to run the description embedding processor."""
+    parser = argparse.ArgumentParser(description='Add description embeddings for the products in product_data.json')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help=f'Products per embeddings request (max {MAX_INPUTS_PER_REQUEST}, default: 256)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Concurrent embeddings requests (default: 4)')
+    parser.add_argument('--checkpoint-every', type=int, default=10,
+                        help='Rewrite the embedding store after this many batches (default: 10)')
+    parser.add_argument('--max-retries', type=int, default=6,
+                        help='Retries per batch on rate limits and transient errors (default: 6)')
+    parser.add_argument('--cache', default=None,
+                        help='Path to the shared embedding cache (default: embedding_cache.sqlite)')
+    args = parser.parse_args()
+
     # Get the directory of this script
     script_dir = Path(__file__).parent
-    
+
     print("Description Embedding Processor for Product Data")
     print("=" * 50)
     print(f"Working directory: {script_dir}")
-    
+
     # Verify we're in the right directory
     if not (script_dir / "product_data.json").exists():
         print("Error: product_data.json not found in current directory")
         print("Please run this script from the data/database directory")
         sys.exit(1)
-    
+
     try:
         # Create processor and run
-        processor = DescriptionEmbeddingProcessor(str(script_dir))
+        processor = DescriptionEmbeddingProcessor(
+            str(script_dir),
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            checkpoint_every=args.checkpoint_every,
+            max_retries=args.max_retries,
+            cache_path=args.cache,
+        )
         processor.process_all_products()
-        
+
     except KeyboardInterrupt:
         print("\n\nProcess interrupted by user. Progress has been saved.")
         sys.exit(0)
@@ -1,14 +1,30 @@
 #!/usr/bin/env python3
 """
 Script to add image embeddings to products in product_data.json file.
-This script is restartable - it will skip products that already have embeddings.
+This script is restartable - it will skip products whose embedding is up to date.
+
+Vectors are written to the binary sidecar store (embedding_store.py) keyed by SKU,
+together with the content hash of the image bytes each was embedded from, so a
+replaced image is detected as stale and re-embedded. Vectors for images that are
+already in the shared embedding cache (embedding_cache.py) are restored without
+running the CLIP model.
+
+When image_postprocess.py has written a 224x224 CLIP-ready copy of an image, that
+copy is fed to the model instead of decoding the full-size original. The content
+hash is still taken from the original so existing vectors stay valid.
 """
 
+import io
 import json
 import sys
+import time
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from embedding_cache import EmbeddingCache
+from embedding_store import IMAGE_EMBEDDINGS, EmbeddingStore
+from image_postprocess import clip_ready_path
+
 try:
     import torch
     from PIL import Image
@@ -20,6 +36,10 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Rewrite the sidecar store after this many newly computed embeddings
+SAVE_EVERY = 25
+
+
 class ImageEmbeddingProcessor:
     def __init__(self, data_generator_path: str):
         """
@@ -37,9 +57,9 @@ class ImageEmbeddingProcessor:
         print("Initializing CLIP embedding model...")
         try:
             # Load CLIP model and processor from HuggingFace
-            model_name = "openai/clip-vit-base-patch32"
-            self.processor = CLIPProcessor.from_pretrained(model_name)
-            self.model = CLIPModel.from_pretrained(model_name)
+            self.model_name = "openai/clip-vit-base-patch32"
+            self.processor = CLIPProcessor.from_pretrained(self.model_name)
+            self.model = CLIPModel.from_pretrained(self.model_name)
             
             # Set device (use CPU to avoid GPU complexity for now)
             self.device = "cpu"  # torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -51,6 +71,17 @@ class ImageEmbeddingProcessor:
             raise e
         print("Model initialized successfully!")
         
+        # Content-addressed cache shared with the other embedding tools
+        self.cache = EmbeddingCache()
+        
+        # Binary sidecar holding the vectors, keyed by SKU
+        self.store = EmbeddingStore(str(self.data_generator_path), IMAGE_EMBEDDINGS)
+        self.product_data_changed = False
+        
+        # Throughput counters for the summary
+        self.clip_ready_used = 0
+        self.embedding_seconds = 0.0
+        
         # Load the product data
         self.load_product_data()
     
@@ -68,95 +99,56 @@ class ImageEmbeddingProcessor:
             sys.exit(1)
     
     def save_product_data(self):
-        """Save the product data back to JSON file with single-line embeddings."""
+        """Save the product data back to JSON file (only needed when inline embeddings were migrated)."""
         try:
-            # First, save with regular formatting
             with open(self.json_file_path, 'w', encoding='utf-8') as f:
                 json.dump(self.product_data, f, indent=2, ensure_ascii=False)
-            
-            # Then format the embeddings to be on single lines
-            self._format_embeddings_single_line()
-            
+            self.product_data_changed = False
             print(f"Saved updated product data to {self.json_file_path}")
         except Exception as e:
             print(f"Error saving JSON file: {e}")
             sys.exit(1)
     
-    def _format_embeddings_single_line(self):
-        """Format all image_embedding arrays to be on single lines."""
-        import re
-        
+    def save_embeddings(self):
+        """Write the sidecar store."""
         try:
-            # Read the file content
-            with open(self.json_file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Pattern to match image_embedding arrays that span multiple lines
-            pattern = r'"image_embedding":\s*\[\s*((?:[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?,?\s*)*)\s*\]'
-            
-            def format_embedding_array(match):
-                """Format a single embedding array to be on one line."""
-                # Extract the numbers from the match
-                numbers_str = match.group(1)
-                
-                # Remove all whitespace and split by commas
-                numbers = [num.strip() for num in numbers_str.split(',') if num.strip()]
-                
-                # Join the numbers with commas and single spaces
-                formatted_numbers = ', '.join(numbers)
-                
-                # Return the formatted array
-                return f'"image_embedding": [{formatted_numbers}]'
-            
-            # Apply the formatting
-            formatted_content = re.sub(pattern, format_embedding_array, content, flags=re.DOTALL)
-            
-            # Write the formatted content back to the file
-            with open(self.json_file_path, 'w', encoding='utf-8') as f:
-                f.write(formatted_content)
-                
+            self.store.save()
         except Exception as e:
-            print(f"Warning: Failed to format embeddings to single line: {e}")
-            # Continue anyway since the file was saved successfully
+            print(f"Error saving embedding store: {e}")
+            sys.exit(1)
     
-    def get_image_embedding(self, image_path: str) -> Optional[List[float]]:
+    def resolve_image_path(self, image_path: str) -> Path:
+        """Map an image_path from the JSON onto the images directory."""
+        # Remove "images/" prefix if it exists since we're already in the images directory
+        if image_path.startswith("images/"):
+            image_filename = image_path[7:]  # Remove "images/" prefix
+        else:
+            image_filename = image_path
+        
+        return self.images_dir / image_filename
+    
+    def get_image_embedding(self, image_bytes: bytes, image_path: str) -> Optional[List[float]]:
         """
         Generate embedding for a single image.
         
         Args:
-            image_path: Path to the image file
+            image_bytes: Raw contents of the image file
+            image_path: Path of the image (used for error messages)
             
         Returns:
             List of float values representing the embedding
         """
         try:
-            # Create full path to image
-            # Remove "images/" prefix if it exists since we're already in the images directory
-            if image_path.startswith("images/"):
-                image_filename = image_path[7:]  # Remove "images/" prefix
-            else:
-                image_filename = image_path
-            
-            full_image_path = self.images_dir / image_filename
-            
-            if not full_image_path.exists():
-                print(f"Warning: Image file not found: {full_image_path}")
-                print(f"  Original path: {image_path}")
-                print(f"  Looking for: {image_filename}")
-                return None
-            
             # Verify the image can be opened
             try:
-                with Image.open(full_image_path) as img:
-                    # Convert to RGB if necessary
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+                with Image.open(io.BytesIO(image_bytes)) as img:
+                    img.verify()
             except Exception as img_error:
-                print(f"Warning: Cannot open image {full_image_path}: {img_error}")
+                print(f"Warning: Cannot open image {image_path}: {img_error}")
                 return None
             
             # Generate embedding using CLIP model
-            with Image.open(full_image_path) as img:
+            with Image.open(io.BytesIO(image_bytes)) as img:
                 # Convert to RGB if necessary
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
@@ -178,7 +170,7 @@ class ImageEmbeddingProcessor:
             print(f"Error generating embedding for {image_path}: {e}")
             return None
     
-    def process_product(self, product: Dict[str, Any]) -> bool:
+    def process_product(self, product: Dict[str, Any]) -> str:
         """
         Process a single product to add image embedding.
         
@@ -186,38 +178,88 @@ class ImageEmbeddingProcessor:
             product: Product dictionary
             
         Returns:
-            True if embedding was added, False if skipped or failed
+            'embedded' if a new embedding was computed, 'cached' if it was restored
+            from the cache, 'skipped' if the embedding is up to date, 'failed' otherwise
         """
-        # Check if product already has a valid embedding (non-empty)
-        if product.get('image_embedding'):
-            print(f"Skipping {product.get('name', 'Unknown')} - already has embedding")
-            return False
-        
         # Check if product has image_path
-        if 'image_path' not in product:
+        if not product.get('image_path'):
             print(f"Warning: {product.get('name', 'Unknown')} has no image_path")
-            return False
+            return 'failed'
         
         image_path = product['image_path']
         product_name = product.get('name', 'Unknown')
+        sku = product.get('sku')
+        if not sku:
+            print(f"Warning: {product_name} has no SKU - run generate_skus.py first")
+            return 'failed'
+        
+        # Move vectors left inline in product_data.json by older runs into the sidecar
+        legacy_embedding = product.pop('image_embedding', None)
+        legacy_hash = product.pop('image_embedding_hash', None)
+        if legacy_embedding is not None or legacy_hash is not None:
+            self.product_data_changed = True
+        if legacy_embedding and sku not in self.store:
+            self.store.set(sku, legacy_embedding, legacy_hash)
+        
+        full_image_path = self.resolve_image_path(image_path)
+        
+        if not full_image_path.exists():
+            print(f"Warning: Image file not found: {full_image_path}")
+            print(f"  Original path: {image_path}")
+            return 'failed'
+        
+        image_bytes = full_image_path.read_bytes()
+        content_hash = EmbeddingCache.image_key(self.model_name, image_bytes)
+        has_embedding = sku in self.store
+        recorded_hash = self.store.get_hash(sku)
+        
+        # Check if product already has an embedding for this exact image
+        if has_embedding and recorded_hash == content_hash:
+            return 'skipped'
+        
+        if has_embedding and recorded_hash is None:
+            # Embedded before hashes were recorded - adopt the vector as-is
+            embedding = self.store.get(sku)
+            self.store.set(sku, embedding, content_hash)
+            self.cache.put(content_hash, self.model_name, embedding.tolist())
+            return 'skipped'
+        
+        if has_embedding:
+            print(f"Stale embedding for {product_name} - image changed since it was embedded")
+        
+        cached = self.cache.get(content_hash)
+        if cached is not None:
+            self.store.set(sku, cached, content_hash)
+            print(f"✓ Restored embedding for {product_name} from cache")
+            return 'cached'
         
         print(f"Processing: {product_name}")
         print(f"Image path: {image_path}")
         
+        # Prefer the pre-resized CLIP input so the full-size PNG is never decoded
+        clip_path = clip_ready_path(self.images_dir, full_image_path.name)
+        model_bytes = clip_path.read_bytes() if clip_path is not None else image_bytes
+        
         # Generate embedding
-        embedding = self.get_image_embedding(image_path)
+        started = time.perf_counter()
+        embedding = self.get_image_embedding(model_bytes, str(clip_path or full_image_path))
+        self.embedding_seconds += time.perf_counter() - started
         
         if embedding is not None:
-            product['image_embedding'] = embedding
+            if clip_path is not None:
+                self.clip_ready_used += 1
+            self.store.set(sku, embedding, content_hash)
+            self.cache.put(content_hash, self.model_name, embedding)
             print(f"✓ Added embedding for {product_name} (dimension: {len(embedding)})")
-            return True
+            return 'embedded'
         print(f"✗ Failed to generate embedding for {product_name}")
-        return False
+        return 'failed'
     
     def process_all_products(self):
         """Process all products in the JSON file to add image embeddings."""
         total_products = 0
         processed_products = 0
+        cached_products = 0
         skipped_products = 0
         failed_products = 0
         
@@ -241,31 +283,44 @@ class ImageEmbeddingProcessor:
                     
                     total_products += 1
                     
-                    # Check if already has a valid embedding (non-empty)
-                    if product.get('image_embedding'):
-                        skipped_products += 1
-                        continue
-                    
                     # Process the product
-                    success = self.process_product(product)
+                    status = self.process_product(product)
                     
-                    if success:
+                    if status == 'embedded':
                         processed_products += 1
-                        # Save after each successful embedding
-                        self.save_product_data()
-                        print(f"  → Saved progress ({processed_products} embeddings added)")
+                        # Checkpoint the sidecar regularly so an interrupted run keeps its work
+                        if processed_products % SAVE_EVERY == 0:
+                            self.save_embeddings()
+                            print(f"  → Saved progress ({processed_products} embeddings added)")
+                    elif status == 'cached':
+                        cached_products += 1
+                    elif status == 'skipped':
+                        skipped_products += 1
                     else:
                         print(f"  → Failed to process {product.get('name', 'Unknown')}")
                         failed_products += 1
         
+        # Persist new vectors, cache restores and newly recorded hashes
+        self.save_embeddings()
+        if self.product_data_changed:
+            self.save_product_data()
+        self.cache.close()
+        
         # Print summary
         print("\n" + "=" * 50)
         print("PROCESSING COMPLETE")
         print("=" * 50)
         print(f"Total products found: {total_products}")
         print(f"Products processed: {processed_products}")
-        print(f"Products skipped (already had embeddings): {skipped_products}")
+        print(f"Products restored from cache: {cached_products}")
+        print(f"Products skipped (embedding up to date): {skipped_products}")
         print(f"Products failed: {failed_products}")
+        if processed_products and self.embedding_seconds > 0:
+            print(f"Embedding throughput: {processed_products / self.embedding_seconds:.1f} images/s "
+                  f"({self.clip_ready_used} from CLIP-ready 224px copies, "
+                  f"{processed_products - self.clip_ready_used} from full-size originals)")
+        print(f"Embedding store: {len(self.store)} vectors in {self.store.matrix_path.name} "
+              f"({self.store.file_size() / (1024 * 1024):.1f} MB)")
         print("Final save completed!")
 
 
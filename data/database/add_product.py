@@ -2,6 +2,8 @@ import json
 import os
 from typing import Union
 
+from catalog import sku_index
+
 
 def get_user_input(prompt: str, input_type: type = str, required: bool = True) -> Union[str, int, float]:
     """Get user input with type conversion and validation."""
@@ -118,7 +120,14 @@ print("Enter product details:")
 print("="*50)
 
 product_name = get_user_input("Product name: ")
-product_sku = get_user_input("Product SKU: ")
+# SKUs must be unique across the catalogue; the cached index avoids re-walking the JSON
+existing_skus = sku_index("product_data.json")
+while True:
+    product_sku = get_user_input("Product SKU: ")
+    if product_sku not in existing_skus:
+        break
+    category_name, product_type, _ = existing_skus[product_sku]
+    print(f"SKU {product_sku} is already used in '{product_type}' ({category_name}). Please enter a different SKU.")
 product_description = get_user_input("Product description: ")
 product_price = get_user_input("Product price ($): ", float)
 product_stock_level = get_user_input("Stock level: ", int)
@@ -130,8 +139,7 @@ new_product = {
     "price": product_price,
     "description": product_description,
     "stock_level": product_stock_level,
-    "image_path": "",
-    "image_embedding": []
+    "image_path": ""
 }
 
 # Add the new product to the selected category and type
@@ -148,3 +156,6 @@ print(f"  SKU: {new_product['sku']}")
 print(f"  Price: ${new_product['price']}")
 print(f"  Description: {new_product['description']}")
 print(f"  Stock Level: {new_product['stock_level']}")
+print("\nTo add it to an existing database without a rebuild:")
+print("  python add_description_embeddings.py")
+print("  python generate_zava_postgres.py --sync")
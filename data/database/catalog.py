@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Shared access layer for the product catalogue (product_data.json).
+
+The catalogue is a single JSON document of the form
+
+    {"main_categories": {<category>: {<product type>: [<product>, ...],
+                                      "washington_seasonal_multipliers": [...]}}}
+
+The tooling in this directory used to json.load() the whole file and walk
+main_categories itself. This module gives every tool the same single pass:
+
+- iter_products() / iter_catalog() stream products one at a time with an
+  incremental JSON parser (ijson), so memory stays bounded by the largest
+  single product rather than the whole catalogue
+- rewrite_catalog() streams the catalogue into a new file, passing every product
+  through a transform, with the same layout json.dump(indent=2) produces
+- sku_index() maps SKU -> (category, product type, position) and caches the
+  result next to the catalogue, so lookups only re-scan the JSON after it changes
+
+When ijson is not installed everything still works, but the catalogue is loaded
+with json.load() and memory use is proportional to the file size.
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'product_data.json')
+
+# Per-category metadata stored alongside the product lists
+SEASONAL_MULTIPLIERS_KEY = 'washington_seasonal_multipliers'
+
+SKU_INDEX_SUFFIX = '.sku_index.json'
+
+_DEPTH = {'start_map': 1, 'start_array': 1, 'end_map': -1, 'end_array': -1}
+
+
+class CatalogProduct(NamedTuple):
+    """A product and where it lives in the catalogue."""
+    category: str
+    product_type: str
+    index: int
+    product: Dict[str, Any]
+
+
+class CategoryValue(NamedTuple):
+    """A non-product value stored under a category, such as the seasonal multipliers."""
+    category: str
+    key: str
+    value: Any
+
+
+CatalogEntry = Union[CatalogProduct, CategoryValue]
+
+
+def is_streaming() -> bool:
+    """True when the incremental parser is available."""
+    return ijson is not None
+
+
+def walk_products(product_data: Dict) -> Iterator[CatalogProduct]:
+    """Iterate over the products of an already loaded catalogue."""
+    for entry in _walk_catalog(product_data):
+        if isinstance(entry, CatalogProduct):
+            yield entry
+
+
+def iter_catalog(path: str = DEFAULT_CATALOG_PATH) -> Iterator[CatalogEntry]:
+    """
+    Stream every entry of the catalogue in document order.
+
+    Args:
+        path: Path to product_data.json
+
+    Yields:
+        CatalogProduct for each product and CategoryValue for other values under
+        a category (e.g. the 12 seasonal multipliers)
+    """
+    if ijson is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from _walk_catalog(json.load(f))
+        return
+
+    with open(path, 'rb') as f:
+        yield from _stream_catalog(f)
+
+
+def iter_products(path: str = DEFAULT_CATALOG_PATH) -> Iterator[CatalogProduct]:
+    """Stream the products of the catalogue one at a time."""
+    for entry in iter_catalog(path):
+        if isinstance(entry, CatalogProduct):
+            yield entry
+
+
+def rewrite_catalog(path: str, output_path: str,
+                    transform: Callable[[CatalogProduct], Dict[str, Any]]) -> int:
+    """
+    Stream the catalogue at `path` into `output_path`, replacing each product with
+    the result of `transform`. Everything else is copied unchanged.
+
+    The output is laid out exactly like json.dump(data, f, indent=2, ensure_ascii=False),
+    so an identity transform reproduces a file written by the other tools byte for byte.
+    The caller decides when to move output_path over the original.
+
+    Args:
+        path: Catalogue to read
+        output_path: File to write (must differ from path)
+        transform: Called with each CatalogProduct, returns the product to write
+
+    Returns:
+        Number of products written
+    """
+    written = 0
+
+    if ijson is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for category_name, category_data in data.get('main_categories', {}).items():
+            if not isinstance(category_data, dict):
+                continue
+            for product_type, products in category_data.items():
+                if not isinstance(products, list):
+                    continue
+                index = 0
+                for position, product in enumerate(products):
+                    if isinstance(product, dict):
+                        products[position] = transform(CatalogProduct(category_name, product_type, index, product))
+                        index += 1
+                        written += 1
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        return written
+
+    with open(path, 'rb') as source, open(output_path, 'w', encoding='utf-8') as out:
+        emitter = _JsonEmitter(out)
+        for entry in _stream_catalog(source, emitter):
+            if isinstance(entry, CatalogProduct):
+                emitter.value(transform(entry))
+                written += 1
+
+    return written
+
+
+def sku_index(path: str = DEFAULT_CATALOG_PATH) -> Dict[str, Tuple[str, str, int]]:
+    """
+    Map every SKU in the catalogue to (category, product type, position).
+
+    The index is cached in product_data.sku_index.json next to the catalogue and
+    keyed by the catalogue's size and modification time; it is rebuilt with one
+    streaming pass whenever the JSON has changed.
+
+    Args:
+        path: Path to product_data.json
+
+    Returns:
+        Dictionary of SKU -> (category, product_type, index)
+    """
+    stat = os.stat(path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    index_path = os.path.splitext(path)[0] + SKU_INDEX_SUFFIX
+
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('source') == source:
+            return {sku: tuple(location) for sku, location in cached['skus'].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index: Dict[str, Tuple[str, str, int]] = {}
+    for entry in iter_products(path):
+        sku = entry.product.get('sku')
+        if sku:
+            index[sku] = (entry.category, entry.product_type, entry.index)
+
+    # A stale or unwritable cache only costs a re-scan next time
+    try:
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': source, 'skus': index}, f, ensure_ascii=False)
+        os.replace(temp_path, index_path)
+    except OSError:
+        pass
+
+    return index
+
+
+def _walk_catalog(product_data: Dict) -> Iterator[CatalogEntry]:
+    """Yield the entries of a loaded catalogue in the same shape as _stream_catalog."""
+    for category_name, category_data in product_data.get('main_categories', {}).items():
+        if not isinstance(category_data, dict):
+            continue
+        for key, value in category_data.items():
+            if not isinstance(value, list):
+                yield CategoryValue(category_name, key, value)
+                continue
+            loose = []
+            index = 0
+            for item in value:
+                if isinstance(item, dict):
+                    yield CatalogProduct(category_name, key, index, item)
+                    index += 1
+                else:
+                    loose.append(item)
+            if loose:
+                yield CategoryValue(category_name, key, loose)
+
+
+def _stream_catalog(stream, emitter: Optional['_JsonEmitter'] = None) -> Iterator[CatalogEntry]:
+    """
+    Turn ijson parser events into catalogue entries.
+
+    Products are assembled one at a time; every other event is forwarded to
+    `emitter` when one is given, so the caller can write the (possibly replaced)
+    product when it is yielded and end up with a full copy of the document.
+    """
+    path: List[Optional[str]] = []  # current key of each open container (None for arrays)
+    product = None                  # builder for the product being read
+    value = None                    # builder for a non-product value being read
+    depth = 0
+    index = 0
+    loose: List[Any] = []
+
+    for _prefix, event, data in ijson.parse(stream, use_float=True):
+        if product is not None:
+            product.event(event, data)
+            depth += _DEPTH.get(event, 0)
+            if depth == 0:
+                yield CatalogProduct(path[1], path[2], index, product.value)
+                product = None
+                index += 1
+            continue
+
+        in_catalog = len(path) >= 3 and path[0] == 'main_categories' and path[2] is not None
+        in_type_value = in_catalog and len(path) == 3
+        in_type_list = in_catalog and len(path) == 4 and path[3] is None
+
+        if value is None and in_type_list and event == 'start_map':
+            product = ijson.ObjectBuilder()
+            product.event(event, data)
+            depth = 1
+            continue
+
+        if emitter is not None:
+            emitter.event(event, data)
+
+        if value is not None:
+            value.event(event, data)
+            depth += _DEPTH.get(event, 0)
+            if depth == 0:
+                if in_type_list:
+                    loose.append(value.value)
+                else:
+                    yield CategoryValue(path[1], path[2], value.value)
+                value = None
+            continue
+
+        if in_type_value and event == 'start_array':
+            path.append(None)
+            index = 0
+            loose = []
+        elif (in_type_value and event == 'start_map') or (in_type_list and event == 'start_array'):
+            value = ijson.ObjectBuilder()
+            value.event(event, data)
+            depth = 1
+        elif in_type_value and event not in _DEPTH and event != 'map_key':
+            yield CategoryValue(path[1], path[2], data)
+        elif in_type_list and event == 'end_array':
+            path.pop()
+            if loose:
+                yield CategoryValue(path[1], path[2], loose)
+                loose = []
+        elif in_type_list and event not in _DEPTH:
+            loose.append(data)
+        elif event in ('start_map', 'start_array'):
+            path.append(None)
+        elif event in ('end_map', 'end_array'):
+            path.pop()
+        elif event == 'map_key':
+            path[-1] = data
+
+
+class _JsonEmitter:
+    """Write ijson events back out with the layout of json.dump(indent=2, ensure_ascii=False)."""
+
+    def __init__(self, out, indent: int = 2):
+        self.out = out
+        self.indent = indent
+        self.counts: List[int] = []  # values written so far in each open container
+        self.key: Optional[str] = None
+
+    def _begin_value(self) -> None:
+        if not self.counts:
+            return
+        if self.counts[-1]:
+            self.out.write(',')
+        self.counts[-1] += 1
+        self.out.write('\n' + ' ' * (self.indent * len(self.counts)))
+        if self.key is not None:
+            self.out.write(json.dumps(self.key, ensure_ascii=False) + ': ')
+            self.key = None
+
+    def event(self, event: str, data: Any) -> None:
+        if event == 'map_key':
+            self.key = data
+        elif event in ('start_map', 'start_array'):
+            self._begin_value()
+            self.out.write('{' if event == 'start_map' else '[')
+            self.counts.append(0)
+        elif event in ('end_map', 'end_array'):
+            if self.counts.pop():
+                self.out.write('\n' + ' ' * (self.indent * len(self.counts)))
+            self.out.write('}' if event == 'end_map' else ']')
+        else:
+            self.value(data)
+
+    def value(self, data: Any) -> None:
+        """Write a complete value at the current position."""
+        self._begin_value()
+        text = json.dumps(data, indent=self.indent, ensure_ascii=False)
+        self.out.write(text.replace('\n', '\n' + ' ' * (self.indent * len(self.counts))))
@@ -1,38 +1,44 @@
-import json
 import os
 
+from catalog import SEASONAL_MULTIPLIERS_KEY, CatalogProduct, iter_catalog
+from embedding_store import IMAGE_EMBEDDINGS, EmbeddingStore
+
 os.chdir('/workspace/data/database')
 
-with open('product_data.json', 'r') as f:
-    data = json.load(f)
+# Image embeddings are kept in the sidecar store, with inline JSON arrays as a fallback
+image_store = EmbeddingStore('.', IMAGE_EMBEDDINGS)
+
+# One streaming pass: category -> product type -> [products, with embeddings]
+counts = {}
+seasonal = set()
+for entry in iter_catalog('product_data.json'):
+    type_counts = counts.setdefault(entry.category, {})
+    if isinstance(entry, CatalogProduct):
+        if 'name' not in entry.product:
+            continue
+        type_count = type_counts.setdefault(entry.product_type, [0, 0])
+        type_count[0] += 1
+        if entry.product.get('sku') in image_store or entry.product.get('image_embedding'):
+            type_count[1] += 1
+    elif entry.key == SEASONAL_MULTIPLIERS_KEY:
+        seasonal.add(entry.category)
 
 print('=== PRODUCT COUNT ANALYSIS ===')
 total_products = 0
 total_with_embeddings = 0
 
-for category_name, category_data in data['main_categories'].items():
+for category_name, type_counts in counts.items():
     category_products = 0
     category_embeddings = 0
-    
+
     print(f'\n{category_name}:')
-    for key, value in category_data.items():
-        if isinstance(value, list) and key != 'washington_seasonal_multipliers':  # Exclude metadata
-            # Additional check: make sure it's actually a product list (contains dicts with 'name')
-            if value and isinstance(value[0], dict) and 'name' in value[0]:
-                product_count = len(value)
-                category_products += product_count
-                
-                # Count embeddings
-                embeddings_in_type = 0
-                for product in value:
-                    if isinstance(product, dict) and 'image_embedding' in product and len(product['image_embedding']) > 0:
-                        embeddings_in_type += 1
-                
-                category_embeddings += embeddings_in_type
-                print(f'  {key}: {product_count} products ({embeddings_in_type} with embeddings)')
-        elif key == 'washington_seasonal_multipliers':
-            print(f'  {key}: [seasonal metadata - 12 monthly multipliers]')
-    
+    for key, (product_count, embeddings_in_type) in type_counts.items():
+        category_products += product_count
+        category_embeddings += embeddings_in_type
+        print(f'  {key}: {product_count} products ({embeddings_in_type} with embeddings)')
+    if category_name in seasonal:
+        print(f'  {SEASONAL_MULTIPLIERS_KEY}: [seasonal metadata - 12 monthly multipliers]')
+
     total_products += category_products
     total_with_embeddings += category_embeddings
     print(f'  Category Total: {category_products} products, {category_embeddings} with embeddings')
@@ -41,12 +47,12 @@ print(f'\n=== FINAL SUMMARY ===')
 print(f'📦 Total Products: {total_products}')
 print(f'🎯 Products with Embeddings: {total_with_embeddings}')
 print(f'🔢 Products without Embeddings: {total_products - total_with_embeddings}')
-print(f'📁 Categories: {len(data["main_categories"])}')
+print(f'📁 Categories: {len(counts)}')
 
 # Let's also check file line count
 try:
     with open('product_data.json', 'r') as f:
-        lines = f.readlines()
-    print(f'📄 File Lines: {len(lines)}')
+        line_count = sum(1 for _ in f)
+    print(f'📄 File Lines: {line_count}')
 except:
     print('📄 Could not count file lines')
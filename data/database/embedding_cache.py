@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Content-addressed embedding cache shared by the embedding tools.
+
+Vectors are keyed by a hash of the embedding model plus the exact content that was
+embedded (product name + description text, or the raw image bytes). A product whose
+content has not changed is never sent to the model again, an edited product gets a
+new key so its stale vector is detected, and a wiped embedding field is restored from
+the cache instead of being recomputed.
+
+The store is a single SQLite file holding float32 blobs, so it stays compact and needs
+no extra dependencies.
+
+Usage:
+    from embedding_cache import EmbeddingCache
+
+    with EmbeddingCache() as cache:
+        key = EmbeddingCache.text_key("text-embedding-3-small", "Claw Hammer. Steel...")
+        vector = cache.get(key)
+        if vector is None:
+            vector = embed(...)
+            cache.put(key, "text-embedding-3-small", vector)
+"""
+
+import hashlib
+import os
+import sqlite3
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "embedding_cache.sqlite"
+
+
+class EmbeddingCache:
+    """SQLite-backed store of embedding vectors keyed by content hash."""
+
+    def __init__(self, cache_path: Optional[str] = None, check_same_thread: bool = True) -> None:
+        """
+        Open (or create) the cache.
+
+        Args:
+            cache_path: Path to the SQLite file. Defaults to EMBEDDING_CACHE_PATH or
+                embedding_cache.sqlite next to this script.
+            check_same_thread: False to allow use from other threads than the opening one
+                (one at a time, e.g. under a lock)
+        """
+        self.cache_path = Path(cache_path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.conn = sqlite3.connect(self.cache_path, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                content_hash TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @staticmethod
+    def text_key(model: str, text: str) -> str:
+        """Content hash for a text embedding."""
+        digest = hashlib.sha256()
+        digest.update(f"{model}\0text\0".encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def image_key(model: str, image_bytes: bytes) -> str:
+        """Content hash for an image embedding."""
+        digest = hashlib.sha256()
+        digest.update(f"{model}\0image\0".encode("utf-8"))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _encode(vector: Iterable[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        values = array("f")
+        values.frombytes(blob)
+        return values.tolist()
+
+    def get(self, content_hash: str) -> Optional[List[float]]:
+        """Return the cached vector for a content hash, or None."""
+        row = self.conn.execute(
+            "SELECT vector FROM embeddings WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._decode(row[0])
+
+    def get_many(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for every hash that is present."""
+        found: Dict[str, List[float]] = {}
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(content_hashes), 500):
+            chunk = content_hashes[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT content_hash, vector FROM embeddings WHERE content_hash IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for content_hash, blob in rows:
+                found[content_hash] = self._decode(blob)
+        self.hits += len(found)
+        self.misses += len(set(content_hashes)) - len(found)
+        return found
+
+    def put(self, content_hash: str, model: str, vector: List[float]) -> None:
+        """Store a single vector."""
+        self.put_many([(content_hash, model, vector)])
+
+    def put_many(self, items: List[Tuple[str, str, List[float]]]) -> None:
+        """Store several vectors in one transaction."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (content_hash, model, dimensions, vector) VALUES (?, ?, ?, ?)",
+                [(content_hash, model, len(vector), self._encode(vector)) for content_hash, model, vector in items],
+            )
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        self.conn.close()
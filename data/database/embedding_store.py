@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Binary sidecar store for product embeddings.
+
+Embeddings used to live inside product_data.json as JSON float text, which dominated
+the file's size and its load/save time. They are now kept next to it as one float32
+matrix per embedding kind plus a small SKU index:
+
+    product_data.description_embeddings.npy         (N x 1536 float32)
+    product_data.description_embeddings.index.json  {"dimensions", "skus", "hashes"}
+    product_data.image_embeddings.npy               (N x 512 float32)
+    product_data.image_embeddings.index.json
+
+The matrix is opened lazily with numpy's memory mapping, so loaders such as the
+database generator read rows straight from the page cache without parsing anything.
+Row i of the matrix belongs to skus[i]; hashes[i] is the content hash recorded by
+embedding_cache.py when that vector was computed.
+
+Usage:
+    from embedding_store import EmbeddingStore
+
+    store = EmbeddingStore(data_dir, "description_embeddings")
+    vector = store.get("HTHAM001")        # read-only float32 row view, or None
+    store.set("HTHAM001", vector, content_hash)
+    store.save()
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DESCRIPTION_EMBEDDINGS = "description_embeddings"
+IMAGE_EMBEDDINGS = "image_embeddings"
+
+
+class EmbeddingStore:
+    """Memory-mapped float32 embedding matrix indexed by product SKU."""
+
+    def __init__(self, data_directory_path: str, name: str, file_stem: str = "product_data") -> None:
+        """
+        Args:
+            data_directory_path: Directory holding product_data.json
+            name: Embedding kind, e.g. "description_embeddings" or "image_embeddings"
+            file_stem: Stem shared with the catalogue file
+        """
+        self.data_directory_path = Path(data_directory_path)
+        self.name = name
+        self.matrix_path = self.data_directory_path / f"{file_stem}.{name}.npy"
+        self.index_path = self.data_directory_path / f"{file_stem}.{name}.index.json"
+
+        # Loaded on first use
+        self._matrix: Optional[np.ndarray] = None
+        self._skus: Optional[List[str]] = None
+        self._hashes: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {}
+        self._dimensions: Optional[int] = None
+
+        # Changes staged until save()
+        self._pending: Dict[str, Tuple[np.ndarray, Optional[str]]] = {}
+        self._deleted: set = set()
+
+    def exists(self) -> bool:
+        """True if the sidecar files are present on disk."""
+        return self.matrix_path.exists() and self.index_path.exists()
+
+    def _load_index(self) -> None:
+        if self._skus is not None:
+            return
+        if self.index_path.exists():
+            with self.index_path.open("r", encoding="utf-8") as f:
+                index = json.load(f)
+            self._skus = index["skus"]
+            self._hashes = index.get("hashes") or [None] * len(self._skus)
+            self._dimensions = index.get("dimensions")
+        else:
+            self._skus = []
+            self._hashes = []
+        self._positions = {sku: i for i, sku in enumerate(self._skus)}
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The on-disk matrix, memory-mapped read-only on first access."""
+        if self._matrix is None:
+            self._load_index()
+            if self.matrix_path.exists() and self._skus:
+                self._matrix = np.load(self.matrix_path, mmap_mode="r")
+            else:
+                self._matrix = np.empty((0, self._dimensions or 0), dtype=np.float32)
+        return self._matrix
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        self._load_index()
+        return self._dimensions
+
+    def skus(self) -> List[str]:
+        """All SKUs with a vector, including staged changes."""
+        self._load_index()
+        stored = [sku for sku in self._skus if sku not in self._deleted]
+        return stored + [sku for sku in self._pending if sku not in self._positions]
+
+    def __contains__(self, sku: str) -> bool:
+        self._load_index()
+        if sku in self._deleted:
+            return False
+        return sku in self._pending or sku in self._positions
+
+    def __len__(self) -> int:
+        return len(self.skus())
+
+    def get(self, sku: str) -> Optional[np.ndarray]:
+        """Return the vector for a SKU as a float32 array (a view into the mmap when saved)."""
+        if sku in self._pending:
+            return self._pending[sku][0]
+        self._load_index()
+        if sku in self._deleted or sku not in self._positions:
+            return None
+        return self.matrix[self._positions[sku]]
+
+    def get_hash(self, sku: str) -> Optional[str]:
+        """Return the content hash recorded for a SKU's vector."""
+        if sku in self._pending:
+            return self._pending[sku][1]
+        self._load_index()
+        if sku in self._deleted or sku not in self._positions:
+            return None
+        return self._hashes[self._positions[sku]]
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        """Yield (sku, vector) for every stored vector."""
+        for sku in self.skus():
+            yield sku, self.get(sku)
+
+    def set(self, sku: str, vector, content_hash: Optional[str] = None) -> None:
+        """Stage a vector for a SKU; written on the next save()."""
+        # Copy so a staged vector never aliases the mapping that save() replaces
+        array = np.array(vector, dtype=np.float32).reshape(-1)
+        self._load_index()
+        if self._dimensions is None:
+            self._dimensions = int(array.shape[0])
+        elif array.shape[0] != self._dimensions:
+            raise ValueError(
+                f"{self.name}: expected {self._dimensions} dimensions for {sku}, got {array.shape[0]}")
+        self._pending[sku] = (array, content_hash)
+        self._deleted.discard(sku)
+
+    def delete(self, sku: str) -> None:
+        """Stage removal of a SKU's vector."""
+        self._pending.pop(sku, None)
+        self._deleted.add(sku)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending or self._deleted)
+
+    def save(self) -> None:
+        """Write the matrix and index atomically, folding in staged changes."""
+        if not self.dirty:
+            return
+        self._load_index()
+
+        keep = [i for i, sku in enumerate(self._skus) if sku not in self._deleted]
+        skus = [self._skus[i] for i in keep]
+        hashes = [self._hashes[i] for i in keep]
+        appended = [sku for sku in self._pending if sku not in self._positions]
+
+        new_matrix = np.empty((len(skus) + len(appended), self._dimensions or 0), dtype=np.float32)
+        if keep:
+            new_matrix[:len(keep)] = self.matrix[keep]
+        positions = {sku: i for i, sku in enumerate(skus)}
+        for sku in appended:
+            positions[sku] = len(skus)
+            skus.append(sku)
+            hashes.append(None)
+        for sku, (vector, content_hash) in self._pending.items():
+            new_matrix[positions[sku]] = vector
+            hashes[positions[sku]] = content_hash
+
+        # Release the old mapping before the file underneath it is replaced
+        self._matrix = None
+
+        temp_matrix = self.matrix_path.with_suffix(".npy.tmp")
+        with temp_matrix.open("wb") as f:
+            np.save(f, new_matrix)
+        temp_index = self.index_path.with_suffix(".json.tmp")
+        with temp_index.open("w", encoding="utf-8") as f:
+            json.dump({"dimensions": self._dimensions, "skus": skus, "hashes": hashes}, f)
+        os.replace(temp_matrix, self.matrix_path)
+        os.replace(temp_index, self.index_path)
+
+        self._skus = skus
+        self._hashes = hashes
+        self._positions = positions
+        self._pending = {}
+        self._deleted = set()
+
+    def file_size(self) -> int:
+        """Combined size in bytes of the sidecar files."""
+        return sum(p.stat().st_size for p in (self.matrix_path, self.index_path) if p.exists())
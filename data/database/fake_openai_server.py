@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Local fake Azure OpenAI endpoint for offline testing of the catalogue tools.
+
+Serves deterministic embedding vectors and placeholder DALL-E images on the
+same URL layout that the AzureOpenAI client uses, so the embedding and image
+generation scripts can be pointed at it and their throughput measured without
+touching a real deployment.
+
+USAGE:
+    python fake_openai_server.py --port 8089 --latency-ms 150 --rate-limit 0.05
+
+    # In another shell
+    export AZURE_OPENAI_ENDPOINT=http://localhost:8089
+    export AZURE_OPENAI_API_KEY=fake
+    python add_description_embeddings.py --concurrency 8
+
+    python image_generation.py --images-dir /tmp/images --rate-per-minute 600 --yes
+
+ROUTES:
+    POST /openai/deployments/{deployment}/embeddings         (Azure layout)
+    POST /v1/embeddings                                       (OpenAI layout)
+    POST /openai/deployments/{deployment}/images/generations  (DALL-E layout)
+    GET  /images/{name}                                       (generated image download)
+    GET  /stats                                               (request counters)
+"""
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeOpenAIServer:
+    """Deterministic, rate-limit-capable stand-in for the Azure OpenAI REST API."""
+
+    def __init__(
+        self,
+        dimensions: int = 1536,
+        latency_ms: float = 100.0,
+        rate_limit: float = 0.0,
+        max_inputs: int = 2048,
+        retry_after: float = 1.0,
+        image_latency_ms: float = 2000.0,
+        image_size: int = 1024,
+        image_kb: int = 1024,
+    ) -> None:
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+        self.rate_limit = rate_limit
+        self.max_inputs = max_inputs
+        self.retry_after = retry_after
+        self.image_latency_ms = image_latency_ms
+        self.image_size = image_size
+        self.image_kb = image_kb
+        self.images: "OrderedDict[str, bytes]" = OrderedDict()
+        self.started_at = time.monotonic()
+        self.stats: Dict[str, int] = {
+            'embedding_requests': 0,
+            'embedding_inputs': 0,
+            'image_requests': 0,
+            'image_downloads': 0,
+            'image_bytes_served': 0,
+            'rate_limited': 0,
+            'rejected': 0,
+        }
+
+    def embed_text(self, text: str) -> List[float]:
+        """Return a unit-length vector derived from the text so repeated calls agree."""
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def render_image(self, prompt: str) -> bytes:
+        """
+        Build a valid PNG for the prompt: a colour gradient seeded by the prompt, padded
+        with a private ancillary chunk so the download is about as large as a real image.
+        """
+        seed = hashlib.sha256(prompt.encode('utf-8')).digest()
+        size = self.image_size
+        red, green, blue = seed[0], seed[1], seed[2]
+        rows = bytearray()
+        for y in range(size):
+            shade = y * 255 // max(1, size - 1)
+            pixel = bytes(((red + shade) % 256, (green + shade // 2) % 256, (blue + 255 - shade) % 256))
+            rows += b'\x00' + pixel * size
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+        png = b'\x89PNG\r\n\x1a\n'
+        png += chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+        png += chunk(b'IDAT', zlib.compress(bytes(rows), 6))
+        padding = self.image_kb * 1024 - len(png) - 12
+        if padding > 0:
+            png += chunk(b'faKe', random.Random(seed).randbytes(padding))
+        png += chunk(b'IEND', b'')
+        return png
+
+    async def _simulate_service(self, latency_ms: Optional[float] = None) -> None:
+        """Apply the configured latency with a little jitter."""
+        latency_ms = self.latency_ms if latency_ms is None else latency_ms
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000.0 * random.uniform(0.8, 1.2))
+
+    def _rate_limited_response(self) -> web.Response:
+        self.stats['rate_limited'] += 1
+        return web.json_response(
+            {'error': {'code': '429', 'message': 'Rate limit is exceeded. Try again later.'}},
+            status=429,
+            headers={
+                'Retry-After': str(math.ceil(self.retry_after)),
+                'retry-after-ms': str(int(self.retry_after * 1000)),
+            },
+        )
+
+    async def handle_embeddings(self, request: web.Request) -> web.Response:
+        """Handle both Azure and OpenAI style embedding requests."""
+        payload: Dict[str, Any] = await request.json()
+        inputs = payload.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        if len(inputs) > self.max_inputs:
+            self.stats['rejected'] += 1
+            return web.json_response(
+                {'error': {'code': 'BadRequest',
+                           'message': f'Too many inputs. The max number of inputs is {self.max_inputs}.'}},
+                status=400,
+            )
+
+        if self.rate_limit and random.random() < self.rate_limit:
+            return self._rate_limited_response()
+
+        await self._simulate_service()
+
+        self.stats['embedding_requests'] += 1
+        self.stats['embedding_inputs'] += len(inputs)
+
+        data = [
+            {'object': 'embedding', 'index': i, 'embedding': self.embed_text(str(text))}
+            for i, text in enumerate(inputs)
+        ]
+        tokens = sum(len(str(text).split()) for text in inputs)
+        return web.json_response({
+            'object': 'list',
+            'data': data,
+            'model': request.match_info.get('deployment', payload.get('model', 'text-embedding-3-small')),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
+
+    async def handle_image_generation(self, request: web.Request) -> web.Response:
+        """Handle DALL-E style image generation requests by returning a download URL."""
+        payload: Dict[str, Any] = await request.json()
+        prompt = str(payload.get('prompt', ''))
+
+        if self.rate_limit and random.random() < self.rate_limit:
+            return self._rate_limited_response()
+
+        await self._simulate_service(self.image_latency_ms)
+        self.stats['image_requests'] += 1
+
+        # Keep a bounded number of rendered images around for download
+        name = f"{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}-{self.stats['image_requests']}.png"
+        self.images[name] = await asyncio.to_thread(self.render_image, prompt)
+        while len(self.images) > 256:
+            self.images.popitem(last=False)
+
+        return web.json_response({
+            'created': int(time.time()),
+            'data': [{'url': f"{request.scheme}://{request.host}/images/{name}", 'revised_prompt': prompt.strip()}],
+        })
+
+    async def handle_image_download(self, request: web.Request) -> web.StreamResponse:
+        """Serve a previously generated image in chunks, like blob storage would."""
+        image = self.images.get(request.match_info['name'])
+        if image is None:
+            return web.Response(status=404)
+
+        response = web.StreamResponse(headers={'Content-Type': 'image/png', 'Content-Length': str(len(image))})
+        await response.prepare(request)
+        for i in range(0, len(image), 256 * 1024):
+            await response.write(image[i:i + 256 * 1024])
+        await response.write_eof()
+        self.stats['image_downloads'] += 1
+        self.stats['image_bytes_served'] += len(image)
+        return response
+
+    async def handle_stats(self, _request: web.Request) -> web.Response:
+        elapsed = time.monotonic() - self.started_at
+        return web.json_response({**self.stats, 'uptime_seconds': round(elapsed, 1)})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/openai/deployments/{deployment}/embeddings', self.handle_embeddings)
+        app.router.add_post('/v1/embeddings', self.handle_embeddings)
+        app.router.add_post('/openai/deployments/{deployment}/images/generations', self.handle_image_generation)
+        app.router.add_get('/images/{name}', self.handle_image_download)
+        app.router.add_get('/stats', self.handle_stats)
+        return app
+
+
+def main() -> None:
+    """Main entry point for the fake endpoint."""
+    parser = argparse.ArgumentParser(description='Fake Azure OpenAI endpoint for offline throughput testing')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8089, help='Port to listen on (default: 8089)')
+    parser.add_argument('--dimensions', type=int, default=1536,
+                        help='Embedding dimensions to return (default: 1536)')
+    parser.add_argument('--latency-ms', type=float, default=100.0,
+                        help='Simulated service latency per request in ms (default: 100)')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Probability (0-1) of answering a request with HTTP 429 (default: 0)')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='Retry-After seconds sent with 429 responses (default: 1.0)')
+    parser.add_argument('--max-inputs', type=int, default=2048,
+                        help='Maximum inputs accepted per embeddings request (default: 2048)')
+    parser.add_argument('--image-latency-ms', type=float, default=2000.0,
+                        help='Simulated latency per image generation request in ms (default: 2000)')
+    parser.add_argument('--image-size', type=int, default=1024,
+                        help='Width and height of generated images in pixels (default: 1024)')
+    parser.add_argument('--image-kb', type=int, default=1024,
+                        help='Approximate size of each generated PNG in KB (default: 1024)')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        dimensions=args.dimensions,
+        latency_ms=args.latency_ms,
+        rate_limit=args.rate_limit,
+        max_inputs=args.max_inputs,
+        retry_after=args.retry_after,
+        image_latency_ms=args.image_latency_ms,
+        image_size=args.image_size,
+        image_kb=args.image_kb,
+    )
+    print(f"Fake Azure OpenAI endpoint listening on http://{args.host}:{args.port}")
+    web.run_app(server.build_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
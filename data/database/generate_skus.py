@@ -12,7 +12,6 @@ USAGE:
     python generate_skus.py [--dry-run] [--backup] [--verbose]
 """
 
-import json
 import os
 import re
 import shutil
@@ -20,7 +19,9 @@ import argparse
 import logging
 from datetime import datetime
 from collections import defaultdict
-from typing import Dict
+from typing import Callable, Dict
+
+from catalog import CatalogProduct, iter_products, rewrite_catalog, sku_index
 
 
 def setup_logging(verbose: bool = False) -> None:
@@ -102,26 +103,14 @@ def generate_sku(category: str, product_type: str, number: int) -> str:
     return f"{category_code}{type_code}{number:03d}"
 
 
-def collect_existing_skus(product_data: Dict) -> set:
+def collect_existing_skus(file_path: str) -> set:
     """Collect all existing SKUs to avoid duplicates"""
-    existing_skus = set()
-    
-    for category_name, category_data in product_data.get('main_categories', {}).items():
-        for product_type, products in category_data.items():
-            if not isinstance(products, list):
-                continue
-                
-            for product in products:
-                if isinstance(product, dict):
-                    sku = product.get('sku')
-                    if sku:
-                        existing_skus.add(sku)
-    
+    existing_skus = set(sku_index(file_path))
     logging.info(f"Found {len(existing_skus)} existing SKUs")
     return existing_skus
 
 
-def analyze_missing_skus(product_data: Dict) -> Dict:
+def analyze_missing_skus(file_path: str) -> Dict:
     """Analyze which products need SKUs"""
     stats = {
         'total_products': 0,
@@ -130,31 +119,30 @@ def analyze_missing_skus(product_data: Dict) -> Dict:
         'categories_needing_skus': defaultdict(list)
     }
     
-    for category_name, category_data in product_data.get('main_categories', {}).items():
-        for product_type, products in category_data.items():
-            if not isinstance(products, list):
-                continue
-                
-            for i, product in enumerate(products):
-                if isinstance(product, dict):
-                    stats['total_products'] += 1
-                    sku = product.get('sku')
-                    
-                    if sku:
-                        stats['has_skus'] += 1
-                    else:
-                        stats['missing_skus'] += 1
-                        stats['categories_needing_skus'][f"{category_name}/{product_type}"].append({
-                            'index': i,
-                            'name': product.get('name', f'Product {i+1}')
-                        })
+    for category_name, product_type, i, product in iter_products(file_path):
+        stats['total_products'] += 1
+        sku = product.get('sku')
+        
+        if sku:
+            stats['has_skus'] += 1
+        else:
+            stats['missing_skus'] += 1
+            stats['categories_needing_skus'][f"{category_name}/{product_type}"].append({
+                'index': i,
+                'name': product.get('name', f'Product {i+1}')
+            })
     
     return stats
 
 
-def generate_and_assign_skus(product_data: Dict, dry_run: bool = False) -> Dict:
-    """Generate and assign SKUs to products that don't have them"""
-    existing_skus = collect_existing_skus(product_data)
+def generate_and_assign_skus(file_path: str, dry_run: bool = False) -> Dict:
+    """
+    Generate and assign SKUs to products that don't have them.
+    
+    The catalogue is streamed into a temporary file with the new SKUs filled in and
+    then moved over the original, so memory use does not grow with the catalogue.
+    """
+    existing_skus = collect_existing_skus(file_path)
     sku_counters = defaultdict(int)
     assignment_log = []
     
@@ -164,50 +152,55 @@ def generate_and_assign_skus(product_data: Dict, dry_run: bool = False) -> Dict:
         'conflicts_resolved': 0
     }
     
-    for category_name, category_data in product_data.get('main_categories', {}).items():
-        for product_type, products in category_data.items():
-            if not isinstance(products, list):
-                continue
-            
-            category_type_key = f"{category_name}/{product_type}"
-            
-            for i, product in enumerate(products):
-                if isinstance(product, dict) and not product.get('sku'):
-                    # Generate SKU
-                    sku_counters[category_type_key] += 1
-                    base_sku = generate_sku(category_name, product_type, sku_counters[category_type_key])
-                    
-                    # Ensure uniqueness
-                    final_sku = base_sku
-                    counter = 1
-                    while final_sku in existing_skus:
-                        stats['conflicts_resolved'] += 1
-                        # If conflict, try with incremented number
-                        sku_counters[category_type_key] += 1
-                        final_sku = generate_sku(category_name, product_type, sku_counters[category_type_key])
-                        counter += 1
-                        if counter > 1000:  # Safety break
-                            logging.error(f"Could not generate unique SKU for {category_type_key}")
-                            break
-                    
-                    # Record the assignment
-                    assignment_log.append({
-                        'category': category_name,
-                        'product_type': product_type,
-                        'product_index': i,
-                        'product_name': product.get('name', 'Unknown'),
-                        'generated_sku': final_sku
-                    })
-                    
-                    # Assign the SKU (unless dry run)
-                    if not dry_run:
-                        product['sku'] = final_sku
-                        stats['skus_assigned'] += 1
-                    
-                    existing_skus.add(final_sku)
-                    stats['skus_generated'] += 1
-                    
-                    logging.debug(f"Generated SKU: {final_sku} for {product.get('name', 'Unknown')}")
+    def assign_sku(entry: CatalogProduct) -> Dict:
+        category_name, product_type, i, product = entry
+        if product.get('sku'):
+            return product
+        
+        category_type_key = f"{category_name}/{product_type}"
+        
+        # Generate SKU
+        sku_counters[category_type_key] += 1
+        base_sku = generate_sku(category_name, product_type, sku_counters[category_type_key])
+        
+        # Ensure uniqueness
+        final_sku = base_sku
+        counter = 1
+        while final_sku in existing_skus:
+            stats['conflicts_resolved'] += 1
+            # If conflict, try with incremented number
+            sku_counters[category_type_key] += 1
+            final_sku = generate_sku(category_name, product_type, sku_counters[category_type_key])
+            counter += 1
+            if counter > 1000:  # Safety break
+                logging.error(f"Could not generate unique SKU for {category_type_key}")
+                break
+        
+        # Record the assignment
+        assignment_log.append({
+            'category': category_name,
+            'product_type': product_type,
+            'product_index': i,
+            'product_name': product.get('name', 'Unknown'),
+            'generated_sku': final_sku
+        })
+        
+        # Assign the SKU (unless dry run)
+        if not dry_run:
+            product['sku'] = final_sku
+            stats['skus_assigned'] += 1
+        
+        existing_skus.add(final_sku)
+        stats['skus_generated'] += 1
+        
+        logging.debug(f"Generated SKU: {final_sku} for {product.get('name', 'Unknown')}")
+        return product
+    
+    if dry_run:
+        for entry in iter_products(file_path):
+            assign_sku(entry)
+    else:
+        save_product_data(file_path, assign_sku)
     
     return {
         'stats': stats,
@@ -215,14 +208,17 @@ def generate_and_assign_skus(product_data: Dict, dry_run: bool = False) -> Dict:
     }
 
 
-def save_product_data(product_data: Dict, file_path: str) -> None:
-    """Save the updated product data back to JSON file"""
+def save_product_data(file_path: str, transform: Callable[[CatalogProduct], Dict]) -> None:
+    """Stream the product data through `transform` and replace the JSON file with the result"""
+    temp_path = f"{file_path}.tmp"
     try:
-        with open(file_path, 'w') as f:
-            json.dump(product_data, f, indent=2)
+        rewrite_catalog(file_path, temp_path, transform)
+        os.replace(temp_path, file_path)
         logging.info(f"Updated product data saved to {file_path}")
     except Exception as e:
         logging.error(f"Error saving product data: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         raise
 
 
@@ -263,19 +259,6 @@ def print_assignment_report(results: Dict, dry_run: bool = False) -> None:
     print("\n" + "=" * 80)
 
 
-def load_product_data(file_path: str) -> Dict:
-    """Load product data from JSON file"""
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logging.error(f"product_data.json not found at {file_path}")
-        raise
-    except json.JSONDecodeError as e:
-        logging.error(f"Error parsing product_data.json: {e}")
-        raise
-
-
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(
@@ -311,13 +294,9 @@ def main():
         logging.error(f"File not found: {file_path}")
         return
     
-    # Load data
-    logging.info(f"Loading product data from {file_path}")
-    product_data = load_product_data(file_path)
-    
     # Analyze current state
-    logging.info("Analyzing current SKU state...")
-    initial_stats = analyze_missing_skus(product_data)
+    logging.info(f"Analyzing current SKU state in {file_path}...")
+    initial_stats = analyze_missing_skus(file_path)
     
     print("INITIAL ANALYSIS:")
     print(f"  Total products: {initial_stats['total_products']}")
@@ -333,14 +312,9 @@ def main():
     if not args.dry_run and not args.no_backup and args.backup:
         backup_path = create_backup(file_path)
     
-    # Generate and assign SKUs
+    # Generate and assign SKUs (streams the updated catalogue back to disk unless dry run)
     logging.info("Generating SKUs...")
-    results = generate_and_assign_skus(product_data, dry_run=args.dry_run)
-    
-    # Save updated data
-    if not args.dry_run:
-        logging.info("Saving updated product data...")
-        save_product_data(product_data, file_path)
+    results = generate_and_assign_skus(file_path, dry_run=args.dry_run)
     
     # Print report
     print_assignment_report(results, dry_run=args.dry_run)
@@ -15,8 +15,8 @@ POSTGRESQL CONNECTION:
 
 FEATURES:
 - Complete database generation with customers, products, stores, orders
-- Product image embeddings population from product_data.json
-- Product description embeddings population from product_data.json
+- Product image embeddings population from the product_data sidecar store (embedding_store.py)
+- Product description embeddings population from the product_data sidecar store (embedding_store.py)
 - Vector similarity indexing with pgvector
 - Performance-optimized indexes
 - Comprehensive statistics and verification
@@ -25,7 +25,13 @@ USAGE:
     python generate_zava_postgres.py                     # Generate complete database
     python generate_zava_postgres.py --show-stats        # Show database statistics
     python generate_zava_postgres.py --embeddings-only   # Populate embeddings only
+    python generate_zava_postgres.py --sync              # Apply product_data.json changes incrementally
     python generate_zava_postgres.py --verify-embeddings # Verify embeddings table
+    python generate_zava_postgres.py --num-customers 100000 --database zava_bench_100k  # Scaled copy (database must exist)
+    python generate_zava_postgres.py --apply-rls-policies --rls-policies fast  # Switch to the fast RLS policy set
+    python generate_zava_postgres.py --partition-orders year  # Partition orders and order_items by order year
+    python generate_zava_postgres.py --add-order-partitions 2028  # Add order partitions through 2028
+    python generate_zava_postgres.py --refresh-rollups --rollups-since 2026-01-01  # Rebuild sales rollups from a date
     python generate_zava_postgres.py --help              # Show all options
 """
 
@@ -35,13 +41,21 @@ import json
 import logging
 import os
 import random
+import struct
 import sys
 from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
 from typing import Dict, List, Optional, Tuple
 
 import asyncpg
+import numpy as np
+from catalog import walk_products
 from dotenv import load_dotenv
+from embedding_store import DESCRIPTION_EMBEDDINGS, IMAGE_EMBEDDINGS, EmbeddingStore
 from faker import Faker
+from order_partitions import PARTITION_SCHEMES, create_order_tables, ensure_order_partitions
+from rls_policies import POLICY_SETS, SUPER_MANAGER_UUID, apply_rls_policies, current_policy_set
+from sales_rollups import create_rollup_tables, refresh_sales_rollups
 
 # Load environment variables
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -74,8 +88,8 @@ POSTGRES_CONFIG = {
 
 SCHEMA_NAME = 'retail'
 
-# Super Manager UUID - has access to all rows regardless of RLS policies
-SUPER_MANAGER_UUID = '00000000-0000-0000-0000-000000000000'
+# Years that generated orders fall in (weighted by reference_data year_weights)
+ORDER_YEARS = [2020, 2021, 2022, 2023, 2024, 2025, 2026]
 
 # Load reference data from JSON file
 def load_reference_data():
@@ -102,6 +116,10 @@ def load_product_data():
 reference_data = load_reference_data()
 product_data = load_product_data()
 
+# Embedding vectors live in memory-mapped sidecar files next to product_data.json
+image_embedding_store = EmbeddingStore(script_dir, IMAGE_EMBEDDINGS)
+description_embedding_store = EmbeddingStore(script_dir, DESCRIPTION_EMBEDDINGS)
+
 # Get reference data from loaded JSON
 main_categories = product_data['main_categories']
 stores = reference_data['stores']
@@ -137,8 +155,8 @@ async def create_connection():
         logging.error(f"Failed to connect to PostgreSQL: {e}")
         raise
 
-async def create_database_schema(conn):
-    """Create database schema, tables and indexes"""
+async def create_database_schema(conn, rls_policies: str = 'exists', partitioning: str = 'none'):
+    """Create database schema, tables, indexes and RLS policies (see rls_policies.py)"""
     try:
         # Create schema if it doesn't exist
         await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME}")
@@ -222,35 +240,11 @@ async def create_database_schema(conn):
             )
         """)
         
-        # Create orders table (header only)
-        await conn.execute(f"""
-            CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.orders (
-                order_id SERIAL PRIMARY KEY,
-                customer_id INTEGER NOT NULL,
-                store_id INTEGER NOT NULL,
-                order_date DATE NOT NULL,
-                FOREIGN KEY (customer_id) REFERENCES {SCHEMA_NAME}.customers (customer_id),
-                FOREIGN KEY (store_id) REFERENCES {SCHEMA_NAME}.stores (store_id)
-            )
-        """)
+        # Create orders and order_items tables, optionally partitioned by order date
+        await create_order_tables(conn, SCHEMA_NAME, partitioning, ORDER_YEARS[0], ORDER_YEARS[-1] + 1)
         
-        # Create order_items table (line items)
-        await conn.execute(f"""
-            CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.order_items (
-                order_item_id SERIAL PRIMARY KEY,
-                order_id INTEGER NOT NULL,
-                store_id INTEGER NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                unit_price DECIMAL(10,2) NOT NULL,
-                discount_percent INTEGER DEFAULT 0,
-                discount_amount DECIMAL(10,2) DEFAULT 0,
-                total_amount DECIMAL(10,2) NOT NULL,
-                FOREIGN KEY (order_id) REFERENCES {SCHEMA_NAME}.orders (order_id),
-                FOREIGN KEY (store_id) REFERENCES {SCHEMA_NAME}.stores (store_id),
-                FOREIGN KEY (product_id) REFERENCES {SCHEMA_NAME}.products (product_id)
-            )
-        """)
+        # Create pre-aggregated sales rollup tables (filled after the orders are inserted)
+        await create_rollup_tables(conn, SCHEMA_NAME)
         
         # Create product_image_embeddings table for image data
         await conn.execute(f"""
@@ -258,6 +252,7 @@ async def create_database_schema(conn):
                 product_id INTEGER PRIMARY KEY,
                 image_url TEXT NOT NULL,
                 image_embedding vector(512),
+                source_hash TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (product_id) REFERENCES {SCHEMA_NAME}.products (product_id)
             )
@@ -268,6 +263,7 @@ async def create_database_schema(conn):
             CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.product_description_embeddings (
                 product_id INTEGER PRIMARY KEY,
                 description_embedding vector(1536),
+                source_hash TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (product_id) REFERENCES {SCHEMA_NAME}.products (product_id)
             )
@@ -309,6 +305,9 @@ async def create_database_schema(conn):
         await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_order_items_store ON {SCHEMA_NAME}.order_items(store_id)")
         await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_order_items_product ON {SCHEMA_NAME}.order_items(product_id)")
         await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_order_items_total ON {SCHEMA_NAME}.order_items(total_amount)")
+        if partitioning != 'none':
+            # Narrows date ranges within a partition; the partition bounds do the rest
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_order_items_date ON {SCHEMA_NAME}.order_items(order_date)")
         
         # Product image embeddings indexes
         await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_product_image_embeddings_product ON {SCHEMA_NAME}.product_image_embeddings(product_id)")
@@ -341,155 +340,7 @@ async def create_database_schema(conn):
         
         # Enable Row Level Security (RLS) and create policies
         # Note: All RLS policies include access for SUPER_MANAGER_UUID which bypasses all restrictions
-        logging.info("Setting up Row Level Security policies...")
-        logging.info(f"Super Manager UUID (access to all rows): {SUPER_MANAGER_UUID}")
-        
-        # Enable RLS on tables that should be restricted by store manager
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.orders ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.order_items ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.inventory ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.customers ENABLE ROW LEVEL SECURITY")
-        
-        # Enable RLS on reference tables that store managers should have full access to
-        # Note: These tables will have permissive policies allowing all authenticated users
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.stores ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.categories ENABLE ROW LEVEL SECURITY") 
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.product_types ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.products ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.product_image_embeddings ENABLE ROW LEVEL SECURITY")
-        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.product_description_embeddings ENABLE ROW LEVEL SECURITY")
-        
-        # Create RLS policies for orders - store managers can only see orders from their store
-        await conn.execute(f"DROP POLICY IF EXISTS store_manager_orders ON {SCHEMA_NAME}.orders")
-        await conn.execute(f"""
-            CREATE POLICY store_manager_orders ON {SCHEMA_NAME}.orders
-            FOR ALL TO PUBLIC
-            USING (
-                -- Super manager has access to all rows
-                current_setting('app.current_rls_user_id', true) = '{SUPER_MANAGER_UUID}'
-                OR
-                -- Store managers can only see orders from their store
-                EXISTS (
-                    SELECT 1 FROM {SCHEMA_NAME}.stores s 
-                    WHERE s.store_id = {SCHEMA_NAME}.orders.store_id 
-                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
-                )
-            )
-        """)
-        
-        # Create RLS policies for order_items - direct store access for better performance
-        await conn.execute(f"DROP POLICY IF EXISTS store_manager_order_items ON {SCHEMA_NAME}.order_items")
-        await conn.execute(f"""
-            CREATE POLICY store_manager_order_items ON {SCHEMA_NAME}.order_items
-            FOR ALL TO PUBLIC
-            USING (
-                -- Super manager has access to all rows
-                current_setting('app.current_rls_user_id', true) = '{SUPER_MANAGER_UUID}'
-                OR
-                -- Store managers can only see order items from their store
-                EXISTS (
-                    SELECT 1 FROM {SCHEMA_NAME}.stores s 
-                    WHERE s.store_id = {SCHEMA_NAME}.order_items.store_id 
-                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
-                )
-            )
-        """)
-        
-        # Create RLS policies for inventory - store managers can only see their store's inventory
-        await conn.execute(f"DROP POLICY IF EXISTS store_manager_inventory ON {SCHEMA_NAME}.inventory")
-        await conn.execute(f"""
-            CREATE POLICY store_manager_inventory ON {SCHEMA_NAME}.inventory
-            FOR ALL TO PUBLIC
-            USING (
-                -- Super manager has access to all rows
-                current_setting('app.current_rls_user_id', true) = '{SUPER_MANAGER_UUID}'
-                OR
-                -- Store managers can only see their store's inventory
-                EXISTS (
-                    SELECT 1 FROM {SCHEMA_NAME}.stores s 
-                    WHERE s.store_id = {SCHEMA_NAME}.inventory.store_id 
-                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
-                )
-            )
-        """)
-        
-        # For customers, they can only see customers assigned to their store
-        await conn.execute(f"DROP POLICY IF EXISTS store_manager_customers ON {SCHEMA_NAME}.customers")
-        await conn.execute(f"""
-            CREATE POLICY store_manager_customers ON {SCHEMA_NAME}.customers
-            FOR ALL TO PUBLIC
-            USING (
-                -- Super manager has access to all rows
-                current_setting('app.current_rls_user_id', true) = '{SUPER_MANAGER_UUID}'
-                OR
-                -- Store managers can only see customers assigned to their store
-                EXISTS (
-                    SELECT 1 FROM {SCHEMA_NAME}.stores s 
-                    WHERE s.store_id = {SCHEMA_NAME}.customers.primary_store_id 
-                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
-                )
-                OR
-                -- Also allow access to customers who have ordered from their store (backward compatibility)
-                EXISTS (
-                    SELECT 1 FROM {SCHEMA_NAME}.orders o
-                    JOIN {SCHEMA_NAME}.stores s ON o.store_id = s.store_id
-                    WHERE o.customer_id = {SCHEMA_NAME}.customers.customer_id
-                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
-                )
-            )
-        """)
-        
-        # Create permissive RLS policies for reference tables that all authenticated users should access
-        
-        # Stores table - managers can see all stores (needed for reference)
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_stores ON {SCHEMA_NAME}.stores")
-        await conn.execute(f"""
-            CREATE POLICY all_users_stores ON {SCHEMA_NAME}.stores
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        # Categories table - all users can see all categories
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_categories ON {SCHEMA_NAME}.categories")
-        await conn.execute(f"""
-            CREATE POLICY all_users_categories ON {SCHEMA_NAME}.categories
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        # Product types table - all users can see all product types
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_product_types ON {SCHEMA_NAME}.product_types")
-        await conn.execute(f"""
-            CREATE POLICY all_users_product_types ON {SCHEMA_NAME}.product_types
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        # Products table - all users can see all products
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_products ON {SCHEMA_NAME}.products")
-        await conn.execute(f"""
-            CREATE POLICY all_users_products ON {SCHEMA_NAME}.products
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        # Product image embeddings table - all users can see all product image embeddings
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_product_image_embeddings ON {SCHEMA_NAME}.product_image_embeddings")
-        await conn.execute(f"""
-            CREATE POLICY all_users_product_image_embeddings ON {SCHEMA_NAME}.product_image_embeddings
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        # Product description embeddings table - all users can see all product description embeddings
-        await conn.execute(f"DROP POLICY IF EXISTS all_users_product_description_embeddings ON {SCHEMA_NAME}.product_description_embeddings")
-        await conn.execute(f"""
-            CREATE POLICY all_users_product_description_embeddings ON {SCHEMA_NAME}.product_description_embeddings
-            FOR ALL TO PUBLIC
-            USING (true)
-        """)
-        
-        logging.info("Row Level Security policies created successfully!")
+        await apply_rls_policies(conn, SCHEMA_NAME, rls_policies)
         
         # Grant permissions to store_manager role
         await setup_store_manager_permissions(conn)
@@ -685,55 +536,72 @@ async def insert_product_types(conn):
         logging.error(f"Error inserting product types: {e}")
         raise
 
+async def get_category_and_type_mappings(conn) -> Tuple[Dict[str, int], Dict[Tuple[int, str], int]]:
+    """Return category_name -> category_id and (category_id, type_name) -> type_id mappings"""
+    category_mapping = {}
+    rows = await conn.fetch(f"SELECT category_id, category_name FROM {SCHEMA_NAME}.categories")
+    for row in rows:
+        category_mapping[row['category_name']] = row['category_id']
+    
+    type_mapping = {}
+    rows = await conn.fetch(f"SELECT type_id, type_name, category_id FROM {SCHEMA_NAME}.product_types")
+    for row in rows:
+        type_mapping[(row['category_id'], row['type_name'])] = row['type_id']
+    
+    return category_mapping, type_mapping
+
+def build_product_rows(category_mapping: Dict[str, int], type_mapping: Dict[Tuple[int, str], int]) -> List[Tuple]:
+    """
+    Build products table rows from product_data.json.
+    
+    Returns:
+        List of tuples: (sku, product_name, category_id, type_id, cost, base_price, product_description)
+    """
+    products_data = []
+    
+    for main_category, subcategories in main_categories.items():
+        category_id = category_mapping[main_category]
+        
+        for subcategory, product_list in subcategories.items():
+            # Skip the seasonal multipliers key, only process actual product types
+            if subcategory == 'washington_seasonal_multipliers':
+                continue
+                
+            if not product_list:  # Handle empty product lists
+                continue
+            
+            type_id = type_mapping.get((category_id, subcategory))
+            if not type_id:
+                logging.warning(f"Type ID not found for category {main_category}, type {subcategory}")
+                continue
+                
+            for product_details in product_list:
+                product_name = product_details["name"]
+                sku = product_details.get("sku", f"SKU{len(products_data)+1:06d}")  # Fallback if no SKU
+                json_price = product_details["price"]
+                description = product_details["description"]
+                
+                # Treat the JSON price as the cost
+                cost = float(json_price)
+                
+                # Calculate selling price for 33% gross margin
+                # Gross Margin = (Selling Price - Cost) / Selling Price = 0.33
+                # Therefore: Selling Price = Cost / (1 - 0.33) = Cost / 0.67
+                base_price = round(cost / 0.67, 2)
+                
+                products_data.append((sku, product_name, category_id, type_id, cost, base_price, description))
+    
+    return products_data
+
 async def insert_products(conn):
     """Insert product data into the database"""
     try:
         logging.info("Generating products...")
         
         # Get category and type mappings
-        category_mapping = {}
-        rows = await conn.fetch(f"SELECT category_id, category_name FROM {SCHEMA_NAME}.categories")
-        for row in rows:
-            category_mapping[row['category_name']] = row['category_id']
-        
-        type_mapping = {}
-        rows = await conn.fetch(f"SELECT type_id, type_name, category_id FROM {SCHEMA_NAME}.product_types")
-        for row in rows:
-            type_mapping[(row['category_id'], row['type_name'])] = row['type_id']
-        
-        products_data = []
+        category_mapping, type_mapping = await get_category_and_type_mappings(conn)
         
-        for main_category, subcategories in main_categories.items():
-            category_id = category_mapping[main_category]
-            
-            for subcategory, product_list in subcategories.items():
-                # Skip the seasonal multipliers key, only process actual product types
-                if subcategory == 'washington_seasonal_multipliers':
-                    continue
-                    
-                if not product_list:  # Handle empty product lists
-                    continue
-                
-                type_id = type_mapping.get((category_id, subcategory))
-                if not type_id:
-                    logging.warning(f"Type ID not found for category {main_category}, type {subcategory}")
-                    continue
-                    
-                for product_details in product_list:
-                    product_name = product_details["name"]
-                    sku = product_details.get("sku", f"SKU{len(products_data)+1:06d}")  # Fallback if no SKU
-                    json_price = product_details["price"]
-                    description = product_details["description"]
-                    
-                    # Treat the JSON price as the cost
-                    cost = float(json_price)
-                    
-                    # Calculate selling price for 33% gross margin
-                    # Gross Margin = (Selling Price - Cost) / Selling Price = 0.33
-                    # Therefore: Selling Price = Cost / (1 - 0.33) = Cost / 0.67
-                    base_price = round(cost / 0.67, 2)
-                    
-                    products_data.append((sku, product_name, category_id, type_id, cost, base_price, description))
+        products_data = build_product_rows(category_mapping, type_mapping)
         
         await batch_insert(conn, f"INSERT INTO {SCHEMA_NAME}.products (sku, product_name, category_id, type_id, cost, base_price, product_description) VALUES ($1, $2, $3, $4, $5, $6, $7)", products_data)
         
@@ -743,6 +611,7 @@ async def insert_products(conn):
         logging.error(f"Error inserting products: {e}")
         raise
 
+
 def get_store_multipliers(store_name):
     """Get order frequency multipliers based on store name"""
     store_data = stores.get(store_name, {
@@ -758,9 +627,8 @@ def get_yearly_weight(year):
 
 def weighted_year_choice():
     """Choose a year based on growth pattern weights"""
-    years = [2020, 2021, 2022, 2023, 2024, 2025, 2026]
-    weights = [get_yearly_weight(year) for year in years]
-    return random.choices(years, weights=weights, k=1)[0]
+    weights = [get_yearly_weight(year) for year in ORDER_YEARS]
+    return random.choices(ORDER_YEARS, weights=weights, k=1)[0]
 
 async def get_store_id_by_name(conn, store_name):
     """Get store_id for a given store name"""
@@ -798,73 +666,124 @@ def choose_product_type(main_category):
         return None
     return random.choice(product_types)
 
-def extract_products_with_embeddings(product_data: Dict) -> List[Tuple[str, str, List[float]]]:
+def extract_products_with_embeddings(product_data: Dict, store: Optional[EmbeddingStore] = None) -> List[Tuple[str, str, np.ndarray]]:
     """
-    Extract products with image embeddings from the JSON structure.
+    Extract products with image embeddings, reading vectors from the sidecar store.
+    
+    Products whose vector is still inline in the JSON (not yet migrated with
+    format_embeddings.py) fall back to the image_embedding field.
     
     Returns:
         List of tuples: (sku, image_path, image_embedding)
     """
+    store = store or image_embedding_store
     products_with_embeddings = []
     
-    for category_name, category_data in product_data.get('main_categories', {}).items():
-        for product_type, products in category_data.items():
-            # Skip non-product keys like seasonal multipliers
-            if not isinstance(products, list):
-                continue
-                
-            for product in products:
-                if isinstance(product, dict):
-                    sku = product.get('sku')
-                    image_path = product.get('image_path')
-                    image_embedding = product.get('image_embedding')
-                    
-                    if sku and image_path and image_embedding:
-                        products_with_embeddings.append((sku, image_path, image_embedding))
-                    else:
-                        logging.debug(f"Skipping product with missing data: SKU={sku}")
+    for entry in walk_products(product_data):
+        product = entry.product
+        sku = product.get('sku')
+        image_path = product.get('image_path')
+        image_embedding = store.get(sku) if sku else None
+        if image_embedding is None and product.get('image_embedding'):
+            image_embedding = np.asarray(product['image_embedding'], dtype=np.float32)
+        
+        if sku and image_path and image_embedding is not None:
+            products_with_embeddings.append((sku, image_path, image_embedding))
+        else:
+            logging.debug(f"Skipping product with missing data: SKU={sku}")
     
     logging.info(f"Found {len(products_with_embeddings)} products with embeddings")
     return products_with_embeddings
 
-async def get_product_id_by_sku(conn: asyncpg.Connection, sku: str) -> Optional[int]:
-    """Get product_id for a given SKU"""
-    try:
-        result = await conn.fetchval(
-            f"SELECT product_id FROM {SCHEMA_NAME}.products WHERE sku = $1",
-            sku
+def _encode_vector(vector) -> bytes:
+    """Encode a float array in pgvector's binary wire format (dim, unused, float4[dim])"""
+    values = np.asarray(vector, dtype='>f4')
+    return struct.pack('>HH', values.shape[0], 0) + values.tobytes()
+
+def _decode_vector(data: bytes) -> np.ndarray:
+    """Decode pgvector's binary wire format into a float32 array"""
+    dim, _unused = struct.unpack_from('>HH', data)
+    return np.frombuffer(data, dtype='>f4', count=dim, offset=4).astype(np.float32)
+
+async def register_vector_codec(conn: asyncpg.Connection) -> None:
+    """Send and receive pgvector values as binary float32 instead of text"""
+    await conn.set_type_codec(
+        'vector', schema='public',
+        encoder=_encode_vector, decoder=_decode_vector, format='binary'
+    )
+
+async def ensure_source_hash_columns(conn: asyncpg.Connection) -> None:
+    """Add the source_hash columns to embedding tables created before they existed"""
+    for table in ('product_image_embeddings', 'product_description_embeddings'):
+        await conn.execute(f"ALTER TABLE {SCHEMA_NAME}.{table} ADD COLUMN IF NOT EXISTS source_hash TEXT")
+
+async def get_embedding_hashes(conn: asyncpg.Connection, table: str) -> Dict[int, Optional[str]]:
+    """Map product_id to the source_hash of its stored embedding"""
+    rows = await conn.fetch(f"SELECT product_id, source_hash FROM {SCHEMA_NAME}.{table}")
+    return {row['product_id']: row['source_hash'] for row in rows}
+
+async def get_product_id_map(conn: asyncpg.Connection) -> Dict[str, int]:
+    """Map every SKU to its product_id with a single query"""
+    rows = await conn.fetch(f"SELECT sku, product_id FROM {SCHEMA_NAME}.products")
+    return {row['sku']: row['product_id'] for row in rows}
+
+async def bulk_upsert_embeddings(
+    conn: asyncpg.Connection,
+    table: str,
+    columns: List[str],
+    records: List[Tuple],
+    batch_size: int = 1000,
+    keep_product_ids: Optional[List[int]] = None
+) -> Tuple[int, int, int, int]:
+    """
+    Load embedding rows with binary COPY into a staging table, then upsert them.
+    
+    Rows whose vector is unchanged are left alone, so re-running a load only
+    rewrites what actually changed. When keep_product_ids is given (every product
+    with a vector in the store, changed or not), rows of other products are
+    deleted, so vectors removed from the store do not linger in the table. Must
+    be called inside a transaction.
+    
+    Returns:
+        Tuple of (inserted, updated, unchanged, deleted) counts
+    """
+    deleted = 0
+    if keep_product_ids is not None:
+        result = await conn.execute(
+            f"DELETE FROM {SCHEMA_NAME}.{table} WHERE product_id <> ALL($1::int[])", keep_product_ids
         )
-        return result
-    except Exception as e:
-        logging.error(f"Error getting product_id for SKU {sku}: {e}")
-        return None
-
-async def insert_product_embedding(
-    conn: asyncpg.Connection, 
-    product_id: int, 
-    image_path: str, 
-    image_embedding: List[float]
-) -> bool:
-    """Insert a product embedding record"""
-    try:
-        # Store just the image filename without any path prefix
-        image_url = os.path.basename(image_path)
-        
-        # Convert the embedding list to a vector string format
-        embedding_str = f"[{','.join([str(x) for x in image_embedding])}]"
-        
-        await conn.execute(
-            f"""
-            INSERT INTO {SCHEMA_NAME}.product_image_embeddings 
-            (product_id, image_url, image_embedding) 
-            VALUES ($1, $2, $3::vector)
-            """,
-            product_id, image_url, embedding_str
-        )
-        return True
-    except Exception as e:
-        logging.error(f"Error inserting embedding for product_id {product_id}: {e}")
-        return False
+        deleted = int(result.split()[-1])
+    
+    if not records:
+        return 0, 0, 0, deleted
+    
+    staging = f"{table}_staging"
+    await conn.execute(
+        f"CREATE TEMP TABLE {staging} (LIKE {SCHEMA_NAME}.{table} INCLUDING DEFAULTS) ON COMMIT DROP"
+    )
+    
+    total_batches = (len(records) + batch_size - 1) // batch_size
+    for i in range(0, len(records), batch_size):
+        logging.info(f"Copying {table} batch {i//batch_size + 1}/{total_batches}")
+        await conn.copy_records_to_table(staging, records=records[i:i + batch_size], columns=columns)
+    
+    column_list = ', '.join(columns)
+    value_columns = [c for c in columns if c != 'product_id']
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in value_columns)
+    changed = ' OR '.join(f"t.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in value_columns)
+    rows = await conn.fetch(
+        f"""
+        INSERT INTO {SCHEMA_NAME}.{table} AS t ({column_list})
+        SELECT {column_list} FROM {staging}
+        ON CONFLICT (product_id) DO UPDATE
+            SET {updates}, created_at = CURRENT_TIMESTAMP
+            WHERE {changed}
+        RETURNING (xmax = 0) AS inserted
+        """
+    )
+    inserted = sum(1 for row in rows if row['inserted'])
+    updated = len(rows) - inserted
+    return inserted, updated, len(records) - len(rows), deleted
 
 async def clear_existing_embeddings(conn: asyncpg.Connection) -> None:
     """Clear all existing product image embeddings"""
@@ -875,8 +794,8 @@ async def clear_existing_embeddings(conn: asyncpg.Connection) -> None:
         logging.error(f"Error clearing existing embeddings: {e}")
         raise
 
-async def populate_product_image_embeddings(conn: asyncpg.Connection, clear_existing: bool = False, batch_size: int = 100) -> None:
-    """Populate product image embeddings from product_data.json"""
+async def populate_product_image_embeddings(conn: asyncpg.Connection, clear_existing: bool = False, batch_size: int = 1000) -> None:
+    """Populate product image embeddings from the sidecar store"""
     
     logging.info("Loading product data for embeddings...")
     products_with_embeddings = extract_products_with_embeddings(product_data)
@@ -886,41 +805,51 @@ async def populate_product_image_embeddings(conn: asyncpg.Connection, clear_exis
         return
     
     try:
-        # Clear existing embeddings if requested
-        if clear_existing:
-            logging.info("Clearing existing product embeddings...")
-            await clear_existing_embeddings(conn)
+        await register_vector_codec(conn)
+        product_ids = await get_product_id_map(conn)
+        
+        existing_hashes = {} if clear_existing else await get_embedding_hashes(conn, 'product_image_embeddings')
         
-        # Process products in batches
-        inserted_count = 0
+        # Store just the image filename without any path prefix
+        records = []
+        loaded_ids = []
         skipped_count = 0
-        error_count = 0
+        unchanged_count = 0
+        for sku, image_path, image_embedding in products_with_embeddings:
+            product_id = product_ids.get(sku)
+            if product_id is None:
+                logging.debug(f"Product not found for SKU: {sku}")
+                skipped_count += 1
+                continue
+            loaded_ids.append(product_id)
+            # Vectors computed from the same image as the stored row need not be sent
+            source_hash = image_embedding_store.get_hash(sku)
+            if source_hash is not None and existing_hashes.get(product_id) == source_hash:
+                unchanged_count += 1
+                continue
+            records.append((product_id, os.path.basename(image_path), image_embedding, source_hash))
         
-        for i in range(0, len(products_with_embeddings), batch_size):
-            batch = products_with_embeddings[i:i + batch_size]
-            
-            logging.info(f"Processing embeddings batch {i//batch_size + 1}/{(len(products_with_embeddings) + batch_size - 1)//batch_size}")
+        async with conn.transaction():
+            # Clear existing embeddings if requested
+            if clear_existing:
+                logging.info("Clearing existing product embeddings...")
+                await clear_existing_embeddings(conn)
             
-            for sku, image_path, image_embedding in batch:
-                # Get product_id for this SKU
-                product_id = await get_product_id_by_sku(conn, sku)
-                
-                if product_id is None:
-                    logging.debug(f"Product not found for SKU: {sku}")
-                    skipped_count += 1
-                    continue
-                
-                # Insert the embedding
-                if await insert_product_embedding(conn, product_id, image_path, image_embedding):
-                    inserted_count += 1
-                else:
-                    error_count += 1
+            # Rows of products whose vectors are no longer in the store are deleted
+            inserted_count, updated_count, unchanged_rows, deleted_count = await bulk_upsert_embeddings(
+                conn, 'product_image_embeddings',
+                ['product_id', 'image_url', 'image_embedding', 'source_hash'],
+                records, batch_size, keep_product_ids=loaded_ids
+            )
+            unchanged_count += unchanged_rows
         
         # Summary
         logging.info("Product embeddings population complete!")
         logging.info(f"  Inserted: {inserted_count}")
+        logging.info(f"  Updated: {updated_count}")
+        logging.info(f"  Unchanged: {unchanged_count}")
+        logging.info(f"  Deleted (no longer in the store): {deleted_count}")
         logging.info(f"  Skipped (product not found): {skipped_count}")
-        logging.info(f"  Errors: {error_count}")
         logging.info(f"  Total processed: {len(products_with_embeddings)}")
         
     except Exception as e:
@@ -972,57 +901,34 @@ async def verify_embeddings_table(conn: asyncpg.Connection) -> None:
     except Exception as e:
         logging.error(f"Error verifying embeddings table: {e}")
 
-def extract_products_with_description_embeddings(product_data: Dict) -> List[Tuple[str, List[float]]]:
+def extract_products_with_description_embeddings(product_data: Dict, store: Optional[EmbeddingStore] = None) -> List[Tuple[str, np.ndarray]]:
     """
-    Extract products with description embeddings from the JSON structure.
+    Extract products with description embeddings, reading vectors from the sidecar store.
+    
+    Products whose vector is still inline in the JSON (not yet migrated with
+    format_embeddings.py) fall back to the description_embedding field.
     
     Returns:
         List of tuples: (sku, description_embedding)
     """
+    store = store or description_embedding_store
     products_with_description_embeddings = []
     
-    for _category_name, category_data in product_data.get('main_categories', {}).items():
-        for _product_type, products in category_data.items():
-            # Skip non-product keys like seasonal multipliers
-            if not isinstance(products, list):
-                continue
-                
-            for product in products:
-                if isinstance(product, dict):
-                    sku = product.get('sku')
-                    description_embedding = product.get('description_embedding')
-                    
-                    if sku and description_embedding:
-                        products_with_description_embeddings.append((sku, description_embedding))
-                    else:
-                        logging.debug(f"Skipping product with missing description embedding: SKU={sku}")
+    for entry in walk_products(product_data):
+        product = entry.product
+        sku = product.get('sku')
+        description_embedding = store.get(sku) if sku else None
+        if description_embedding is None and product.get('description_embedding'):
+            description_embedding = np.asarray(product['description_embedding'], dtype=np.float32)
+        
+        if sku and description_embedding is not None:
+            products_with_description_embeddings.append((sku, description_embedding))
+        else:
+            logging.debug(f"Skipping product with missing description embedding: SKU={sku}")
     
     logging.info(f"Found {len(products_with_description_embeddings)} products with description embeddings")
     return products_with_description_embeddings
 
-async def insert_product_description_embedding(
-    conn: asyncpg.Connection, 
-    product_id: int, 
-    description_embedding: List[float]
-) -> bool:
-    """Insert a product description embedding record"""
-    try:
-        # Convert the embedding list to a vector string format
-        embedding_str = f"[{','.join([str(x) for x in description_embedding])}]"
-        
-        await conn.execute(
-            f"""
-            INSERT INTO {SCHEMA_NAME}.product_description_embeddings 
-            (product_id, description_embedding) 
-            VALUES ($1, $2::vector)
-            """,
-            product_id, embedding_str
-        )
-        return True
-    except Exception as e:
-        logging.error(f"Error inserting description embedding for product_id {product_id}: {e}")
-        return False
-
 async def clear_existing_description_embeddings(conn: asyncpg.Connection) -> None:
     """Clear all existing product description embeddings"""
     try:
@@ -1032,8 +938,8 @@ async def clear_existing_description_embeddings(conn: asyncpg.Connection) -> Non
         logging.error(f"Error clearing existing description embeddings: {e}")
         raise
 
-async def populate_product_description_embeddings(conn: asyncpg.Connection, clear_existing: bool = False, batch_size: int = 100) -> None:
-    """Populate product description embeddings from product_data.json"""
+async def populate_product_description_embeddings(conn: asyncpg.Connection, clear_existing: bool = False, batch_size: int = 1000) -> None:
+    """Populate product description embeddings from the sidecar store"""
     
     logging.info("Loading product data for description embeddings...")
     products_with_description_embeddings = extract_products_with_description_embeddings(product_data)
@@ -1043,41 +949,50 @@ async def populate_product_description_embeddings(conn: asyncpg.Connection, clea
         return
     
     try:
-        # Clear existing description embeddings if requested
-        if clear_existing:
-            logging.info("Clearing existing product description embeddings...")
-            await clear_existing_description_embeddings(conn)
+        await register_vector_codec(conn)
+        product_ids = await get_product_id_map(conn)
         
-        # Process products in batches
-        inserted_count = 0
+        existing_hashes = {} if clear_existing else await get_embedding_hashes(conn, 'product_description_embeddings')
+        
+        records = []
+        loaded_ids = []
         skipped_count = 0
-        error_count = 0
+        unchanged_count = 0
+        for sku, description_embedding in products_with_description_embeddings:
+            product_id = product_ids.get(sku)
+            if product_id is None:
+                logging.debug(f"Product not found for SKU: {sku}")
+                skipped_count += 1
+                continue
+            loaded_ids.append(product_id)
+            # Vectors computed from the same text as the stored row need not be sent
+            source_hash = description_embedding_store.get_hash(sku)
+            if source_hash is not None and existing_hashes.get(product_id) == source_hash:
+                unchanged_count += 1
+                continue
+            records.append((product_id, description_embedding, source_hash))
         
-        for i in range(0, len(products_with_description_embeddings), batch_size):
-            batch = products_with_description_embeddings[i:i + batch_size]
+        async with conn.transaction():
+            # Clear existing description embeddings if requested
+            if clear_existing:
+                logging.info("Clearing existing product description embeddings...")
+                await clear_existing_description_embeddings(conn)
             
-            logging.info(f"Processing description embeddings batch {i//batch_size + 1}/{(len(products_with_description_embeddings) + batch_size - 1)//batch_size}")
-            
-            for sku, description_embedding in batch:
-                # Get product_id for this SKU
-                product_id = await get_product_id_by_sku(conn, sku)
-                
-                if product_id is None:
-                    logging.debug(f"Product not found for SKU: {sku}")
-                    skipped_count += 1
-                    continue
-                
-                # Insert the description embedding
-                if await insert_product_description_embedding(conn, product_id, description_embedding):
-                    inserted_count += 1
-                else:
-                    error_count += 1
+            # Rows of products whose vectors are no longer in the store are deleted
+            inserted_count, updated_count, unchanged_rows, deleted_count = await bulk_upsert_embeddings(
+                conn, 'product_description_embeddings',
+                ['product_id', 'description_embedding', 'source_hash'],
+                records, batch_size, keep_product_ids=loaded_ids
+            )
+            unchanged_count += unchanged_rows
         
         # Summary
         logging.info("Product description embeddings population complete!")
         logging.info(f"  Inserted: {inserted_count}")
+        logging.info(f"  Updated: {updated_count}")
+        logging.info(f"  Unchanged: {unchanged_count}")
+        logging.info(f"  Deleted (no longer in the store): {deleted_count}")
         logging.info(f"  Skipped (product not found): {skipped_count}")
-        logging.info(f"  Errors: {error_count}")
         logging.info(f"  Total processed: {len(products_with_description_embeddings)}")
         
     except Exception as e:
@@ -1129,8 +1044,13 @@ async def verify_description_embeddings_table(conn: asyncpg.Connection) -> None:
     except Exception as e:
         logging.error(f"Error verifying description embeddings table: {e}")
 
-async def insert_inventory(conn):
-    """Insert inventory data distributed across stores based on customer distribution weights and seasonal trends"""
+async def insert_inventory(conn, product_ids: Optional[List[int]] = None):
+    """
+    Insert inventory data distributed across stores based on customer distribution weights and seasonal trends
+    
+    Args:
+        product_ids: Only stock these products (e.g. ones added by --sync); all products when None
+    """
     try:
         logging.info("Generating inventory with seasonal considerations...")
         
@@ -1140,7 +1060,8 @@ async def insert_inventory(conn):
             SELECT p.product_id, c.category_name 
             FROM {SCHEMA_NAME}.products p
             JOIN {SCHEMA_NAME}.categories c ON p.category_id = c.category_id
-        """)
+            WHERE $1::int[] IS NULL OR p.product_id = ANY($1::int[])
+        """, product_ids)
         
         # Build category to seasonal multiplier mapping (using average across year for base inventory)
         category_seasonal_avg = {}
@@ -1204,9 +1125,17 @@ async def build_product_lookup(conn):
     logging.info(f"Built product lookup with {len(product_lookup)} products")
     return product_lookup
 
-async def insert_orders(conn, num_customers: int = 100000, product_lookup: Optional[Dict] = None):
+async def insert_orders(conn, num_customers: int = 100000, product_lookup: Optional[Dict] = None,
+                        partitioning: str = 'none'):
     """Insert order data into the database with separate orders and order_items tables"""
     
+    # Partitioned order_items carry their order's date (see order_partitions.py)
+    item_columns = "order_id, store_id, product_id, quantity, unit_price, discount_percent, discount_amount, total_amount"
+    item_values = "$1, $2, $3, $4, $5, $6, $7, $8"
+    if partitioning != 'none':
+        item_columns += ", order_date"
+        item_values += ", $9"
+    
     # Build product lookup if not provided
     if product_lookup is None:
         product_lookup = await build_product_lookup(conn)
@@ -1315,10 +1244,11 @@ async def insert_orders(conn, num_customers: int = 100000, product_lookup: Optio
                 
                 total_amount = (unit_price * quantity) - discount_amount
                 
-                order_items_data.append((
+                item = (
                     order_id, store_id, product_id, quantity, unit_price, 
                     discount_percent, discount_amount, total_amount
-                ))
+                )
+                order_items_data.append(item if partitioning == 'none' else item + (order_date,))
         
         # Batch insert every 1000 customers to manage memory
         if customer_id % 1000 == 0:
@@ -1332,8 +1262,8 @@ async def insert_orders(conn, num_customers: int = 100000, product_lookup: Optio
             if order_items_data:
                 await batch_insert(conn, f"""
                     INSERT INTO {SCHEMA_NAME}.order_items 
-                    (order_id, store_id, product_id, quantity, unit_price, discount_percent, discount_amount, total_amount) 
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                    ({item_columns}) 
+                    VALUES ({item_values})
                 """, order_items_data)
                 order_items_data = []
             
@@ -1350,8 +1280,8 @@ async def insert_orders(conn, num_customers: int = 100000, product_lookup: Optio
     if order_items_data:
         await batch_insert(conn, f"""
             INSERT INTO {SCHEMA_NAME}.order_items 
-            (order_id, store_id, product_id, quantity, unit_price, discount_percent, discount_amount, total_amount) 
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            ({item_columns}) 
+            VALUES ({item_values})
         """, order_items_data)
     
     logging.info(f"Successfully inserted {total_orders:,} orders!")
@@ -1690,7 +1620,8 @@ async def verify_seasonal_patterns(conn):
         logging.error(f"Error verifying seasonal patterns: {e}")
         raise
 
-async def generate_postgresql_database(num_customers: int = 50000):
+async def generate_postgresql_database(num_customers: int = 50000, rls_policies: str = 'exists',
+                                       partitioning: str = 'none'):
     """Generate complete PostgreSQL database"""
     try:
         # Create connection
@@ -1701,7 +1632,7 @@ async def generate_postgresql_database(num_customers: int = 50000):
             logging.info("Dropping existing tables if they exist...")
             await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA_NAME} CASCADE")
             
-            await create_database_schema(conn)
+            await create_database_schema(conn, rls_policies, partitioning)
             await insert_stores(conn)
             await insert_categories(conn)
             await insert_product_types(conn)
@@ -1712,8 +1643,8 @@ async def generate_postgresql_database(num_customers: int = 50000):
             logging.info("\n" + "=" * 50)
             logging.info("POPULATING PRODUCT EMBEDDINGS")
             logging.info("=" * 50)
-            await populate_product_image_embeddings(conn, clear_existing=True)
-            await populate_product_description_embeddings(conn, clear_existing=True)
+            await populate_product_image_embeddings(conn)
+            await populate_product_description_embeddings(conn)
             
             # Verify embeddings were populated
             logging.info("\n" + "=" * 50)
@@ -1732,7 +1663,13 @@ async def generate_postgresql_database(num_customers: int = 50000):
             logging.info("\n" + "=" * 50)
             logging.info("INSERTING ORDER DATA")
             logging.info("=" * 50)
-            await insert_orders(conn, num_customers)
+            await insert_orders(conn, num_customers, partitioning=partitioning)
+            
+            # Build the sales rollups from the orders
+            logging.info("\n" + "=" * 50)
+            logging.info("BUILDING SALES ROLLUPS")
+            logging.info("=" * 50)
+            await refresh_sales_rollups(conn, SCHEMA_NAME)
             
             # Verify the database was created and has data
             logging.info("\n" + "=" * 50)
@@ -1759,6 +1696,157 @@ async def generate_postgresql_database(num_customers: int = 50000):
         logging.error(f"Failed to generate database: {e}")
         raise
 
+def _money(value) -> Decimal:
+    """A price as a DECIMAL(10,2) column stores it, so catalog and database values compare exactly"""
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+async def sync_catalog(conn, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Bring an existing database in line with product_data.json without rebuilding it.
+    
+    Products are matched by SKU and compared field by field; new products are
+    inserted and stocked, changed products are updated, and products no longer in
+    the catalog are deleted unless orders reference them, in which case they are
+    kept and reported. The sales rollups are rebuilt from the first order of any
+    product whose cost, category or type changed, as they price units at the
+    current cost. Embeddings are then upserted by content hash, so only
+    vectors that actually changed are sent. Everything, including adding missing
+    source_hash columns, runs in one transaction, so a failed sync changes nothing.
+    
+    Returns:
+        Dictionary of change counts
+    """
+    changes = {
+        'categories_added': 0, 'product_types_added': 0,
+        'products_added': 0, 'products_updated': 0, 'products_unchanged': 0,
+        'products_deleted': 0, 'products_kept_with_orders': 0,
+        'inventory_rows_added': 0, 'rollup_rows_refreshed': 0,
+    }
+    
+    async with conn.transaction():
+        await ensure_source_hash_columns(conn)
+        
+        # Categories and product types first, so every product row can be resolved
+        category_mapping, type_mapping = await get_category_and_type_mappings(conn)
+        new_categories = [(name,) for name in main_categories if name not in category_mapping]
+        if new_categories:
+            await batch_insert(conn, f"INSERT INTO {SCHEMA_NAME}.categories (category_name) VALUES ($1)", new_categories)
+            changes['categories_added'] = len(new_categories)
+            category_mapping, type_mapping = await get_category_and_type_mappings(conn)
+        
+        new_types = [
+            (category_mapping[category_name], type_name)
+            for category_name, subcategories in main_categories.items()
+            for type_name in subcategories
+            if type_name != 'washington_seasonal_multipliers'
+            and (category_mapping[category_name], type_name) not in type_mapping
+        ]
+        if new_types:
+            await batch_insert(conn, f"INSERT INTO {SCHEMA_NAME}.product_types (category_id, type_name) VALUES ($1, $2)", new_types)
+            changes['product_types_added'] = len(new_types)
+            category_mapping, type_mapping = await get_category_and_type_mappings(conn)
+        
+        # Diff products by SKU
+        catalog_rows = {row[0]: row for row in build_product_rows(category_mapping, type_mapping)}
+        db_rows = {
+            row['sku']: row for row in await conn.fetch(f"""
+                SELECT product_id, sku, product_name, category_id, type_id, cost, base_price, product_description
+                FROM {SCHEMA_NAME}.products
+            """)
+        }
+        
+        to_insert = []
+        to_update = []
+        rollup_product_ids = []
+        for sku, (_, product_name, category_id, type_id, cost, base_price, description) in catalog_rows.items():
+            existing = db_rows.get(sku)
+            if existing is None:
+                to_insert.append(catalog_rows[sku])
+            elif (existing['product_name'], existing['category_id'], existing['type_id'],
+                  _money(existing['cost']), _money(existing['base_price']), existing['product_description']) != \
+                    (product_name, category_id, type_id, _money(cost), _money(base_price), description):
+                to_update.append((existing['product_id'], product_name, category_id, type_id, cost, base_price, description))
+                if (existing['category_id'], existing['type_id'], _money(existing['cost'])) != \
+                        (category_id, type_id, _money(cost)):
+                    rollup_product_ids.append(existing['product_id'])
+            else:
+                changes['products_unchanged'] += 1
+        
+        removed_ids = [row['product_id'] for sku, row in db_rows.items() if sku not in catalog_rows]
+        
+        if to_update:
+            await batch_insert(conn, f"""
+                UPDATE {SCHEMA_NAME}.products
+                SET product_name = $2, category_id = $3, type_id = $4, cost = $5, base_price = $6, product_description = $7
+                WHERE product_id = $1
+            """, to_update, batch_size)
+            changes['products_updated'] = len(to_update)
+        
+        # Rollup cost and grouping come from the products table, so totals including the changed
+        # products are rebuilt (databases that predate the rollups have none to rebuild)
+        if rollup_product_ids and await conn.fetchval(f"SELECT to_regclass('{SCHEMA_NAME}.sales_daily') IS NOT NULL"):
+            rollups_since = await conn.fetchval(f"""
+                SELECT MIN(o.order_date)
+                FROM {SCHEMA_NAME}.order_items oi
+                JOIN {SCHEMA_NAME}.orders o ON o.order_id = oi.order_id
+                WHERE oi.product_id = ANY($1::int[])
+            """, rollup_product_ids)
+            if rollups_since is not None:
+                rollup_counts = await refresh_sales_rollups(conn, SCHEMA_NAME, since=rollups_since)
+                changes['rollup_rows_refreshed'] = sum(rollup_counts.values())
+        
+        if removed_ids:
+            # Products that have been sold stay so order history remains intact
+            ordered_ids = {
+                row['product_id'] for row in await conn.fetch(
+                    f"SELECT DISTINCT product_id FROM {SCHEMA_NAME}.order_items WHERE product_id = ANY($1::int[])",
+                    removed_ids
+                )
+            }
+            deletable_ids = [product_id for product_id in removed_ids if product_id not in ordered_ids]
+            for sku, row in db_rows.items():
+                if row['product_id'] in ordered_ids:
+                    logging.warning(f"Keeping {sku}: no longer in product_data.json but referenced by orders")
+            if deletable_ids:
+                for table in ('product_image_embeddings', 'product_description_embeddings', 'inventory', 'products'):
+                    await conn.execute(
+                        f"DELETE FROM {SCHEMA_NAME}.{table} WHERE product_id = ANY($1::int[])", deletable_ids
+                    )
+            changes['products_deleted'] = len(deletable_ids)
+            changes['products_kept_with_orders'] = len(ordered_ids)
+        
+        if to_insert:
+            await batch_insert(conn, f"INSERT INTO {SCHEMA_NAME}.products (sku, product_name, category_id, type_id, cost, base_price, product_description) VALUES ($1, $2, $3, $4, $5, $6, $7)", to_insert, batch_size)
+            changes['products_added'] = len(to_insert)
+            new_ids = [
+                row['product_id'] for row in await conn.fetch(
+                    f"SELECT product_id FROM {SCHEMA_NAME}.products WHERE sku = ANY($1::text[])",
+                    [row[0] for row in to_insert]
+                )
+            ]
+            inventory_before = await conn.fetchval(f"SELECT COUNT(*) FROM {SCHEMA_NAME}.inventory")
+            await insert_inventory(conn, product_ids=new_ids)
+            changes['inventory_rows_added'] = await conn.fetchval(f"SELECT COUNT(*) FROM {SCHEMA_NAME}.inventory") - inventory_before
+        
+        # Embeddings upsert by content hash, so unchanged vectors are skipped
+        await populate_product_image_embeddings(conn, batch_size=batch_size)
+        await populate_product_description_embeddings(conn, batch_size=batch_size)
+    
+    logging.info("\n" + "=" * 50)
+    logging.info("CATALOG SYNC COMPLETE")
+    logging.info("=" * 50)
+    logging.info(f"  Categories added: {changes['categories_added']}")
+    logging.info(f"  Product types added: {changes['product_types_added']}")
+    logging.info(f"  Products added: {changes['products_added']}")
+    logging.info(f"  Products updated: {changes['products_updated']}")
+    logging.info(f"  Products unchanged: {changes['products_unchanged']}")
+    logging.info(f"  Products deleted: {changes['products_deleted']}")
+    if changes['products_kept_with_orders']:
+        logging.info(f"  Products kept (removed from catalog but referenced by orders): {changes['products_kept_with_orders']}")
+    logging.info(f"  Inventory rows added: {changes['inventory_rows_added']}")
+    logging.info(f"  Sales rollup rows refreshed: {changes['rollup_rows_refreshed']}")
+    return changes
+
 async def show_database_stats():
     """Show database statistics"""
     
@@ -1822,18 +1910,35 @@ async def main():
                        help='Show database statistics instead of generating')
     parser.add_argument('--embeddings-only', action='store_true',
                        help='Only populate product embeddings (database must already exist)')
+    parser.add_argument('--sync', action='store_true',
+                       help='Incrementally sync products, inventory and embeddings with product_data.json instead of rebuilding')
     parser.add_argument('--verify-embeddings', action='store_true',
                        help='Only verify embeddings table and show sample data')
     parser.add_argument('--verify-seasonal', action='store_true',
                        help='Only verify seasonal patterns in existing database')
     parser.add_argument('--clear-embeddings', action='store_true',
-                       help='Clear existing embeddings before populating (used with --embeddings-only)')
-    parser.add_argument('--batch-size', type=int, default=100,
-                       help='Batch size for processing embeddings (default: 100)')
+                       help='Clear existing embeddings before populating instead of upserting (used with --embeddings-only)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                       help='Rows per COPY batch when loading embeddings (default: 1000)')
     parser.add_argument('--num-customers', type=int, default=50000,
                        help='Number of customers to generate (default: 50000)')
+    parser.add_argument('--rls-policies', choices=POLICY_SETS, default='exists',
+                       help='Row level security policy set: per-row EXISTS lookups, or fast store-id lookups resolved once per statement (default: exists)')
+    parser.add_argument('--apply-rls-policies', action='store_true',
+                       help='Only (re)create the --rls-policies policy set on an existing database')
+    parser.add_argument('--partition-orders', choices=PARTITION_SCHEMES, default='none',
+                       help='Range partition orders and order_items on order_date by year or month (default: none)')
+    parser.add_argument('--add-order-partitions', type=int, metavar='YEAR',
+                       help='Only add order partitions up to the end of YEAR on an existing partitioned database')
+    parser.add_argument('--refresh-rollups', action='store_true',
+                       help='Only rebuild the sales rollup tables (creating them on databases that predate them)')
+    parser.add_argument('--rollups-since', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                       help='With --refresh-rollups, only rebuild totals from this date on')
+    parser.add_argument('--database', default=POSTGRES_CONFIG['database'],
+                       help=f"Database to generate into, e.g. for datasets at several scales (default: {POSTGRES_CONFIG['database']})")
     
     args = parser.parse_args()
+    POSTGRES_CONFIG['database'] = args.database
     
     try:
         if args.show_stats:
@@ -1854,10 +1959,43 @@ async def main():
                 await verify_seasonal_patterns(conn)
             finally:
                 await conn.close()
+        elif args.apply_rls_policies:
+            # Switch the policy set of an existing database
+            conn = await create_connection()
+            try:
+                await apply_rls_policies(conn, SCHEMA_NAME, args.rls_policies)
+            finally:
+                await conn.close()
+        elif args.add_order_partitions:
+            # Extend the order history of a partitioned database
+            conn = await create_connection()
+            try:
+                await ensure_order_partitions(conn, SCHEMA_NAME, args.add_order_partitions)
+            finally:
+                await conn.close()
+        elif args.refresh_rollups:
+            # Bring the sales rollups up to date with the orders
+            conn = await create_connection()
+            try:
+                await create_rollup_tables(conn, SCHEMA_NAME)
+                await refresh_sales_rollups(conn, SCHEMA_NAME, since=args.rollups_since)
+                # New rollup tables need their policies and grants
+                await apply_rls_policies(conn, SCHEMA_NAME, await current_policy_set(conn, SCHEMA_NAME))
+                await setup_store_manager_permissions(conn)
+            finally:
+                await conn.close()
+        elif args.sync:
+            # Apply catalog changes to the existing database
+            conn = await create_connection()
+            try:
+                await sync_catalog(conn, batch_size=args.batch_size)
+            finally:
+                await conn.close()
         elif args.embeddings_only:
             # Populate embeddings only
             conn = await create_connection()
             try:
+                await ensure_source_hash_columns(conn)
                 await populate_product_image_embeddings(conn, clear_existing=args.clear_embeddings, batch_size=args.batch_size)
                 await populate_product_description_embeddings(conn, clear_existing=args.clear_embeddings, batch_size=args.batch_size)
                 await verify_embeddings_table(conn)
@@ -1868,7 +2006,8 @@ async def main():
             # Generate the complete database
             logging.info(f"Database will be created at {POSTGRES_CONFIG['host']}:{POSTGRES_CONFIG['port']}/{POSTGRES_CONFIG['database']}")
             logging.info(f"Schema: {SCHEMA_NAME}")
-            await generate_postgresql_database(num_customers=args.num_customers)
+            await generate_postgresql_database(num_customers=args.num_customers, rls_policies=args.rls_policies,
+                                               partitioning=args.partition_orders)
             
             logging.info("\nDatabase generated successfully!")
             logging.info(f"Host: {POSTGRES_CONFIG['host']}:{POSTGRES_CONFIG['port']}")
@@ -1876,6 +2015,7 @@ async def main():
             logging.info(f"Schema: {SCHEMA_NAME}")
             logging.info(f"To view statistics: python {sys.argv[0]} --show-stats")
             logging.info(f"To populate embeddings only: python {sys.argv[0]} --embeddings-only")
+            logging.info(f"To apply later catalog changes: python {sys.argv[0]} --sync")
             logging.info(f"To verify embeddings: python {sys.argv[0]} --verify-embeddings")
             logging.info(f"To verify seasonal patterns: python {sys.argv[0]} --verify-seasonal")
             
@@ -1,31 +1,120 @@
 """
 Azure OpenAI DALL-E 3 Image Generation Script using Azure OpenAI SDK
 Generates images for products in product_data.json and updates the JSON with image file paths.
-Uses managed identity for authentication.
+Uses managed identity for authentication (or AZURE_OPENAI_API_KEY when set).
+
+Images are generated by a bounded pool of concurrent requests. A token bucket paces
+requests to the deployment's quota and backs off when the service answers 429, then
+recovers gradually. Generated images are downloaded over a pooled HTTP session and
+streamed straight to disk, and product_data.json is checkpointed every few images
+rather than after each one.
+
+USAGE:
+    python image_generation.py [--limit 50] [--concurrency 4] [--rate-per-minute 6]
+                               [--checkpoint-every 10] [--yes]
+
+To measure throughput offline, start fake_openai_server.py and point the script at it:
+    AZURE_OPENAI_ENDPOINT=http://localhost:8089 AZURE_OPENAI_API_KEY=fake \\
+        python image_generation.py --images-dir /tmp/images --rate-per-minute 600 --yes
 """
 
+import argparse
+import asyncio
 import json
 import os
+import random
 import re
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
+import aiohttp
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    RateLimitError,
+)
 
 # Load environment variables from same directory only
 script_dir = Path(__file__).parent
 env_path = script_dir / ".env"
 load_dotenv(dotenv_path=env_path, override=True)
 
+DEFAULT_IMAGES_DIR = "/workspace/images"
+
+
+class TokenBucket:
+    """
+    Request pacer that adapts to rate limiting.
+
+    Tokens refill at `rate` per second up to `burst`. A 429 halves the rate and
+    pauses the bucket for the server's Retry-After; each success then nudges the
+    rate back up towards the configured maximum.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1) -> None:
+        self.max_rate = rate_per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self) -> None:
+        """Additive increase back towards the configured rate."""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        """Multiplicative decrease, and hold all requests for the Retry-After period."""
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
 
 class DalleImageGenerator:
-    def __init__(self):
-        """Initialize the DALL-E image generator with Azure OpenAI SDK and managed identity."""
+    def __init__(
+        self,
+        images_dir: str = DEFAULT_IMAGES_DIR,
+        concurrency: int = 4,
+        rate_per_minute: float = 6.0,
+        checkpoint_every: int = 10,
+        max_retries: int = 6,
+    ):
+        """
+        Initialize the DALL-E image generator with Azure OpenAI SDK and managed identity.
+
+        Args:
+            images_dir: Directory the generated images are written to
+            concurrency: Maximum image generation requests in flight at once
+            rate_per_minute: Request rate the token bucket allows (the deployment's quota)
+            checkpoint_every: Save product_data.json after this many new images
+            max_retries: Retries per image for rate limits and transient errors
+        """
         # You will need to set these environment variables
         self.endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
         self.api_version = os.getenv('OPENAI_API_VERSION', '2024-04-01-preview')
@@ -34,22 +123,39 @@ class DalleImageGenerator:
         if not self.endpoint:
             raise ValueError("Missing AZURE_OPENAI_ENDPOINT in environment variables")
 
-        # Set up Azure OpenAI client with managed identity
-        token_provider = get_bearer_token_provider(
-            DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
-        )
+        # Retries are handled by request_image_url so they can feed the token bucket
+        api_key = os.getenv('AZURE_OPENAI_API_KEY')
+        if api_key:
+            self.client = AsyncAzureOpenAI(
+                api_version=self.api_version,
+                azure_endpoint=self.endpoint,
+                api_key=api_key,
+                max_retries=0
+            )
+        else:
+            # Set up Azure OpenAI client with managed identity
+            token_provider = get_bearer_token_provider(
+                DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
+            )
+            self.client = AsyncAzureOpenAI(
+                api_version=self.api_version,
+                azure_endpoint=self.endpoint,
+                azure_ad_token_provider=token_provider,
+                max_retries=0
+            )
 
-        self.client = AzureOpenAI(
-            api_version=self.api_version,
-            azure_endpoint=self.endpoint,
-            azure_ad_token_provider=token_provider
-        )        # Paths - relative to script location
+        self.concurrency = max(1, concurrency)
+        self.rate_per_minute = rate_per_minute
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.max_retries = max(0, max_retries)
+
+        # Paths - relative to script location
         script_dir = Path(__file__).parent
         self.product_data_path = script_dir / "product_data.json"
-        self.images_dir = Path("/workspace/images")
+        self.images_dir = Path(images_dir)
 
         # Ensure images directory exists
-        self.images_dir.mkdir(exist_ok=True)
+        self.images_dir.mkdir(parents=True, exist_ok=True)
 
         # Load product data
         self.product_data = self.load_product_data()
@@ -65,11 +171,21 @@ class DalleImageGenerator:
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in product data file: {e}")
 
-    def save_product_data(self):
-        """Save updated product data back to JSON file."""
+    def save_product_data(self, text: Optional[str] = None):
+        """
+        Save updated product data back to JSON file.
+
+        Args:
+            text: The product data already serialised, e.g. on the event loop while workers
+                  keep updating it; serialised here when omitted
+        """
+        if text is None:
+            text = json.dumps(self.product_data, indent=2, ensure_ascii=False)
         try:
-            with open(self.product_data_path, 'w', encoding='utf-8') as f:
-                json.dump(self.product_data, f, indent=2, ensure_ascii=False)
+            temp_path = self.product_data_path.with_suffix('.json.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, self.product_data_path)
             print(f"Product data saved to {self.product_data_path}")
         except Exception as e:
             print(f"Error saving product data: {e}")
@@ -79,10 +195,10 @@ class DalleImageGenerator:
         # Remove special characters and spaces, replace with underscores (but keep &)
         safe_category = re.sub(r'[^\w\s\-&]', '', category.lower())
         safe_category = re.sub(r'[-\s]+', '_', safe_category)
-        
+
         safe_subcategory = re.sub(r'[^\w\s\-&]', '', subcategory.lower())
         safe_subcategory = re.sub(r'[-\s]+', '_', safe_subcategory)
-        
+
         safe_name = re.sub(r'[^\w\s\-&]', '', product_name.lower())
         safe_name = re.sub(r'[-\s]+', '_', safe_name)
 
@@ -90,45 +206,103 @@ class DalleImageGenerator:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"{safe_category}_{safe_subcategory}_{safe_name}_{timestamp}.png"
 
-    def generate_image(self, product: Dict[str, Any], category: str, subcategory: str) -> Optional[str]:
-        """Generate an image using DALL-E 3 for a specific product."""
+    @staticmethod
+    def _retry_delay(attempt: int, error: Exception) -> float:
+        """Work out how long to wait before retrying, preferring the server's hint."""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            for header, scale in (('retry-after-ms', 1000.0), ('retry-after', 1.0)):
+                value = response.headers.get(header)
+                if value:
+                    try:
+                        return float(value) / scale
+                    except ValueError:
+                        pass
+
+        # Exponential backoff with full jitter, capped at 60 seconds
+        return random.uniform(0, min(60.0, 2 ** attempt))
+
+    async def request_image_url(self, product: Dict[str, Any], bucket: TokenBucket, stats: Dict[str, Any]) -> Optional[str]:
+        """Ask DALL-E 3 for an image of the product and return its temporary URL."""
 
         image_prompt = f"""
 A simple realistic image of a "{product['description']}", isolated on a white background, centered, with no shadows.
 """
 
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            started = time.perf_counter()
+            try:
+                result = await self.client.images.generate(
+                    model=self.deployment,
+                    prompt=image_prompt,
+                    n=1,
+                    size="1024x1024",
+                    quality="standard",
+                    style="vivid"
+                )
+                bucket.on_success()
+                stats['generate_seconds'] += time.perf_counter() - started
+                return result.data[0].url
+
+            except RateLimitError as e:
+                stats['rate_limited'] += 1
+                error = e
+                bucket.on_rate_limited(self._retry_delay(attempt, e))
+            except (APIConnectionError, APITimeoutError) as e:
+                error = e
+            except APIStatusError as e:
+                # Client errors other than 429 (e.g. content policy) will not succeed on retry
+                if e.status_code < 500:
+                    raise
+                error = e
+
+            if attempt == self.max_retries:
+                raise error
+            if not isinstance(error, RateLimitError):
+                await asyncio.sleep(self._retry_delay(attempt, error))
+            print(f"    ↻ {type(error).__name__} for {product['name']}, retrying "
+                  f"(attempt {attempt + 1}/{self.max_retries}, {bucket.rate * 60:.1f} req/min)")
+
+    async def download_image(self, session: aiohttp.ClientSession, image_url: str, image_path: Path) -> int:
+        """Stream an image to disk and return the number of bytes written."""
+        temp_path = image_path.with_suffix(image_path.suffix + '.part')
+        written = 0
+        async with session.get(image_url) as response:
+            response.raise_for_status()
+            with open(temp_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+        os.replace(temp_path, image_path)
+        return written
+
+    async def generate_image(
+        self,
+        session: aiohttp.ClientSession,
+        bucket: TokenBucket,
+        product: Dict[str, Any],
+        category: str,
+        subcategory: str,
+        stats: Dict[str, Any],
+    ) -> Optional[str]:
+        """Generate an image using DALL-E 3 for a specific product."""
         try:
             print(f"Generating image for: {product['name']}")
-            
-            result = self.client.images.generate(
-                model=self.deployment,
-                prompt=image_prompt,
-                n=1,
-                size="1024x1024",
-                quality="standard",
-                style="vivid"
-            )
-
-            # Extract image URL from the response
-            image_url = json.loads(result.model_dump_json())['data'][0]['url']
+            image_url = await self.request_image_url(product, bucket, stats)
 
             # Download and save the image
             filename = self.create_safe_filename(
                 product['name'], category, subcategory)
             image_path = self.images_dir / filename
 
-            # Download the image
-            image_response = requests.get(image_url)
-            if image_response.status_code == 200:
-                with open(image_path, 'wb') as f:
-                    f.write(image_response.content)
-
-                print(f"Image saved: {filename}")
-                # Return relative path for JSON storage
-                return f"images/{filename}"
-            print(
-                f"Failed to download image: {image_response.status_code}")
-            return None
+            started = time.perf_counter()
+            stats['bytes'] += await self.download_image(session, image_url, image_path)
+            stats['download_seconds'] += time.perf_counter() - started
+
+            print(f"Image saved: {filename}")
+            # Return relative path for JSON storage
+            return f"images/{filename}"
 
         except Exception as e:
             print(f"Error generating image for {product['name']}: {e}")
@@ -138,90 +312,95 @@ A simple realistic image of a "{product['description']}", isolated on a white ba
         """Check if a product needs an image generated."""
         return 'image_path' not in product or not product.get('image_path')
 
-    def process_products(self, limit: Optional[int] = None, delay: float = 1.0):
+    def collect_pending(self, limit: Optional[int] = None) -> List[Tuple[Dict[str, Any], str, str]]:
+        """Return (product, category, subcategory) for products that need an image, up to limit."""
+        pending = []
+        for category_name, category_data in self.product_data['main_categories'].items():
+            for subcategory_name, products in category_data.items():
+                # Skip non-product data (like seasonal multipliers)
+                if not isinstance(products, list) or not products:
+                    continue
+                for product in products:
+                    if isinstance(product, dict) and 'name' in product and self.needs_image(product):
+                        pending.append((product, category_name, subcategory_name))
+        return pending[:limit] if limit else pending
+
+    async def _run_pipeline(self, pending: List[Tuple[Dict[str, Any], str, str]]) -> Dict[str, Any]:
+        """Generate and download images for all pending products concurrently."""
+        bucket = TokenBucket(self.rate_per_minute, burst=self.concurrency)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        save_lock = asyncio.Lock()
+        stats: Dict[str, Any] = {
+            'generated': 0, 'failed': 0, 'rate_limited': 0,
+            'bytes': 0, 'generate_seconds': 0.0, 'download_seconds': 0.0,
+        }
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2)
+        timeout = aiohttp.ClientTimeout(total=300)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def worker(product: Dict[str, Any], category: str, subcategory: str) -> None:
+                async with semaphore:
+                    image_path = await self.generate_image(session, bucket, product, category, subcategory, stats)
+
+                if not image_path:
+                    stats['failed'] += 1
+                    print(f"    ✗ Failed to generate image for: {product['name']}")
+                    return
+
+                # Update product with image path
+                product['image_path'] = image_path
+                stats['generated'] += 1
+                print(f"    ✓ Generated image {stats['generated']}/{len(pending)}: {image_path}")
+
+                # Checkpoint every few images instead of after each one
+                if stats['generated'] % self.checkpoint_every == 0:
+                    async with save_lock:
+                        # Serialised here, between worker steps, so the thread writes a consistent
+                        # snapshot while other workers keep setting image_path
+                        text = json.dumps(self.product_data, indent=2, ensure_ascii=False)
+                        await asyncio.to_thread(self.save_product_data, text)
+
+            await asyncio.gather(*(worker(*item) for item in pending))
+
+        await self.client.close()
+        return stats
+
+    def process_products(self, limit: Optional[int] = None):
         """
         Process all products and generate images where needed.
 
         Args:
             limit: Maximum number of images to generate (None for no limit)
-            delay: Delay between API calls in seconds
         """
-        generated_count = 0
-        total_products = 0
-        products_needing_images = 0
-
         print("Starting image generation process...")
         print(f"Images will be saved to: {self.images_dir.absolute()}")
 
-        # Count total products and those needing images
-        for category_name, category_data in self.product_data['main_categories'].items():
-            for subcategory_name, products in category_data.items():
-                if isinstance(products, list) and products:
-                    for product in products:
-                        if isinstance(product, dict) and 'name' in product:
-                            total_products += 1
-                            if self.needs_image(product):
-                                products_needing_images += 1
-
-        print(f"Total products: {total_products}")
-        print(f"Products needing images: {products_needing_images}")
-
+        pending = self.collect_pending(limit)
         if limit:
             print(f"Generation limit: {limit} images")
+        print(f"Images to generate: {len(pending)} "
+              f"(concurrency {self.concurrency}, up to {self.rate_per_minute:g} requests/min)")
+        if not pending:
+            return
 
-        # Process each category and subcategory
-        for category_name, category_data in self.product_data['main_categories'].items():
-            print(f"\nProcessing category: {category_name}")
-
-            for subcategory_name, products in category_data.items():
-                # Skip non-product data (like seasonal multipliers)
-                if not isinstance(products, list) or not products:
-                    continue
-
-                print(f"  Processing subcategory: {subcategory_name}")
-
-                for i, product in enumerate(products):
-                    # Skip if not a valid product
-                    if not isinstance(product, dict) or 'name' not in product:
-                        continue
-
-                    # Check if limit reached
-                    if limit and generated_count >= limit:
-                        print(f"Reached generation limit of {limit} images")
-                        self.save_product_data()
-                        return
-
-                    # Check if product needs an image
-                    if not self.needs_image(product):
-                        print(
-                            f"    Skipping {product['name']} (already has image)")
-                        continue
-
-                    # Generate image
-                    print(f"    Generating image for: {product['name']}")
-                    image_path = self.generate_image(
-                        product, category_name, subcategory_name)
-
-                    if image_path:
-                        # Update product with image path
-                        product['image_path'] = image_path
-                        generated_count += 1
-                        print(
-                            f"    ✓ Generated image {generated_count}: {image_path}")
-
-                        # Save progress after each image
-                        self.save_product_data()
-
-                        # Add delay to avoid rate limiting
-                        if delay > 0:
-                            time.sleep(delay)
-                    else:
-                        print(
-                            f"    ✗ Failed to generate image for: {product['name']}")
-                        time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            stats = asyncio.run(self._run_pipeline(pending))
+        finally:
+            # Record every image that made it to disk, even if the run was interrupted
+            self.save_product_data()
+        elapsed = time.perf_counter() - started
 
         print("\n🎉 Image generation complete!")
-        print(f"Generated {generated_count} new images")
+        print(f"Generated {stats['generated']} new images ({stats['failed']} failed)")
+        if stats['generated'] and elapsed > 0:
+            print(f"Throughput: {stats['generated'] / elapsed:.2f} images/s "
+                  f"(~{stats['generated'] / elapsed * 3600:.0f} images/hour) over {elapsed:.1f}s")
+            print(f"  Avg generate latency: {stats['generate_seconds'] / stats['generated']:.2f}s, "
+                  f"avg download: {stats['download_seconds'] / stats['generated']:.2f}s, "
+                  f"{stats['bytes'] / (1024 * 1024):.1f} MB downloaded")
+        print(f"  Rate limited (429) responses: {stats['rate_limited']}")
         print(f"All images saved to: {self.images_dir.absolute()}")
 
     def get_statistics(self) -> Dict[str, int]:
@@ -248,8 +427,31 @@ A simple realistic image of a "{product['description']}", isolated on a white ba
 
 def main():
     """Main function to run the image generation process."""
+    parser = argparse.ArgumentParser(description='Generate DALL-E 3 product images for product_data.json')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='Maximum images to generate (prompted for when omitted)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Image generation requests in flight at once (default: 4)')
+    parser.add_argument('--rate-per-minute', type=float, default=6.0,
+                        help='Requests per minute allowed by the deployment quota (default: 6)')
+    parser.add_argument('--checkpoint-every', type=int, default=10,
+                        help='Save product_data.json after this many new images (default: 10)')
+    parser.add_argument('--max-retries', type=int, default=6,
+                        help='Retries per image on rate limits and transient errors (default: 6)')
+    parser.add_argument('--images-dir', default=DEFAULT_IMAGES_DIR,
+                        help=f'Directory to write images to (default: {DEFAULT_IMAGES_DIR})')
+    parser.add_argument('--yes', action='store_true',
+                        help='Do not prompt; generate for all products needing images (or --limit)')
+    args = parser.parse_args()
+
     try:
-        generator = DalleImageGenerator()
+        generator = DalleImageGenerator(
+            images_dir=args.images_dir,
+            concurrency=args.concurrency,
+            rate_per_minute=args.rate_per_minute,
+            checkpoint_every=args.checkpoint_every,
+            max_retries=args.max_retries,
+        )
 
         # Show initial statistics
         stats = generator.get_statistics()
@@ -262,40 +464,36 @@ def main():
             print("\n✅ All products already have images!")
             return None
 
-        # Ask user for preferences
-        print("\n" + "="*50)
-        print("DALL-E 3 Image Generation Options:")
-        print("="*50)
-
-        # Get user input for generation limit
-        try:
-            limit_input = input(
-                f"Enter max images to generate (Enter for all {stats['products_without_images']}): ").strip()
-            limit = int(limit_input) if limit_input else None
-        except ValueError:
-            limit = None
-
-        # Get user input for delay
-        try:
-            delay_input = input(
-                "Enter delay between API calls in seconds (default 1.0): ").strip()
-            delay = float(delay_input) if delay_input else 1.0
-        except ValueError:
-            delay = 1.0
+        limit = args.limit
+        if not args.yes:
+            # Ask user for preferences
+            print("\n" + "="*50)
+            print("DALL-E 3 Image Generation Options:")
+            print("="*50)
+
+            # Get user input for generation limit
+            if limit is None:
+                try:
+                    limit_input = input(
+                        f"Enter max images to generate (Enter for all {stats['products_without_images']}): ").strip()
+                    limit = int(limit_input) if limit_input else None
+                except ValueError:
+                    limit = None
 
         print("\nStarting generation with:")
         print(f"  Limit: {limit if limit else 'No limit'}")
-        print(f"  Delay: {delay} seconds")
-        print(f"  Rate: ~{3600/delay:.0f} images per hour" if delay >
-              0 else "  Rate: Maximum")
+        print(f"  Concurrency: {generator.concurrency}")
+        print(f"  Rate: up to {generator.rate_per_minute:g} requests/min "
+              f"(~{generator.rate_per_minute * 60:.0f} images per hour)")
 
-        confirm = input("\nProceed? (y/N): ").strip().lower()
-        if confirm != 'y':
-            print("Generation cancelled.")
-            return None
+        if not args.yes:
+            confirm = input("\nProceed? (y/N): ").strip().lower()
+            if confirm != 'y':
+                print("Generation cancelled.")
+                return None
 
         # Start generation
-        generator.process_products(limit=limit, delay=delay)
+        generator.process_products(limit=limit)
 
         # Show final statistics
         final_stats = generator.get_statistics()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Post-process generated product images into the sizes the rest of the tooling needs.
+
+image_generation.py saves the raw 1024x1024 PNG returned by DALL-E. This stage turns
+each one into three derived files, leaving the original (and the image_path stored in
+product_data.json and the database) untouched:
+
+    <images_dir>/derived/full/<name>.webp    full-size, lossy WebP for serving
+    <images_dir>/derived/clip/<name>.png     224x224, resized and centre-cropped exactly
+                                             as CLIPProcessor does, for add_image_embeddings.py
+    <images_dir>/derived/thumbs/<name>.webp  small web thumbnail
+
+Images are processed by a pool of worker processes. Derived files that are newer than
+their source are skipped, so the stage can be re-run after every generation batch.
+A report of disk footprint per variant and throughput is printed at the end.
+
+USAGE:
+    python image_postprocess.py [--images-dir /workspace/images] [--workers 8]
+                                [--quality 85] [--thumb-size 256] [--force]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from catalog import iter_products
+
+DEFAULT_IMAGES_DIR = "/workspace/images"
+
+# CLIP ViT-B/32 input resolution
+CLIP_SIZE = 224
+
+VARIANTS = ("full", "clip", "thumbs")
+
+
+def derived_path(images_dir: Path, variant: str, filename: str) -> Path:
+    """Path of a derived file for an original image filename."""
+    extension = ".png" if variant == "clip" else ".webp"
+    return images_dir / "derived" / variant / (Path(filename).stem + extension)
+
+
+def clip_ready_path(images_dir: Path, filename: str) -> Optional[Path]:
+    """Return the pre-resized CLIP input for an image if it is present and current."""
+    original = images_dir / filename
+    clip_path = derived_path(images_dir, "clip", filename)
+    if clip_path.exists() and (not original.exists() or clip_path.stat().st_mtime >= original.stat().st_mtime):
+        return clip_path
+    return None
+
+
+def resize_for_clip(img: Image.Image, size: int = CLIP_SIZE) -> Image.Image:
+    """Resize the shortest side to `size` with bicubic filtering, then centre-crop to a square."""
+    width, height = img.size
+    scale = size / min(width, height)
+    resized = img.resize((max(size, round(width * scale)), max(size, round(height * scale))), Image.BICUBIC)
+    left = (resized.width - size) // 2
+    top = (resized.height - size) // 2
+    return resized.crop((left, top, left + size, top + size))
+
+
+def process_image(job: Tuple[str, str, int, int, bool]) -> Dict[str, object]:
+    """
+    Write the derived variants for one image. Runs in a worker process.
+
+    Args:
+        job: (images_dir, filename, quality, thumb_size, force)
+
+    Returns:
+        Dictionary with the filename, status and byte sizes of source and outputs
+    """
+    images_dir, filename, quality, thumb_size, force = job
+    images_dir = Path(images_dir)
+    source = images_dir / filename
+    result: Dict[str, object] = {"filename": filename, "status": "skipped", "source_bytes": 0}
+
+    try:
+        result["source_bytes"] = source.stat().st_size
+        outputs = {variant: derived_path(images_dir, variant, filename) for variant in VARIANTS}
+
+        if not force and all(
+            path.exists() and path.stat().st_mtime >= source.stat().st_mtime for path in outputs.values()
+        ):
+            for variant, path in outputs.items():
+                result[f"{variant}_bytes"] = path.stat().st_size
+            return result
+
+        with Image.open(source) as img:
+            img = img.convert("RGB")
+
+            encoded = {}
+            buffer = io.BytesIO()
+            img.save(buffer, "WEBP", quality=quality, method=4)
+            encoded["full"] = buffer.getvalue()
+
+            buffer = io.BytesIO()
+            resize_for_clip(img).save(buffer, "PNG", optimize=True)
+            encoded["clip"] = buffer.getvalue()
+
+            thumb = img.copy()
+            thumb.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumb.save(buffer, "WEBP", quality=quality, method=4)
+            encoded["thumbs"] = buffer.getvalue()
+
+        for variant, data in encoded.items():
+            path = outputs[variant]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix(path.suffix + ".tmp")
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+            result[f"{variant}_bytes"] = len(data)
+
+        result["status"] = "processed"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+
+    return result
+
+
+def collect_image_filenames(images_dir: Path, product_data_path: Path) -> List[str]:
+    """Image filenames referenced by product_data.json, or every PNG in the directory if it is absent."""
+    if product_data_path.exists():
+        filenames = []
+        for entry in iter_products(str(product_data_path)):
+            image_path = entry.product.get("image_path")
+            if image_path:
+                # Strip the "images/" prefix used in the JSON
+                filenames.append(image_path[7:] if image_path.startswith("images/") else image_path)
+        return filenames
+
+    return sorted(path.name for path in images_dir.glob("*.png"))
+
+
+def format_mb(num_bytes: int) -> str:
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+def main() -> None:
+    """Main entry point for the post-processing stage."""
+    parser = argparse.ArgumentParser(description="Resize, recompress and thumbnail generated product images")
+    parser.add_argument("--images-dir", default=DEFAULT_IMAGES_DIR,
+                        help=f"Directory holding the generated images (default: {DEFAULT_IMAGES_DIR})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--quality", type=int, default=85,
+                        help="WebP quality for full-size images and thumbnails (default: 85)")
+    parser.add_argument("--thumb-size", type=int, default=256,
+                        help="Longest side of web thumbnails in pixels (default: 256)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-process images even when derived files are up to date")
+    args = parser.parse_args()
+
+    images_dir = Path(args.images_dir)
+    if not images_dir.exists():
+        print(f"Error: images directory not found: {images_dir}")
+        sys.exit(1)
+
+    product_data_path = Path(__file__).parent / "product_data.json"
+    filenames = [name for name in collect_image_filenames(images_dir, product_data_path)
+                 if (images_dir / name).exists()]
+
+    print("Image Post-Processing")
+    print("=" * 50)
+    print(f"Images directory: {images_dir}")
+    print(f"Images found: {len(filenames)}, workers: {args.workers}")
+
+    jobs = [(str(images_dir), name, args.quality, args.thumb_size, args.force) for name in filenames]
+    counts = {"processed": 0, "skipped": 0, "failed": 0}
+    totals = {"source_bytes": 0, "full_bytes": 0, "clip_bytes": 0, "thumbs_bytes": 0}
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for result in executor.map(process_image, jobs, chunksize=8):
+            counts[result["status"]] += 1
+            if result["status"] == "failed":
+                print(f"✗ {result['filename']}: {result.get('error')}")
+                continue
+            for key in totals:
+                totals[key] += result.get(key, 0)
+            if result["status"] == "processed" and counts["processed"] % 50 == 0:
+                print(f"  → {counts['processed']} images processed")
+    elapsed = time.perf_counter() - started
+
+    print("\n" + "=" * 50)
+    print("POST-PROCESSING COMPLETE")
+    print("=" * 50)
+    print(f"Processed: {counts['processed']}, up to date: {counts['skipped']}, failed: {counts['failed']}")
+    if counts["processed"] and elapsed > 0:
+        print(f"Throughput: {counts['processed'] / elapsed:.1f} images/s ({elapsed:.1f}s)")
+    if totals["source_bytes"]:
+        print(f"Original PNGs:        {format_mb(totals['source_bytes'])}")
+        for variant, label in (("full", "Full-size WebP:"), ("clip", "CLIP-ready 224px:"), ("thumbs", "Web thumbnails:")):
+            size = totals[f"{variant}_bytes"]
+            print(f"{label:<22}{format_mb(size)} ({size / totals['source_bytes']:.1%} of originals)")
+
+
+if __name__ == "__main__":
+    main()
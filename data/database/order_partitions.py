@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Optional range partitioning of the orders and order_items tables by order date.
+
+Agents mostly ask time-bounded questions ("sales this year", "last quarter").
+With partitioning, PostgreSQL only scans the partitions whose date range
+matches the query's order_date filter (partition pruning), so these queries
+stay fast as the order history grows.
+
+Layouts:
+- none (default): orders and order_items are plain tables, as before.
+- year / month: both tables are range partitioned on order_date, one partition
+  per year or month. order_items carries a copy of its order's order_date so it
+  can be partitioned on the same key. The primary keys become
+  (order_id, order_date) and (order_item_id, order_date), and order_items
+  references orders on (order_id, order_date). Indexes created on the parent
+  tables are created on every partition.
+
+For order_items to be pruned as well, queries join on both columns and filter
+the order_date of both tables (range conditions are not carried across a join):
+
+    FROM retail.orders o
+    JOIN retail.order_items oi ON oi.order_id = o.order_id AND oi.order_date = o.order_date
+    WHERE o.order_date >= DATE '2025-01-01' AND oi.order_date >= DATE '2025-01-01'
+
+The schema tool of the sales analysis MCP server passes this on as a query hint.
+
+There is no default partition, so an order outside the created ranges is
+rejected instead of silently landing in a catch-all table. Add partitions for
+new periods with ensure_order_partitions().
+
+Row level security policies apply to queries through the parent tables only.
+RLS is enabled on every partition without any policy, so selecting from a
+partition directly returns no rows for store managers.
+
+Usage:
+    from order_partitions import create_order_tables, ensure_order_partitions
+
+    await create_order_tables(conn, 'retail', 'year', 2020, 2026)
+    await ensure_order_partitions(conn, 'retail', 2027)
+"""
+
+import logging
+from datetime import date
+from typing import List, Optional, Tuple
+
+PARTITION_SCHEMES = ('none', 'year', 'month')
+
+
+def partition_ranges(scheme: str, first_year: int, last_year: int) -> List[Tuple[str, date, date]]:
+    """(suffix, from, to) of every partition covering first_year to last_year inclusive."""
+    ranges = []
+    for year in range(first_year, last_year + 1):
+        if scheme == 'year':
+            ranges.append((f"{year}", date(year, 1, 1), date(year + 1, 1, 1)))
+        else:
+            for month in range(1, 13):
+                upper = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+                ranges.append((f"{year}_{month:02d}", date(year, month, 1), upper))
+    return ranges
+
+
+async def create_order_tables(conn, schema: str, scheme: str = 'none',
+                              first_year: Optional[int] = None, last_year: Optional[int] = None) -> None:
+    """
+    Create the orders and order_items tables in the given layout.
+
+    Args:
+        conn: asyncpg connection of the schema owner
+        schema: Schema to create the tables in (it must already hold customers, stores and products)
+        scheme: 'none', 'year' or 'month' (see the module docstring)
+        first_year, last_year: Years to create partitions for (partitioned layouts only)
+    """
+    if scheme not in PARTITION_SCHEMES:
+        raise ValueError(f"Unknown partitioning '{scheme}' (expected one of {', '.join(PARTITION_SCHEMES)})")
+
+    if scheme == 'none':
+        # Create orders table (header only)
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.orders (
+                order_id SERIAL PRIMARY KEY,
+                customer_id INTEGER NOT NULL,
+                store_id INTEGER NOT NULL,
+                order_date DATE NOT NULL,
+                FOREIGN KEY (customer_id) REFERENCES {schema}.customers (customer_id),
+                FOREIGN KEY (store_id) REFERENCES {schema}.stores (store_id)
+            )
+        """)
+
+        # Create order_items table (line items)
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.order_items (
+                order_item_id SERIAL PRIMARY KEY,
+                order_id INTEGER NOT NULL,
+                store_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                unit_price DECIMAL(10,2) NOT NULL,
+                discount_percent INTEGER DEFAULT 0,
+                discount_amount DECIMAL(10,2) DEFAULT 0,
+                total_amount DECIMAL(10,2) NOT NULL,
+                FOREIGN KEY (order_id) REFERENCES {schema}.orders (order_id),
+                FOREIGN KEY (store_id) REFERENCES {schema}.stores (store_id),
+                FOREIGN KEY (product_id) REFERENCES {schema}.products (product_id)
+            )
+        """)
+        return
+
+    if first_year is None or last_year is None:
+        raise ValueError("first_year and last_year are required for partitioned order tables")
+
+    logging.info(f"Creating orders and order_items partitioned by {scheme} on order_date...")
+
+    # The partition key has to be part of every unique constraint
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.orders (
+            order_id SERIAL,
+            customer_id INTEGER NOT NULL,
+            store_id INTEGER NOT NULL,
+            order_date DATE NOT NULL,
+            PRIMARY KEY (order_id, order_date),
+            FOREIGN KEY (customer_id) REFERENCES {schema}.customers (customer_id),
+            FOREIGN KEY (store_id) REFERENCES {schema}.stores (store_id)
+        ) PARTITION BY RANGE (order_date)
+    """)
+
+    # order_date is copied from the order so line items share its partition bounds
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.order_items (
+            order_item_id SERIAL,
+            order_id INTEGER NOT NULL,
+            store_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price DECIMAL(10,2) NOT NULL,
+            discount_percent INTEGER DEFAULT 0,
+            discount_amount DECIMAL(10,2) DEFAULT 0,
+            total_amount DECIMAL(10,2) NOT NULL,
+            order_date DATE NOT NULL,
+            PRIMARY KEY (order_item_id, order_date),
+            FOREIGN KEY (order_id, order_date) REFERENCES {schema}.orders (order_id, order_date),
+            FOREIGN KEY (store_id) REFERENCES {schema}.stores (store_id),
+            FOREIGN KEY (product_id) REFERENCES {schema}.products (product_id)
+        ) PARTITION BY RANGE (order_date)
+    """)
+
+    await _create_partitions(conn, schema, partition_ranges(scheme, first_year, last_year))
+
+
+async def _create_partitions(conn, schema: str, ranges: List[Tuple[str, date, date]]) -> int:
+    """Create the missing orders and order_items partitions for `ranges`; returns how many were added."""
+    created = 0
+    for table in ('orders', 'order_items'):
+        for suffix, lower, upper in ranges:
+            partition = f"{table}_{suffix}"
+            exists = await conn.fetchval("SELECT to_regclass($1)", f"{schema}.{partition}")
+            if exists:
+                continue
+            await conn.execute(f"""
+                CREATE TABLE {schema}.{partition} PARTITION OF {schema}.{table}
+                FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')
+            """)
+            # Only the parent's policies apply, so deny direct reads of the partition
+            await conn.execute(f"ALTER TABLE {schema}.{partition} ENABLE ROW LEVEL SECURITY")
+            created += 1
+    logging.info(f"Created {created} order partitions")
+    return created
+
+
+async def _partition_bounds(conn, schema: str) -> List[Tuple[date, date]]:
+    """(from, to) of every partition of the orders table, oldest first."""
+    rows = await conn.fetch(
+        """SELECT pg_get_expr(c.relpartbound, c.oid) AS bound
+           FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = to_regclass($1)""",
+        f"{schema}.orders")
+    bounds = []
+    for row in rows:
+        # e.g. FOR VALUES FROM ('2020-01-01') TO ('2021-01-01')
+        lower, upper = (date.fromisoformat(part.split("'")[1]) for part in row["bound"].split(" TO "))
+        bounds.append((lower, upper))
+    return sorted(bounds)
+
+
+async def current_partitioning(conn, schema: str) -> str:
+    """The layout of an existing orders table: 'none', 'year' or 'month'."""
+    bounds = await _partition_bounds(conn, schema)
+    if not bounds:
+        return 'none'
+    lower, upper = bounds[0]
+    return 'year' if upper == date(lower.year + 1, 1, 1) and lower.month == 1 else 'month'
+
+
+async def ensure_order_partitions(conn, schema: str, through_year: int) -> int:
+    """
+    Add orders and order_items partitions up to the end of `through_year`.
+
+    Uses the table's current layout and fills any gap after the oldest existing
+    partition. Does nothing for unpartitioned tables.
+
+    Returns:
+        Number of partitions created
+    """
+    bounds = await _partition_bounds(conn, schema)
+    if not bounds:
+        logging.info("orders is not partitioned; nothing to add")
+        return 0
+    scheme = await current_partitioning(conn, schema)
+    return await _create_partitions(conn, schema, partition_ranges(scheme, bounds[0][0].year, through_year))
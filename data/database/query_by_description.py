@@ -29,6 +29,7 @@ from typing import List, Optional, Tuple
 import asyncpg
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache
 from openai import AzureOpenAI
 
 
@@ -65,6 +66,9 @@ class ProductQueryTool:
         except Exception as e:
             print(f"Failed to initialize Azure OpenAI client: {e}")
             sys.exit(1)
+        
+        # Repeated queries are answered from the shared embedding cache
+        self.cache = EmbeddingCache()
     
     def _load_environment(self) -> None:
         """Load environment variables from .env files."""
@@ -117,6 +121,12 @@ class ProductQueryTool:
             List of float values representing the embedding
         """
         try:
+            content_hash = EmbeddingCache.text_key(self.model_name, query_text)
+            embedding = self.cache.get(content_hash)
+            if embedding is not None:
+                print(f"✓ Using cached embedding for query: '{query_text}'")
+                return embedding
+            
             print(f"Generating embedding for query: '{query_text}'")
             
             # Generate embedding using Azure OpenAI
@@ -127,6 +137,7 @@ class ProductQueryTool:
             
             # Extract embedding from response
             embedding = response.data[0].embedding
+            self.cache.put(content_hash, self.model_name, embedding)
             print(f"✓ Generated embedding (dimension: {len(embedding)})")
             return embedding
             
@@ -261,6 +272,7 @@ class ProductQueryTool:
         
         finally:
             await conn.close()
+            self.cache.close()
 
 
 async def main() -> None:
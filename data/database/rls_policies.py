@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Row Level Security policies for the retail schema.
+
+Store managers may only see the orders, order items, inventory, customers and
+sales rollups of their own store; the super manager sees everything. The manager is identified by
+the app.current_rls_user_id setting, which the MCP servers set per connection.
+
+Two interchangeable policy sets are provided:
+
+- exists (default): each policy runs a correlated
+  EXISTS (SELECT 1 FROM stores s WHERE s.store_id = <row>.store_id
+          AND s.rls_user_id::text = current_setting(...))
+  for every row. Casting the UUID column to text also keeps any index on
+  stores.rls_user_id from being used.
+
+- fast: the manager's store ids are resolved once per statement by
+  current_manager_store_ids(), a STABLE SECURITY DEFINER function that looks the
+  setting up through an index on stores(rls_user_id) and returns every store id
+  for the super manager. The policies compare
+  store_id = ANY((SELECT current_manager_store_ids())::integer[]). Because the call is
+  wrapped in a sub-select, the planner runs it once as an InitPlan instead of
+  once per row, and with no OR around it the comparison can drive an index scan
+  on the store_id indexes of the protected tables. store_id is NOT NULL there, so
+  this matches the explicit super manager check; customers.primary_store_id is
+  nullable, so the customers policy keeps that check.
+
+Both sets return the same rows. The fast set is opt-in so existing databases
+keep the policies they were created with until apply_rls_policies() is run.
+
+Usage:
+    from rls_policies import apply_rls_policies
+
+    await apply_rls_policies(conn, 'retail', 'fast')
+"""
+
+import logging
+
+# Super Manager UUID - has access to all rows regardless of RLS policies
+SUPER_MANAGER_UUID = '00000000-0000-0000-0000-000000000000'
+
+POLICY_SETS = ('exists', 'fast')
+
+# Tables filtered by store manager, and tables every user can read
+RESTRICTED_TABLES = ('orders', 'order_items', 'inventory', 'customers')
+# Filtered like orders, but only present in databases built with them (see sales_rollups.py)
+ROLLUP_TABLES = ('sales_daily', 'sales_monthly')
+REFERENCE_TABLES = ('stores', 'categories', 'product_types', 'products',
+                    'product_image_embeddings', 'product_description_embeddings')
+
+UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+
+def _exists_policies(schema: str) -> dict:
+    """Per-row EXISTS lookups against the stores table."""
+    def owned_by_manager(column: str) -> str:
+        return f"""EXISTS (
+                    SELECT 1 FROM {schema}.stores s
+                    WHERE s.store_id = {column}
+                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
+                )"""
+
+    conditions = {
+        table: owned_by_manager(f'{schema}.{table}.store_id')
+        for table in ('orders', 'order_items', 'inventory') + ROLLUP_TABLES
+    }
+    return {
+        **conditions,
+        'customers': f"""{owned_by_manager(f'{schema}.customers.primary_store_id')}
+                OR
+                -- Also allow access to customers who have ordered from their store (backward compatibility)
+                EXISTS (
+                    SELECT 1 FROM {schema}.orders o
+                    JOIN {schema}.stores s ON o.store_id = s.store_id
+                    WHERE o.customer_id = {schema}.customers.customer_id
+                    AND s.rls_user_id::text = current_setting('app.current_rls_user_id', true)
+                )""",
+    }
+
+
+def _fast_policies(schema: str) -> dict:
+    """store_id = ANY(<manager's store ids>), with the ids computed once per statement."""
+    # The cast makes this ANY over the array value rather than ANY (subquery)
+    store_ids = f"((SELECT {schema}.current_manager_store_ids())::integer[])"
+    conditions = {
+        table: f"store_id = ANY {store_ids}"
+        for table in ('orders', 'order_items', 'inventory') + ROLLUP_TABLES
+    }
+    return {
+        **conditions,
+        'customers': f"""primary_store_id = ANY {store_ids}
+                OR
+                -- Also allow access to customers who have ordered from their store (backward compatibility)
+                EXISTS (
+                    SELECT 1 FROM {schema}.orders o
+                    WHERE o.customer_id = {schema}.customers.customer_id
+                    AND o.store_id = ANY {store_ids}
+                )""",
+    }
+
+
+async def _create_store_lookup(conn, schema: str) -> None:
+    """Index and function that map the current manager to their store ids."""
+    await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_stores_rls_user_id ON {schema}.stores(rls_user_id)")
+
+    # SECURITY DEFINER so the lookup does not depend on the caller's access to stores;
+    # a pinned search_path keeps it from resolving objects the caller controls.
+    # Settings that are not a UUID match no store rather than raising a cast error.
+    await conn.execute(f"""
+        CREATE OR REPLACE FUNCTION {schema}.current_manager_store_ids()
+        RETURNS integer[]
+        LANGUAGE sql STABLE SECURITY DEFINER
+        SET search_path = pg_catalog, pg_temp
+        AS $$
+            WITH manager AS (
+                SELECT CASE WHEN setting ~ '{UUID_PATTERN}' THEN setting::uuid END AS rls_user_id
+                FROM current_setting('app.current_rls_user_id', true) AS setting
+            )
+            SELECT CASE
+                WHEN manager.rls_user_id = '{SUPER_MANAGER_UUID}' THEN
+                    (SELECT COALESCE(array_agg(store_id), '{{}}') FROM {schema}.stores)
+                ELSE
+                    (SELECT COALESCE(array_agg(s.store_id), '{{}}') FROM {schema}.stores s
+                     WHERE s.rls_user_id = manager.rls_user_id)
+            END
+            FROM manager
+        $$
+    """)
+
+
+async def current_policy_set(conn, schema: str) -> str:
+    """Which policy set is installed on the orders table ('exists' if none is recognised)."""
+    qual = await conn.fetchval(
+        "SELECT qual FROM pg_policies WHERE schemaname = $1 AND tablename = 'orders' "
+        "AND policyname = 'store_manager_orders'", schema)
+    return 'fast' if qual and 'current_manager_store_ids' in qual else 'exists'
+
+
+async def apply_rls_policies(conn, schema: str, policy_set: str = 'exists') -> None:
+    """
+    Enable row level security on the retail tables and (re)create their policies.
+
+    Safe to run on an existing database: policies are dropped and recreated in one
+    transaction, so this also switches a database from one policy set to the other.
+
+    Args:
+        conn: asyncpg connection of the table owner or a superuser
+        schema: Schema holding the retail tables
+        policy_set: 'exists' or 'fast' (see the module docstring)
+    """
+    if policy_set not in POLICY_SETS:
+        raise ValueError(f"Unknown RLS policy set '{policy_set}' (expected one of {', '.join(POLICY_SETS)})")
+
+    logging.info(f"Setting up Row Level Security policies ({policy_set})...")
+    logging.info(f"Super Manager UUID (access to all rows): {SUPER_MANAGER_UUID}")
+
+    rollups = [table for table in ROLLUP_TABLES
+               if await conn.fetchval("SELECT to_regclass($1)", f"{schema}.{table}")]
+
+    # One transaction, so a failure never leaves a table with RLS enabled but no policy
+    async with conn.transaction():
+        for table in RESTRICTED_TABLES + tuple(rollups) + REFERENCE_TABLES:
+            await conn.execute(f"ALTER TABLE {schema}.{table} ENABLE ROW LEVEL SECURITY")
+
+        if policy_set == 'fast':
+            await _create_store_lookup(conn, schema)
+            conditions = _fast_policies(schema)
+        else:
+            conditions = _exists_policies(schema)
+        super_manager = f"current_setting('app.current_rls_user_id', true) = '{SUPER_MANAGER_UUID}'"
+
+        # Store managers only see rows of their own store
+        for table in RESTRICTED_TABLES + tuple(rollups):
+            if policy_set == 'fast' and table != 'customers':
+                # The store id list already covers the super manager
+                using = conditions[table]
+            else:
+                using = f"""
+                    -- Super manager has access to all rows
+                    {super_manager}
+                    OR
+                    {conditions[table]}"""
+            await conn.execute(f"DROP POLICY IF EXISTS store_manager_{table} ON {schema}.{table}")
+            await conn.execute(f"""
+                CREATE POLICY store_manager_{table} ON {schema}.{table}
+                FOR ALL TO PUBLIC
+                USING ({using})
+            """)
+
+        # Reference tables are readable by everyone
+        for table in REFERENCE_TABLES:
+            await conn.execute(f"DROP POLICY IF EXISTS all_users_{table} ON {schema}.{table}")
+            await conn.execute(f"""
+                CREATE POLICY all_users_{table} ON {schema}.{table}
+                FOR ALL TO PUBLIC
+                USING (true)
+            """)
+
+        if policy_set == 'exists':
+            # Left over from an earlier switch to the fast set
+            await conn.execute(f"DROP FUNCTION IF EXISTS {schema}.current_manager_store_ids()")
+
+    logging.info("Row Level Security policies created successfully!")
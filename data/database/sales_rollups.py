@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated sales rollups for dashboard-style questions.
+
+Most analytic questions ask for revenue, units or margin by store, category,
+product type and day or month. Answering them from the raw tables means
+joining every order_items row to orders, products and categories. The
+rollup tables hold those totals already:
+
+- sales_daily:   one row per order date, store and product type
+- sales_monthly: one row per month (first day of the month), store and product type
+
+Each row has the store, category and product type ids and names, order_count,
+units, revenue, cost and gross_margin. Cost is the product's current cost
+times the units sold. order_count is the number of orders with at least one
+item of that product type. It adds up across days and stores, but not across
+product types or categories, because one order can contain several types.
+
+The tables are rebuilt from the raw data by refresh_sales_rollups(), either in
+full or from a given date onwards. The catalog sync (generate_zava_postgres.py
+--sync) calls it when a product's cost, category or type changes. The same store manager policies as orders
+apply to them (see rls_policies.py).
+
+Usage:
+    from sales_rollups import create_rollup_tables, refresh_sales_rollups
+
+    await create_rollup_tables(conn, 'retail')
+    await refresh_sales_rollups(conn, 'retail')                      # Full rebuild
+    await refresh_sales_rollups(conn, 'retail', date(2026, 1, 1))    # Only 2026 onwards
+"""
+
+import logging
+from datetime import date
+from typing import Dict, Optional
+
+# Rollup table -> its date column
+ROLLUP_TABLES = {'sales_daily': 'sale_date', 'sales_monthly': 'sale_month'}
+
+ROLLUP_COMMENTS = {
+    'sales_daily': (
+        "Pre-aggregated daily sales by store, category and product type. Prefer this table over joining "
+        "orders, order_items and products for revenue, units, cost or gross margin by day. order_count counts "
+        "orders containing the product type, so do not sum it across product types or categories."
+    ),
+    'sales_monthly': (
+        "Pre-aggregated monthly sales by store, category and product type (sale_month is the first day of the "
+        "month). Prefer this table over joining orders, order_items and products for revenue, units, cost or "
+        "gross margin by month, quarter or year. order_count counts orders containing the product type, so do "
+        "not sum it across product types or categories."
+    ),
+}
+
+
+async def create_rollup_tables(conn, schema: str) -> None:
+    """Create the rollup tables and their indexes if they do not exist."""
+    for table, period in ROLLUP_TABLES.items():
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{table} (
+                {period} DATE NOT NULL,
+                store_id INTEGER NOT NULL,
+                store_name TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                category_name TEXT NOT NULL,
+                type_id INTEGER NOT NULL,
+                type_name TEXT NOT NULL,
+                order_count INTEGER NOT NULL,
+                units INTEGER NOT NULL,
+                revenue DECIMAL(14,2) NOT NULL,
+                cost DECIMAL(14,2) NOT NULL,
+                gross_margin DECIMAL(14,2) NOT NULL,
+                PRIMARY KEY ({period}, store_id, type_id),
+                FOREIGN KEY (store_id) REFERENCES {schema}.stores (store_id),
+                FOREIGN KEY (category_id) REFERENCES {schema}.categories (category_id),
+                FOREIGN KEY (type_id) REFERENCES {schema}.product_types (type_id)
+            )
+        """)
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_store ON {schema}.{table}(store_id, {period})")
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_category ON {schema}.{table}(category_id, {period})")
+        await conn.execute(f"COMMENT ON TABLE {schema}.{table} IS '{ROLLUP_COMMENTS[table]}'")
+
+
+async def refresh_sales_rollups(conn, schema: str, since: Optional[date] = None) -> Dict[str, int]:
+    """
+    Rebuild the rollup tables from orders and order_items.
+
+    Runs in one transaction, so readers see either the old or the new totals.
+    Must run as the table owner (or a superuser), which row level security does
+    not filter.
+
+    Args:
+        conn: asyncpg connection of the table owner
+        schema: Schema holding the retail tables
+        since: Only rebuild totals from this date on (the whole month for
+            sales_monthly); None rebuilds everything
+
+    Returns:
+        Rows written per rollup table
+    """
+    logging.info(f"Refreshing sales rollups{f' from {since}' if since else ''}...")
+    daily_since = since or date.min
+    monthly_since = date(since.year, since.month, 1) if since else date.min
+
+    counts = {}
+    async with conn.transaction():
+        await conn.execute(f"DELETE FROM {schema}.sales_daily WHERE sale_date >= $1", daily_since)
+        result = await conn.execute(f"""
+            INSERT INTO {schema}.sales_daily
+                (sale_date, store_id, store_name, category_id, category_name, type_id, type_name,
+                 order_count, units, revenue, cost, gross_margin)
+            SELECT o.order_date, o.store_id, s.store_name, p.category_id, c.category_name, p.type_id, pt.type_name,
+                   COUNT(DISTINCT o.order_id), SUM(oi.quantity), SUM(oi.total_amount),
+                   SUM(oi.quantity * p.cost), SUM(oi.total_amount - oi.quantity * p.cost)
+            FROM {schema}.orders o
+            JOIN {schema}.order_items oi ON oi.order_id = o.order_id
+            JOIN {schema}.products p ON p.product_id = oi.product_id
+            JOIN {schema}.categories c ON c.category_id = p.category_id
+            JOIN {schema}.product_types pt ON pt.type_id = p.type_id
+            JOIN {schema}.stores s ON s.store_id = o.store_id
+            WHERE o.order_date >= $1
+            GROUP BY o.order_date, o.store_id, s.store_name, p.category_id, c.category_name, p.type_id, pt.type_name
+        """, daily_since)
+        counts['sales_daily'] = int(result.split()[-1])
+
+        # An order has a single date, so daily order counts add up to monthly ones
+        await conn.execute(f"DELETE FROM {schema}.sales_monthly WHERE sale_month >= $1", monthly_since)
+        result = await conn.execute(f"""
+            INSERT INTO {schema}.sales_monthly
+                (sale_month, store_id, store_name, category_id, category_name, type_id, type_name,
+                 order_count, units, revenue, cost, gross_margin)
+            SELECT DATE_TRUNC('month', sale_date)::date, store_id, store_name, category_id, category_name,
+                   type_id, type_name, SUM(order_count), SUM(units), SUM(revenue), SUM(cost), SUM(gross_margin)
+            FROM {schema}.sales_daily
+            WHERE sale_date >= $1
+            GROUP BY DATE_TRUNC('month', sale_date), store_id, store_name, category_id, category_name,
+                     type_id, type_name
+        """, monthly_since)
+        counts['sales_monthly'] = int(result.split()[-1])
+
+    for table in ROLLUP_TABLES:
+        await conn.execute(f"ANALYZE {schema}.{table}")
+    logging.info(f"Sales rollups refreshed: {counts['sales_daily']:,} daily rows, {counts['sales_monthly']:,} monthly rows")
+    return counts
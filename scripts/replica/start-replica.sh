@@ -0,0 +1,16 @@
+#!/bin/bash
+set -e
+
+# On first start, clone the primary and configure this server as its standby
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    echo "📦 Cloning the primary ($PRIMARY_HOST) into a streaming replica..."
+    until pg_isready -h "$PRIMARY_HOST" -U postgres -q; do
+        sleep 2
+    done
+    pg_basebackup -h "$PRIMARY_HOST" -U postgres -D "$PGDATA" -R -X stream -c fast -P
+    chmod 700 "$PGDATA"
+    echo "✅ Replica created"
+fi
+
+echo "🚀 Starting read replica..."
+exec postgres -D "$PGDATA"
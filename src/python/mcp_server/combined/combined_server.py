@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Serves the sales analysis, customer sales and semantic search tool sets from one MCP server for Zava Retail DIY Business.
+
+Run separately, the three servers each hold their own database pools, caches and
+copies of the shared modules. Mounted here, the tool sets share one process, one
+pool per database (sized from MCP_DB_CONNECTION_BUDGET) and one cache layer. Each
+tool set can be enabled on its own with --toolsets or MCP_TOOLSETS.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+from mcp.server.fastmcp import FastMCP
+
+# Shared modules (mcp_common) live one directory up, next to the server folders, and the tool
+# set modules import their siblings by name, as when they run from their own directories
+_MCP_SERVER_DIR = Path(__file__).resolve().parent.parent
+for _path in (_MCP_SERVER_DIR / "customer_sales", _MCP_SERVER_DIR / "sales_analysis", _MCP_SERVER_DIR):
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+from mcp_common.log import configure_logging, get_logger  # noqa: E402
+from mcp_common.metrics import add_metrics_route  # noqa: E402
+from mcp_common.replicas import WORKERS  # noqa: E402
+from mcp_common.request import ToolsetContexts, set_stdio_rls_user_id  # noqa: E402
+from mcp_common.tracing import configure_tracing  # noqa: E402
+from mcp_common.workers import http_app, serve, serve_stdio  # noqa: E402
+
+logger = get_logger(__name__)
+
+# Tool set -> module defining its server (mcp), app_lifespan and TOOL_LIMITS. sales_analysis comes
+# first so that the shared pool is opened with its options, which include the statement cache.
+TOOLSETS = {
+    "sales_analysis": "sales_analysis",
+    "customer_sales": "customer_sales",
+    "semantic_search": "customer_sales_semantic_search",
+}
+
+mcp: Optional[FastMCP] = None
+tool_limits: Dict[str, int] = {}
+
+
+def enabled_toolsets(value: Optional[str] = None) -> List[str]:
+    """Tool sets named in value (default: MCP_TOOLSETS, or all), in mounting order."""
+    value = os.getenv("MCP_TOOLSETS", ",".join(TOOLSETS)) if value is None else value
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(TOOLSETS)
+    if unknown:
+        raise ValueError(f"Unknown tool sets: {', '.join(sorted(unknown))} (available: {', '.join(TOOLSETS)})")
+    if not names:
+        raise ValueError("No tool set enabled")
+    return [name for name in TOOLSETS if name in names]
+
+
+def create_server(toolsets: List[str]) -> FastMCP:
+    """A server with the tools of each tool set, on one lifespan entering each tool set's lifespan."""
+    global mcp, tool_limits
+
+    modules: List[ModuleType] = [importlib.import_module(TOOLSETS[name]) for name in toolsets]
+
+    @asynccontextmanager
+    async def app_lifespan(server: FastMCP) -> AsyncIterator[ToolsetContexts]:
+        """Manage application lifecycle of every mounted tool set"""
+        async with AsyncExitStack() as stack:
+            contexts = [await stack.enter_async_context(module.app_lifespan(server)) for module in modules]
+            yield ToolsetContexts(contexts)
+
+    mcp = FastMCP("mcp-zava-combined", lifespan=app_lifespan, stateless_http=True)
+    add_metrics_route(mcp)
+
+    tool_limits = {}
+    for module in modules:
+        for tool in module.mcp._tool_manager.list_tools():
+            # Tools in more than one tool set (get_current_utc_date) behave the same in each
+            if mcp._tool_manager.get_tool(tool.name) is None:
+                mcp.add_tool(tool.fn, name=tool.name, title=tool.title, description=tool.description,
+                             annotations=tool.annotations)
+        for tool_name, limit in module.TOOL_LIMITS.items():
+            tool_limits.setdefault(tool_name, limit)
+
+    logger.info("Tool sets mounted", extra={"fields": {"toolsets": toolsets}})
+    return mcp
+
+
+def create_app() -> Any:
+    """Build the HTTP app of one server process (each worker calls this)."""
+    server = mcp or create_server(enabled_toolsets())
+    # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+    configure_tracing(server.name)
+    # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+    configure_logging(server.name)
+    # The FastMCP server as HTTP endpoint, behind per-tool admission control
+    return http_app(server, tool_limits)
+
+
+def run_http_server(server: FastMCP, workers: int = WORKERS) -> None:
+    """Run the MCP server in HTTP mode, as one or more worker processes."""
+    print(f"📡 MCP endpoint available at: http://{server.settings.host}:{server.settings.port}/mcp")
+    print(f"📈 Metrics available at: http://{server.settings.host}:{server.settings.port}/metrics")
+
+    serve(server, create_app, workers)
+
+
+def main() -> None:
+    """Main entry point for the MCP server."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stdio", action="store_true", help="Run server in stdio mode")
+    parser.add_argument("--RLS_USER_ID", type=str, default=None, help="Row Level Security User ID")
+    parser.add_argument("--port", type=int, default=None, help="HTTP port (default: 8000)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="HTTP worker processes (default: MCP_WORKERS or 1)")
+    parser.add_argument("--toolsets", type=str, default=None,
+                        help=f"Comma-separated tool sets to enable (default: MCP_TOOLSETS or {','.join(TOOLSETS)})")
+    args = parser.parse_args()
+
+    try:
+        toolsets = enabled_toolsets(args.toolsets)
+    except ValueError as e:
+        parser.error(str(e))
+    # Inherited by worker processes, which build their own server
+    os.environ["MCP_TOOLSETS"] = ",".join(toolsets)
+
+    server = create_server(toolsets)
+    if args.port is not None:
+        server.settings.port = args.port
+
+    # if running in stdio mode, use the RLS user id for every call
+    set_stdio_rls_user_id(args.RLS_USER_ID)
+
+    if args.stdio:
+        # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+        configure_tracing(server.name)
+        # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+        configure_logging(server.name)
+        serve_stdio(server)
+    else:
+        # Run the HTTP server
+        run_http_server(server, args.workers)
+
+
+if __name__ == "__main__":
+    main()
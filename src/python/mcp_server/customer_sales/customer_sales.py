@@ -4,18 +4,31 @@ Provides comprehensive customer sales database access with individual table sche
 """
 
 import argparse
-import asyncio
+import sys
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Annotated, Optional
+from pathlib import Path
+from typing import Annotated, Any
 
 from customer_sales_postgres import PostgreSQLCustomerSales
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 
-RLS_USER_ID = None
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.log import configure_logging, get_logger  # noqa: E402
+from mcp_common.metrics import add_metrics_route, instrument_tool  # noqa: E402
+from mcp_common.replicas import WORKERS  # noqa: E402
+from mcp_common.request import get_rls_user_id, lifespan_context, set_stdio_rls_user_id  # noqa: E402
+from mcp_common.tracing import configure_tracing  # noqa: E402
+from mcp_common.workers import http_app, serve, serve_stdio  # noqa: E402
+
+logger = get_logger(__name__)
 
 
 @dataclass
@@ -29,8 +42,8 @@ class AppContext:
 async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
     """Manage application lifecycle with type-safe context"""
 
-    db = PostgreSQLCustomerSales()
-    # Use connection pool instead of single connection for HTTP server
+    # The process's pools (mcp_common/replicas.py) rather than new ones for every request
+    db = PostgreSQLCustomerSales(shared_pool=True)
     await db.create_pool()
 
     try:
@@ -40,53 +53,29 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
         try:
             await db.close_pool()
         except Exception as e:
-            print(f"⚠️  Error closing database pool: {e}")
+            logger.warning("Error closing database pool", extra={"fields": {"error": str(e)}})
 
 
 # Create MCP server with lifespan support
 mcp = FastMCP("mcp-zava-sales", lifespan=app_lifespan, stateless_http=True)
+add_metrics_route(mcp)
 
-
-def get_header(ctx: Context, header_name: str) -> Optional[str]:
-    """Extract a specific header from the request context."""
-
-    request = ctx.request_context.request
-    if request is not None and hasattr(request, "headers"):
-        headers = request.headers
-        if headers:
-            header_value = headers.get(header_name)
-            if header_value is not None:
-                if isinstance(header_value, bytes):
-                    return header_value.decode("utf-8")
-                return str(header_value)
-
-    return None
-
-
-def get_rls_user_id(ctx: Context) -> str:
-    """Get the Row Level Security User ID from the request context."""
-
-    # if running in stdio mode, use the global RLS_USER_ID passed as an argument
-    if RLS_USER_ID is not None:
-        return RLS_USER_ID
-
-    rls_user_id = get_header(ctx, "x-rls-user-id")
-    if rls_user_id is None:
-        # Default to a placeholder if not provided
-        rls_user_id = "00000000-0000-0000-0000-000000000000"
-    return rls_user_id
+# Calls of each tool that may run at once in HTTP mode; other requests (initialize, tools/list, ...)
+# get MCP_ADMISSION_DEFAULT_LIMIT each (see mcp_common/admission.py)
+TOOL_LIMITS = {
+    "get_products_by_name": 12,
+    "get_current_utc_date": 4,
+}
 
 
 def get_db_provider() -> PostgreSQLCustomerSales:
     """Get the database provider instance from context."""
-    ctx = mcp.get_context()
-    app_context = ctx.request_context.lifespan_context
-    if isinstance(app_context, AppContext):
-        return app_context.db
-    raise RuntimeError("Invalid lifespan context type")
+    app_context = lifespan_context(mcp.get_context(), AppContext)
+    return app_context.db
 
 
 @mcp.tool()
+@instrument_tool
 async def get_products_by_name(
     ctx: Context,
     product_name: Annotated[str, Field(description="Name of the product to search for.")],
@@ -104,8 +93,7 @@ async def get_products_by_name(
 
     rls_user_id = get_rls_user_id(ctx)
 
-    print(f"Manager ID: {rls_user_id}")
-    print(f"Max Rows: {max_rows}")
+    logger.info("get_products_by_name", extra={"fields": {"rls_user_id": rls_user_id, "max_rows": max_rows}})
 
     try:
 
@@ -118,13 +106,14 @@ async def get_products_by_name(
 
 
 @mcp.tool()
+@instrument_tool
 async def get_current_utc_date() -> str:
     """Get the current UTC date and time in ISO format. Useful for date-based queries, filtering recent data, or understanding the current context for time-sensitive analysis.
 
     Returns:
         Current UTC date and time in ISO format (YYYY-MM-DDTHH:MM:SS.fffffZ)
     """
-    print("Retrieving current UTC date and time")
+    logger.debug("Retrieving current UTC date and time")
     try:
         current_utc = datetime.now(timezone.utc)
         return f"Current UTC Date/Time: {current_utc.isoformat()}"
@@ -132,34 +121,54 @@ async def get_current_utc_date() -> str:
         return f"Error retrieving current UTC date: {e!s}"
 
 
-async def run_http_server() -> None:
-    """Run the MCP server in HTTP mode."""
+def create_app() -> Any:
+    """Build the HTTP app of one server process (each worker calls this)."""
+    # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+    configure_tracing(mcp.name)
+    # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+    configure_logging(mcp.name)
+    # The FastMCP server as HTTP endpoint, behind per-tool admission control
+    return http_app(mcp, TOOL_LIMITS)
+
+
+def run_http_server(workers: int = WORKERS) -> None:
+    """Run the MCP server in HTTP mode, as one or more worker processes."""
     print(
         f"📡 MCP endpoint available at: http://{mcp.settings.host}:{mcp.settings.port}/mcp")
+    print(
+        f"📈 Metrics available at: http://{mcp.settings.host}:{mcp.settings.port}/metrics")
 
-    # Run the FastMCP server as HTTP endpoint
-    await mcp.run_streamable_http_async()
+    serve(mcp, create_app, workers)
 
 
 def main() -> None:
     """Main entry point for the MCP server."""
-    global RLS_USER_ID
-
     parser = argparse.ArgumentParser()
     parser.add_argument("--stdio", action="store_true",
                         help="Run server in stdio mode")
     parser.add_argument("--RLS_USER_ID", type=str,
                         default=None, help="Row Level Security User ID")
+    parser.add_argument("--port", type=int, default=None,
+                        help="HTTP port (default: 8000)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="HTTP worker processes (default: MCP_WORKERS or 1)")
     args = parser.parse_args()
 
-    # if running in stdio mode, set the global RLS_USER_ID
-    RLS_USER_ID = args.RLS_USER_ID
+    if args.port is not None:
+        mcp.settings.port = args.port
+
+    # if running in stdio mode, use the RLS user id for every call
+    set_stdio_rls_user_id(args.RLS_USER_ID)
 
     if args.stdio:
-        mcp.run()
+        # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+        configure_tracing(mcp.name)
+        # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+        configure_logging(mcp.name)
+        serve_stdio(mcp)
     else:
         # Run the HTTP server
-        asyncio.run(run_http_server())
+        run_http_server(args.workers)
 
 
 if __name__ == "__main__":
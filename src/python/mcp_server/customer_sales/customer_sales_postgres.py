@@ -18,11 +18,23 @@ import asyncio
 import json
 import logging
 import os
-from typing import Optional
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 import asyncpg
 from dotenv import load_dotenv
 
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.metrics import DB_ACQUIRE_WAIT, DB_POOL_CREATE, DB_QUERY_DURATION, timed  # noqa: E402
+from mcp_common.replicas import PoolRouter, pool_size, shared_router  # noqa: E402
+from mcp_common.singleflight import SingleFlight, freeze  # noqa: E402
+from mcp_common.tracing import span  # noqa: E402
+
 # Load environment variables (don't override existing ones)
 load_dotenv(override=False)
 
@@ -37,12 +49,32 @@ POSTGRES_URL = os.getenv(
 SCHEMA_NAME = "retail"
 MANAGER_ID = ""
 
+# Options of every pool; providers created with shared_pool=True use the process's pools
+# (mcp_common/replicas.py), sized from MCP_DB_CONNECTION_BUDGET, instead of their own
+POOL_OPTIONS: Dict[str, Any] = {
+    "command_timeout": 30,  # 30 second query timeout
+    "server_settings": {
+        "jit": "off",  # Disable JIT to reduce memory usage
+        "work_mem": "4MB",  # Limit work memory per query
+        "statement_timeout": "30s",  # 30 second statement timeout
+    },
+}
+
+# Identical concurrent searches share one execution (see mcp_common/singleflight.py)
+PRODUCT_NAME_FLIGHTS = SingleFlight("products_by_name")
+SIMILARITY_FLIGHTS = SingleFlight("similarity_search")
+
 
 class PostgreSQLCustomerSales:
     """Provides PostgreSQL database connection and product search functionality."""
 
-    def __init__(self, postgres_config: Optional[str] = None) -> None:
+    def __init__(self, postgres_config: Optional[str] = None, replica_configs: Optional[List[str]] = None,
+                 shared_pool: bool = False) -> None:
         self.postgres_config = postgres_config or POSTGRES_URL
+        self.replica_configs = replica_configs
+        self.shared_pool = shared_pool
+        # Primary pool plus one pool per read replica (POSTGRES_REPLICA_URLS by default)
+        self.router = PoolRouter(self.postgres_config, replica_configs)
         self.connection_pool: Optional[asyncpg.Pool] = None
 
     async def __aenter__(self) -> "PostgreSQLCustomerSales":
@@ -57,17 +89,17 @@ class PostgreSQLCustomerSales:
         """Create connection pool for better resource management."""
         if self.connection_pool is None:
             try:
-                self.connection_pool = await asyncpg.create_pool(
-                    self.postgres_config,
-                    min_size=1,  # Minimum connections in pool
-                    max_size=3,  # Very conservative pool size
-                    command_timeout=30,  # 30 second query timeout
-                    server_settings={
-                        "jit": "off",  # Disable JIT to reduce memory usage
-                        "work_mem": "4MB",  # Limit work memory per query
-                        "statement_timeout": "30s",  # 30 second statement timeout
-                    },
-                )
+                if self.shared_pool:
+                    self.router = await shared_router(self.postgres_config, self.replica_configs,
+                                                      min_size=1, max_size=pool_size(), **POOL_OPTIONS)
+                else:
+                    with span("db.create_pool"), timed(DB_POOL_CREATE):
+                        await self.router.open(
+                            min_size=1,  # Minimum connections in pool
+                            max_size=3,  # Very conservative pool size
+                            **POOL_OPTIONS,
+                        )
+                self.connection_pool = self.router.primary
                 logger.info(
                     f"✅ PostgreSQL connection pool created: {self.postgres_config}"
                 )
@@ -78,38 +110,46 @@ class PostgreSQLCustomerSales:
     async def close_pool(self) -> None:
         """Close connection pool and cleanup."""
         if self.connection_pool:
-            await self.connection_pool.close()
+            if not self.shared_pool:
+                await self.router.close()
             self.connection_pool = None
             logger.info("✅ PostgreSQL connection pool closed")
 
-    async def get_connection(self) -> asyncpg.Connection:
-        """Get a connection from pool."""
+    async def get_connection(self, read_only: bool = True) -> asyncpg.Connection:
+        """Get a connection from a healthy read replica, or the primary pool (all tools only read)."""
         if not self.connection_pool:
             raise RuntimeError(
                 "No database connection pool available. Call create_pool() first.")
 
         try:
-            return await self.connection_pool.acquire()
+            with span("db.acquire"), timed(DB_ACQUIRE_WAIT):
+                return await self.router.acquire(read_only)
         except Exception as e:
             logger.error(f"Failed to acquire connection from pool: {e}")
             raise RuntimeError(
                 f"Connection pool exhausted or unavailable: {e}") from e
 
     async def release_connection(self, conn: asyncpg.Connection) -> None:
-        """Release connection back to pool."""
+        """Release connection back to the pool it came from."""
         if self.connection_pool:
-            await self.connection_pool.release(conn)
+            await self.router.release(conn)
 
     async def get_products_by_name(self, product_name: str, max_rows: int, rls_user_id: str) -> str:
         """Get products by name using a PostgreSQL query."""
+        return await PRODUCT_NAME_FLIGHTS.run(
+            (self.postgres_config, rls_user_id, product_name, max_rows),
+            lambda: self._get_products_by_name(product_name, max_rows, rls_user_id))
+
+    async def _get_products_by_name(self, product_name: str, max_rows: int, rls_user_id: str) -> str:
         conn = None
         try:
             max_rows = min(max_rows, 100)  # Limit to 100 for performance
             
             conn = await self.get_connection()
 
-            await conn.execute(
-                "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+            with span("db.set_rls_user"), timed(DB_QUERY_DURATION, query="set_rls_user"):
+                await conn.execute(
+                    "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
 
             query = """
                 SELECT p.product_name, pt.type_name, c.category_name, p.base_price as price, SUM(i.stock_level) AS total_stock
@@ -123,10 +163,11 @@ class PostgreSQLCustomerSales:
                 LIMIT $2;
             """
 
-            rows = await conn.fetch(
-                query,
-                f"%{product_name}%", max_rows
-            )
+            with span("db.products_by_name"), timed(DB_QUERY_DURATION, query="products_by_name"):
+                rows = await conn.fetch(
+                    query,
+                    f"%{product_name}%", max_rows
+                )
 
             if not rows:
                 return json.dumps(
@@ -143,9 +184,10 @@ class PostgreSQLCustomerSales:
             columns = list(rows[0].keys()) if rows else []
 
             # Return LLM-friendly format
-            return json.dumps(
-                {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
-            )
+            with span("serialize.json", rows=len(results)):
+                return json.dumps(
+                    {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
+                )
 
         except Exception as e:
             return json.dumps(
@@ -169,6 +211,12 @@ class PostgreSQLCustomerSales:
             rls_user_id: Row-level security user ID
             similarity_threshold: Minimum similarity percentage (0-100) to include in results. Default is 50%.
         """
+        return await SIMILARITY_FLIGHTS.run(
+            (self.postgres_config, rls_user_id, freeze(query_embedding), max_rows, similarity_threshold),
+            lambda: self._search_products_by_similarity(query_embedding, rls_user_id, max_rows, similarity_threshold))
+
+    async def _search_products_by_similarity(self, query_embedding: list[float], rls_user_id: str, max_rows: int,
+                                             similarity_threshold: float) -> str:
         conn = None
         try:
             max_rows = min(max_rows, 100)  # Limit to 100 for performance
@@ -180,8 +228,9 @@ class PostgreSQLCustomerSales:
             
             conn = await self.get_connection()
 
-            await conn.execute(
-                "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+            with span("db.set_rls_user"), timed(DB_QUERY_DURATION, query="set_rls_user"):
+                await conn.execute(
+                    "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
 
             # Convert embedding to string format for PostgreSQL
             embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
@@ -207,7 +256,8 @@ class PostgreSQLCustomerSales:
                 LIMIT $2
             """
 
-            rows = await conn.fetch(query, embedding_str, max_rows, distance_threshold)
+            with span("db.similarity_search"), timed(DB_QUERY_DURATION, query="similarity_search"):
+                rows = await conn.fetch(query, embedding_str, max_rows, distance_threshold)
 
             if not rows:
                 return json.dumps(
@@ -233,9 +283,10 @@ class PostgreSQLCustomerSales:
             columns.append('similarity_percent')
 
             # Return LLM-friendly format
-            return json.dumps(
-                {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
-            )
+            with span("serialize.json", rows=len(results)):
+                return json.dumps(
+                    {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
+                )
 
         except Exception as e:
             return json.dumps(
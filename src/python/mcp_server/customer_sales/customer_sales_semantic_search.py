@@ -6,18 +6,32 @@ This MCP server combines traditional product name search with AI-powered semanti
 
 import argparse
 import asyncio
+import sys
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Annotated, Optional
+from pathlib import Path
+from typing import Annotated, Any, Optional
 
 from customer_sales_postgres import PostgreSQLCustomerSales
 from customer_sales_semantic_search_text_embeddings import SemanticSearchTextEmbedding
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 
-RLS_USER_ID = None
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.log import configure_logging, get_logger  # noqa: E402
+from mcp_common.metrics import add_metrics_route, instrument_tool  # noqa: E402
+from mcp_common.replicas import WORKERS  # noqa: E402
+from mcp_common.request import get_rls_user_id, lifespan_context, set_stdio_rls_user_id  # noqa: E402
+from mcp_common.tracing import configure_tracing  # noqa: E402
+from mcp_common.workers import http_app, serve, serve_stdio  # noqa: E402
+
+logger = get_logger(__name__)
 
 
 @dataclass
@@ -28,14 +42,21 @@ class AppContext:
     semantic_search: SemanticSearchTextEmbedding
 
 
+# Embedding client of the process, created (loading .env and credentials) by the first request
+_semantic_search: Optional[SemanticSearchTextEmbedding] = None
+
+
 @asynccontextmanager
 async def app_lifespan(_server: FastMCP) -> AsyncIterator[AppContext]:
     """Manage application lifecycle with type-safe context"""
+    global _semantic_search
 
-    db = PostgreSQLCustomerSales()
-    semantic_search = SemanticSearchTextEmbedding()
+    # The process's pools (mcp_common/replicas.py) rather than new ones for every request
+    db = PostgreSQLCustomerSales(shared_pool=True)
+    if _semantic_search is None:
+        _semantic_search = SemanticSearchTextEmbedding()
+    semantic_search = _semantic_search
 
-    # Use connection pool instead of single connection for HTTP server
     await db.create_pool()
 
     try:
@@ -45,54 +66,30 @@ async def app_lifespan(_server: FastMCP) -> AsyncIterator[AppContext]:
         try:
             await db.close_pool()
         except Exception as e:
-            print(f"⚠️  Error closing database pool: {e}")
+            logger.warning("Error closing database pool", extra={"fields": {"error": str(e)}})
 
 
 # Create MCP server with lifespan support
 mcp = FastMCP("mcp-zava-sales-semantic",
               lifespan=app_lifespan, stateless_http=True)
+add_metrics_route(mcp)
 
-
-def get_header(ctx: Context, header_name: str) -> Optional[str]:
-    """Extract a specific header from the request context."""
-
-    request = ctx.request_context.request
-    if request is not None and hasattr(request, "headers"):
-        headers = request.headers
-        if headers:
-            header_value = headers.get(header_name)
-            if header_value is not None:
-                if isinstance(header_value, bytes):
-                    return header_value.decode("utf-8")
-                return str(header_value)
-
-    return None
-
-
-def get_rls_user_id(ctx: Context) -> str:
-    """Get the Row Level Security User ID from the request context."""
-
-    # if running in stdio mode, use the global RLS_USER_ID passed as an argument
-    if RLS_USER_ID is not None:
-        return RLS_USER_ID
-
-    rls_user_id = get_header(ctx, "x-rls-user-id")
-    if rls_user_id is None:
-        # Default to a placeholder if not provided
-        rls_user_id = "00000000-0000-0000-0000-000000000000"
-    return rls_user_id
+# Calls of each tool that may run at once in HTTP mode; other requests (initialize, tools/list, ...)
+# get MCP_ADMISSION_DEFAULT_LIMIT each (see mcp_common/admission.py)
+TOOL_LIMITS = {
+    "semantic_search_products": 8,
+    "get_current_utc_date": 4,
+}
 
 
 def get_app_context() -> AppContext:
     """Get the application context from MCP context."""
-    ctx = mcp.get_context()
-    app_context = ctx.request_context.lifespan_context
-    if isinstance(app_context, AppContext):
-        return app_context
-    raise RuntimeError("Invalid lifespan context type")
+    app_context = lifespan_context(mcp.get_context(), AppContext)
+    return app_context
 
 
 @mcp.tool()
+@instrument_tool
 async def semantic_search_products(
     ctx: Context,
     query_description: Annotated[str, Field(description="Use Natural language description to find products that Zava sells.")],
@@ -115,9 +112,8 @@ async def semantic_search_products(
 
     rls_user_id = get_rls_user_id(ctx)
 
-    print(f"Semantic search query: {query_description}")
-    print(f"Manager ID: {rls_user_id}")
-    print(f"Max Rows: {max_rows}")
+    logger.info("semantic_search_products", extra={"fields": {"rls_user_id": rls_user_id, "max_rows": max_rows}})
+    logger.debug("Semantic search query", extra={"fields": {"query": query_description}})
 
     try:
         app_context = get_app_context()
@@ -126,9 +122,10 @@ async def semantic_search_products(
         if not app_context.semantic_search.is_available():
             return "Error: Semantic search is not available. Azure OpenAI endpoint not configured."
 
-        # Generate embedding for the query
-        query_embedding = app_context.semantic_search.generate_query_embedding(
-            query_description)
+        # Generate embedding for the query; the OpenAI client blocks, so it runs in a thread to keep
+        # the event loop (shared with other tool sets in a combined server) free
+        query_embedding = await asyncio.to_thread(
+            app_context.semantic_search.generate_query_embedding, query_description)
         if not query_embedding:
             return "Error: Failed to generate embedding for the query. Please try again."
 
@@ -141,13 +138,14 @@ async def semantic_search_products(
 
 
 @mcp.tool()
+@instrument_tool
 async def get_current_utc_date() -> str:
     """Get the current UTC date and time in ISO format. Useful for date-based queries, filtering recent data, or understanding the current context for time-sensitive analysis.
 
     Returns:
         Current UTC date and time in ISO format (YYYY-MM-DDTHH:MM:SS.fffffZ)
     """
-    print("Retrieving current UTC date and time")
+    logger.debug("Retrieving current UTC date and time")
     try:
         current_utc = datetime.now(timezone.utc)
         return f"Current UTC Date/Time: {current_utc.isoformat()}"
@@ -155,34 +153,54 @@ async def get_current_utc_date() -> str:
         return f"Error retrieving current UTC date: {e!s}"
 
 
-async def run_http_server() -> None:
-    """Run the MCP server in HTTP mode."""
+def create_app() -> Any:
+    """Build the HTTP app of one server process (each worker calls this)."""
+    # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+    configure_tracing(mcp.name)
+    # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+    configure_logging(mcp.name)
+    # The FastMCP server as HTTP endpoint, behind per-tool admission control
+    return http_app(mcp, TOOL_LIMITS)
+
+
+def run_http_server(workers: int = WORKERS) -> None:
+    """Run the MCP server in HTTP mode, as one or more worker processes."""
     print(
         f"📡 MCP endpoint available at: http://{mcp.settings.host}:{mcp.settings.port}/mcp")
+    print(
+        f"📈 Metrics available at: http://{mcp.settings.host}:{mcp.settings.port}/metrics")
 
-    # Run the FastMCP server as HTTP endpoint
-    await mcp.run_streamable_http_async()
+    serve(mcp, create_app, workers)
 
 
 def main() -> None:
     """Main entry point for the MCP server."""
-    global RLS_USER_ID
-
     parser = argparse.ArgumentParser()
     parser.add_argument("--stdio", action="store_true",
                         help="Run server in stdio mode")
     parser.add_argument("--RLS_USER_ID", type=str,
                         default=None, help="Row Level Security User ID")
+    parser.add_argument("--port", type=int, default=None,
+                        help="HTTP port (default: 8000)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="HTTP worker processes (default: MCP_WORKERS or 1)")
     args = parser.parse_args()
 
-    # if running in stdio mode, set the global RLS_USER_ID
-    RLS_USER_ID = args.RLS_USER_ID
+    if args.port is not None:
+        mcp.settings.port = args.port
+
+    # if running in stdio mode, use the RLS user id for every call
+    set_stdio_rls_user_id(args.RLS_USER_ID)
 
     if args.stdio:
-        mcp.run()
+        # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+        configure_tracing(mcp.name)
+        # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+        configure_logging(mcp.name)
+        serve_stdio(mcp)
     else:
         # Run the HTTP server
-        asyncio.run(run_http_server())
+        run_http_server(args.workers)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,11 @@ Customer Sales Semantic Search Tool
 This module provides semantic search functionality for products using Azure OpenAI embeddings.
 It generates embeddings for user queries and finds similar products using pgvector cosine similarity.
 
+Query embeddings go through the content-hash embedding cache of the data tools
+(data/database/embedding_cache.py), so a query embedded before, by this server or by
+query_by_description.py, is not sent to Azure OpenAI again. Set MCP_EMBEDDING_CACHE=0
+to embed every query; EMBEDDING_CACHE_PATH moves the cache file as for the data tools.
+
 Usage:
     from customer_sales_semantic_search import SemanticSearchTool
     
@@ -18,6 +23,9 @@ Requirements:
 """
 
 import os
+import sqlite3
+import sys
+import threading
 from pathlib import Path
 from typing import List, Optional
 
@@ -25,6 +33,29 @@ from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from dotenv import load_dotenv
 from openai import AzureOpenAI
 
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.log import get_logger  # noqa: E402
+from mcp_common.metrics import EMBEDDING_DURATION, record_cache, timed  # noqa: E402
+from mcp_common.tracing import span  # noqa: E402
+
+# The embedding cache lives with the data tools, in data/database of the same checkout
+_DATA_DIR = Path(__file__).resolve().parents[4] / "data" / "database"
+if _DATA_DIR.is_dir() and str(_DATA_DIR) not in sys.path:
+    sys.path.append(str(_DATA_DIR))
+
+try:
+    from embedding_cache import EmbeddingCache  # noqa: E402
+except ImportError:
+    EmbeddingCache = None
+
+logger = get_logger(__name__)
+
+EMBEDDING_CACHE = os.getenv("MCP_EMBEDDING_CACHE", "1") != "0"
+
 
 class SemanticSearchTextEmbedding:
     """Handles semantic search operations using Azure OpenAI embeddings."""
@@ -38,10 +69,13 @@ class SemanticSearchTextEmbedding:
         self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "<ENDPOINT_URL>")
         self.model_name = "text-embedding-3-small"
         self.deployment = os.getenv("EMBEDDING_MODEL_DEPLOYMENT_NAME", "text-embedding-3-small")
+        self.cache = self._open_cache()
+        # Queries are embedded in worker threads; the cache's connection is used by one at a time
+        self._cache_lock = threading.Lock()
         
         # Check if Azure OpenAI endpoint is configured
         if self.endpoint == "<ENDPOINT_URL>":
-            print("Warning: AZURE_OPENAI_ENDPOINT not configured. Semantic search will not work.")
+            logger.warning("AZURE_OPENAI_ENDPOINT not configured. Semantic search will not work.")
             self.openai_client = None
             return
         
@@ -49,7 +83,7 @@ class SemanticSearchTextEmbedding:
         try:
             self.openai_client = self._setup_azure_openai_client()
         except Exception as e:
-            print(f"Failed to initialize Azure OpenAI client: {e}")
+            logger.error("Failed to initialize Azure OpenAI client", extra={"fields": {"error": str(e)}})
             self.openai_client = None
     
     def _load_environment(self) -> None:
@@ -69,8 +103,43 @@ class SemanticSearchTextEmbedding:
             # Fallback to default behavior
             load_dotenv()
     
+    @staticmethod
+    def _open_cache() -> Optional["EmbeddingCache"]:
+        """The shared embedding cache, or None when it is disabled or cannot be opened."""
+        if not EMBEDDING_CACHE or EmbeddingCache is None:
+            return None
+        try:
+            return EmbeddingCache(check_same_thread=False)
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache not available", extra={"fields": {"error": str(e)}})
+            return None
+    
+    def _cached_embedding(self, content_hash: str) -> Optional[List[float]]:
+        try:
+            with self._cache_lock:
+                return self.cache.get(content_hash)
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache lookup failed", extra={"fields": {"error": str(e)}})
+            return None
+    
+    def _cache_embedding(self, content_hash: str, embedding: List[float]) -> None:
+        try:
+            with self._cache_lock:
+                self.cache.put(content_hash, self.model_name, embedding)
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache update failed", extra={"fields": {"error": str(e)}})
+    
     def _setup_azure_openai_client(self) -> AzureOpenAI:
-        """Setup and return Azure OpenAI client with token provider."""
+        """Setup and return Azure OpenAI client with token provider or API key."""
+        api_key = os.getenv("AZURE_OPENAI_API_KEY")
+        if api_key:
+            # e.g. the local fake endpoint (data/database/fake_openai_server.py) used by the load test
+            return AzureOpenAI(
+                api_version="2024-02-01",
+                azure_endpoint=self.endpoint,
+                api_key=api_key,
+            )
+
         token_provider = get_bearer_token_provider(
             DefaultAzureCredential(), 
             "https://cognitiveservices.azure.com/.default"
@@ -94,25 +163,36 @@ class SemanticSearchTextEmbedding:
             List of float values representing the embedding, or None if failed
         """
         if not self.openai_client:
-            print("Azure OpenAI client not initialized. Cannot generate embeddings.")
+            logger.error("Azure OpenAI client not initialized. Cannot generate embeddings.")
             return None
             
-        try:
-            print(f"Generating embedding for query: '{query_text}'")
+        content_hash = None
+        if self.cache is not None:
+            content_hash = EmbeddingCache.text_key(self.model_name, query_text)
+            embedding = self._cached_embedding(content_hash)
+            record_cache("query_embedding", embedding is not None)
+            if embedding is not None:
+                return embedding
             
+        try:
+            logger.debug("Generating embedding for query", extra={"fields": {"query": query_text}})
+
             # Generate embedding using Azure OpenAI
-            response = self.openai_client.embeddings.create(
-                input=[query_text],
-                model=self.deployment
-            )
+            with span("embedding.generate", model=self.deployment), timed(EMBEDDING_DURATION):
+                response = self.openai_client.embeddings.create(
+                    input=[query_text],
+                    model=self.deployment
+                )
             
             # Extract embedding from response
             embedding = response.data[0].embedding
-            print(f"✓ Generated embedding (dimension: {len(embedding)})")
+            logger.debug("Generated embedding", extra={"fields": {"dimension": len(embedding)}})
+            if content_hash is not None:
+                self._cache_embedding(content_hash, embedding)
             return embedding
             
         except Exception as e:
-            print(f"Error generating embedding: {e}")
+            logger.error("Error generating embedding", extra={"fields": {"error": str(e)}})
             return None
     
     def is_available(self) -> bool:
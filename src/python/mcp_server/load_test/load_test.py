@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Load test for the Zava MCP servers over streamable HTTP.
+
+Simulates many agents at once: each virtual user repeatedly picks a scenario
+from a weighted mix, opens an MCP session against the server that scenario
+targets (with a randomly chosen x-rls-user-id header) and replays realistic
+tool calls:
+
+    schema_then_query   get_multiple_table_schemas, then execute_sales_query   (sales_analysis.py)
+    template_query      sales_by_period, top_products or inventory_by_store    (sales_analysis.py, off by default)
+    name_lookup         get_products_by_name                                   (customer_sales.py)
+    semantic_search     semantic_search_products                               (customer_sales_semantic_search.py)
+
+Scenarios whose server URL is not given are skipped. Each tool call is timed
+from the client, and a call counts as an error when it raises, is flagged
+isError, or returns one of the tools' "Error ..." messages. The report gives
+throughput, p50/p95/p99 latency and error rates per scenario and per tool, and
+is saved as JSON so a later run can be compared against it with --baseline.
+
+The servers need a reachable Postgres (POSTGRES_URL); semantic search also
+needs an embedding endpoint, for which data/database/fake_openai_server.py can
+stand in (AZURE_OPENAI_ENDPOINT=http://localhost:8089, AZURE_OPENAI_API_KEY=fake).
+
+Usage:
+    python load_test.py --sales-url http://127.0.0.1:8000/mcp \\
+        --customer-url http://127.0.0.1:8001/mcp --semantic-url http://127.0.0.1:8002/mcp \\
+        --users 32 --duration 60 --output results/baseline.json
+
+    python load_test.py ... --output results/after.json --baseline results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+# All RLS policies grant this id access to every row
+SUPER_MANAGER_UUID = "00000000-0000-0000-0000-000000000000"
+
+SCHEMA_TABLES = [
+    ["retail.orders", "retail.order_items", "retail.products"],
+    ["retail.stores", "retail.orders", "retail.order_items"],
+    ["retail.customers", "retail.orders"],
+    ["retail.inventory", "retail.products", "retail.stores"],
+    ["retail.categories", "retail.product_types", "retail.products", "retail.order_items"],
+]
+
+# Queries of the kind agents write after fetching the schemas
+ANALYTIC_QUERIES = [
+    """SELECT s.store_name, SUM(oi.total_amount) AS revenue
+       FROM retail.orders o
+       JOIN retail.order_items oi ON o.order_id = oi.order_id
+       JOIN retail.stores s ON o.store_id = s.store_id
+       GROUP BY s.store_name ORDER BY revenue DESC LIMIT 20""",
+    """SELECT c.category_name, SUM(oi.total_amount) AS revenue, SUM(oi.quantity) AS units
+       FROM retail.order_items oi
+       JOIN retail.products p ON oi.product_id = p.product_id
+       JOIN retail.categories c ON p.category_id = c.category_id
+       GROUP BY c.category_name ORDER BY revenue DESC LIMIT 20""",
+    """SELECT DATE_TRUNC('month', o.order_date) AS month, COUNT(DISTINCT o.order_id) AS orders,
+              SUM(oi.total_amount) AS revenue
+       FROM retail.orders o
+       JOIN retail.order_items oi ON o.order_id = oi.order_id
+       GROUP BY month ORDER BY month DESC LIMIT 20""",
+    """SELECT p.product_name, SUM(oi.quantity) AS units
+       FROM retail.order_items oi
+       JOIN retail.products p ON oi.product_id = p.product_id
+       GROUP BY p.product_name ORDER BY units DESC LIMIT 20""",
+    """SELECT c.customer_id, c.first_name, c.last_name, COUNT(o.order_id) AS orders
+       FROM retail.customers c
+       JOIN retail.orders o ON c.customer_id = o.customer_id
+       GROUP BY c.customer_id, c.first_name, c.last_name ORDER BY orders DESC LIMIT 20""",
+    """SELECT p.product_name, i.stock_level, s.store_name
+       FROM retail.inventory i
+       JOIN retail.products p ON i.product_id = p.product_id
+       JOIN retail.stores s ON i.store_id = s.store_id
+       WHERE i.stock_level < 10 ORDER BY i.stock_level LIMIT 20""",
+]
+
+# The same kinds of questions, answered by the query template tools
+TEMPLATE_CALLS = [
+    ("sales_by_period", {"granularity": "month", "start_date": "2025-01-01", "end_date": "2025-12-31", "max_rows": 12}),
+    ("sales_by_period", {"granularity": "quarter", "category": "POWER TOOLS"}),
+    ("sales_by_period", {"granularity": "day", "store": "Seattle", "max_rows": 20}),
+    ("top_products", {"metric": "revenue", "max_rows": 20}),
+    ("top_products", {"metric": "units", "start_date": "2025-01-01", "end_date": "2025-06-30"}),
+    ("inventory_by_store", {"low_stock_threshold": 10, "max_rows": 20}),
+]
+
+PRODUCT_NAMES = ["paint", "drill", "hammer", "screw", "light", "tile", "saw", "hose", "glove", "ladder",
+                 "brush", "wrench", "lumber", "faucet", "outlet", "tape"]
+
+SEMANTIC_QUERIES = [
+    "waterproof electrical box for outdoor use",
+    "15 amp circuit breaker",
+    "cordless drill with two batteries",
+    "paint for a bathroom ceiling",
+    "garden hose that does not kink",
+    "LED bulbs for a living room",
+    "safety glasses for woodworking",
+    "adhesive for ceramic tiles",
+]
+
+
+@dataclass
+class CallResult:
+    """Outcome of one timed request."""
+    name: str
+    seconds: float
+    ok: bool
+    error: str = ""
+
+
+class Recorder:
+    """Collects timings per tool and per scenario once the warm-up is over."""
+
+    def __init__(self) -> None:
+        self.recording = False
+        self.operations: Dict[str, List[Tuple[float, bool]]] = {}
+        self.scenarios: Dict[str, List[Tuple[float, bool]]] = {}
+        self.error_samples: Dict[str, List[str]] = {}
+
+    def add_call(self, result: CallResult) -> None:
+        if not self.recording:
+            return
+        self.operations.setdefault(result.name, []).append((result.seconds, result.ok))
+        if not result.ok:
+            samples = self.error_samples.setdefault(result.name, [])
+            if len(samples) < 5:
+                samples.append(result.error[:300])
+
+    def add_scenario(self, name: str, seconds: float, ok: bool) -> None:
+        if self.recording:
+            self.scenarios.setdefault(name, []).append((seconds, ok))
+
+
+async def call_tool(session: ClientSession, recorder: Recorder, tool: str, arguments: Dict[str, Any]) -> bool:
+    """Call one tool and record its latency and outcome."""
+    started = time.perf_counter()
+    try:
+        result = await session.call_tool(tool, arguments)
+        text = "".join(getattr(item, "text", "") for item in result.content)
+        ok = not result.isError and not text.startswith("Error")
+        error = "" if ok else text
+    except Exception as e:
+        ok = False
+        error = f"{type(e).__name__}: {e}"
+    recorder.add_call(CallResult(tool, time.perf_counter() - started, ok, error))
+    return ok
+
+
+async def schema_then_query(session: ClientSession, recorder: Recorder, rng: random.Random) -> bool:
+    """Agent pattern for sales analysis: fetch the schemas, then run a query over them."""
+    if not await call_tool(session, recorder, "get_multiple_table_schemas", {"table_names": rng.choice(SCHEMA_TABLES)}):
+        return False
+    return await call_tool(session, recorder, "execute_sales_query", {"postgresql_query": rng.choice(ANALYTIC_QUERIES)})
+
+
+async def template_query(session: ClientSession, recorder: Recorder, rng: random.Random) -> bool:
+    """The same questions through the query template tools: one call, no schema fetch."""
+    tool, arguments = rng.choice(TEMPLATE_CALLS)
+    return await call_tool(session, recorder, tool, arguments)
+
+
+async def name_lookup(session: ClientSession, recorder: Recorder, rng: random.Random) -> bool:
+    """Product lookup by (partial) name."""
+    return await call_tool(session, recorder, "get_products_by_name",
+                           {"product_name": rng.choice(PRODUCT_NAMES), "max_rows": rng.choice([5, 10, 20])})
+
+
+async def semantic_search(session: ClientSession, recorder: Recorder, rng: random.Random) -> bool:
+    """Natural-language product search (embedding + pgvector similarity)."""
+    return await call_tool(session, recorder, "semantic_search_products",
+                           {"query_description": rng.choice(SEMANTIC_QUERIES), "max_rows": 10})
+
+
+@dataclass
+class Scenario:
+    """A repeatable sequence of tool calls against one server."""
+    name: str
+    server: str
+    run: Callable[[ClientSession, Recorder, random.Random], Awaitable[bool]]
+    weight: float
+
+
+SCENARIOS = {
+    "schema_then_query": Scenario("schema_then_query", "sales", schema_then_query, 0.5),
+    # Off by default so earlier baselines stay comparable; enable with --mix
+    "template_query": Scenario("template_query", "sales", template_query, 0.0),
+    "name_lookup": Scenario("name_lookup", "customer", name_lookup, 0.3),
+    "semantic_search": Scenario("semantic_search", "semantic", semantic_search, 0.2),
+}
+
+
+async def virtual_user(user: int, urls: Dict[str, str], scenarios: List[Scenario], rls_ids: List[str],
+                       recorder: Recorder, deadline: float, iterations_per_session: int, seed: int) -> None:
+    """Run scenarios until the deadline, opening a fresh MCP session for every few iterations."""
+    rng = random.Random(seed + user)
+    weights = [scenario.weight for scenario in scenarios]
+
+    while time.monotonic() < deadline:
+        scenario = rng.choices(scenarios, weights)[0]
+        headers = {"x-rls-user-id": rng.choice(rls_ids)}
+        started = time.perf_counter()
+        try:
+            async with streamablehttp_client(urls[scenario.server], headers=headers) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    recorder.add_call(CallResult("session.initialize", time.perf_counter() - started, True))
+                    for _ in range(iterations_per_session):
+                        if time.monotonic() >= deadline:
+                            break
+                        scenario_started = time.perf_counter()
+                        ok = await scenario.run(session, recorder, rng)
+                        recorder.add_scenario(scenario.name, time.perf_counter() - scenario_started, ok)
+        except Exception as e:
+            # Connection-level failures (refused, reset, timeouts) count against the session
+            recorder.add_call(CallResult("session.initialize", time.perf_counter() - started, False,
+                                         f"{type(e).__name__}: {e}"))
+            await asyncio.sleep(0.1)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples: List[Tuple[float, bool]], elapsed: float) -> Dict[str, Any]:
+    """Throughput, error rate and latency percentiles (milliseconds) of a list of samples."""
+    latencies = sorted(seconds for seconds, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput_per_s": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def load_rls_ids(postgres_url: str) -> List[str]:
+    """Store manager ids from retail.stores plus the super manager."""
+    import asyncpg
+
+    conn = await asyncpg.connect(postgres_url)
+    try:
+        rows = await conn.fetch("SELECT DISTINCT rls_user_id::text AS rls_user_id FROM retail.stores")
+    finally:
+        await conn.close()
+    return [SUPER_MANAGER_UUID] + [row["rls_user_id"] for row in rows if row["rls_user_id"]]
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """List the operations and scenarios that got slower, slower to serve or less reliable."""
+    regressions = []
+    for section in ("scenarios", "operations"):
+        for name, now in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before or not before["count"] or not now["count"]:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if before[key] > 0 and now[key] > before[key] * (1 + threshold):
+                    regressions.append(f"{section[:-1]} {name}: {key} {before[key]:.1f} -> {now[key]:.1f}")
+            # Session setups per second only follow from the call rate, so only compare their latency
+            if name != "session.initialize" and now["throughput_per_s"] < before["throughput_per_s"] * (1 - threshold):
+                regressions.append(f"{section[:-1]} {name}: throughput "
+                                   f"{before['throughput_per_s']:.1f}/s -> {now['throughput_per_s']:.1f}/s")
+            if now["error_rate"] > before["error_rate"] + 0.01:
+                regressions.append(f"{section[:-1]} {name}: error rate "
+                                   f"{before['error_rate']:.1%} -> {now['error_rate']:.1%}")
+    return regressions
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, Any]]) -> None:
+    print(f"\n{title}")
+    print(f"  {'name':<28} {'count':>7} {'err%':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in sorted(rows.items()):
+        print(f"  {name:<28} {s['count']:>7} {s['error_rate'] * 100:>6.1f} {s['throughput_per_s']:>8.1f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+
+
+async def run(args: argparse.Namespace) -> int:
+    urls = {"sales": args.sales_url, "customer": args.customer_url, "semantic": args.semantic_url}
+    weights = dict(item.split("=", 1) for item in args.mix.split(",")) if args.mix else {}
+
+    scenarios = []
+    for name, scenario in SCENARIOS.items():
+        weight = float(weights.get(name, scenario.weight))
+        if urls[scenario.server] and weight > 0:
+            scenarios.append(Scenario(scenario.name, scenario.server, scenario.run, weight))
+    if not scenarios:
+        print("❌ No scenarios to run: pass at least one of --sales-url, --customer-url, --semantic-url")
+        return 2
+
+    if args.rls_ids:
+        rls_ids = [rls_id.strip() for rls_id in args.rls_ids.split(",") if rls_id.strip()]
+    else:
+        try:
+            rls_ids = await load_rls_ids(args.postgres_url)
+        except Exception as e:
+            print(f"⚠️  Could not read store manager ids ({e}); using the super manager only")
+            rls_ids = [SUPER_MANAGER_UUID]
+
+    print(f"🚀 {args.users} virtual users for {args.duration:.0f}s (+{args.warmup:.0f}s warm-up)")
+    print(f"   Scenarios: {', '.join(f'{s.name}={s.weight:g}' for s in scenarios)}")
+    print(f"   RLS user ids: {len(rls_ids)}")
+
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + args.warmup + args.duration
+    tasks = [
+        asyncio.create_task(virtual_user(user, urls, scenarios, rls_ids, recorder, deadline,
+                                         args.iterations_per_session, args.seed))
+        for user in range(args.users)
+    ]
+    await asyncio.sleep(args.warmup)
+    recorder.recording = True
+    measure_started = time.monotonic()
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - measure_started
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "urls": {key: url for key, url in urls.items() if url},
+            "users": args.users,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "iterations_per_session": args.iterations_per_session,
+            "mix": {s.name: s.weight for s in scenarios},
+            "rls_user_ids": len(rls_ids),
+            "seed": args.seed,
+        },
+        "elapsed_s": elapsed,
+        "scenarios": {name: summarize(samples, elapsed) for name, samples in recorder.scenarios.items()},
+        "operations": {name: summarize(samples, elapsed) for name, samples in recorder.operations.items()},
+        "tool_calls": summarize([sample for name, samples in recorder.operations.items()
+                                 if name != "session.initialize" for sample in samples], elapsed),
+        "error_samples": recorder.error_samples,
+    }
+
+    print_table("Scenarios", results["scenarios"])
+    print_table("Operations", results["operations"])
+    totals = results["tool_calls"]
+    print(f"\n📊 {totals['count']} tool calls in {elapsed:.1f}s: {totals['throughput_per_s']:.1f} calls/s, "
+          f"p95 {totals['p95_ms']:.1f} ms, errors {totals['error_rate']:.1%}")
+    for name, samples in recorder.error_samples.items():
+        print(f"   ⚠️  {name}: {samples[0]}")
+
+    output = args.output or f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        changed = [key for key in ("users", "mix", "iterations_per_session")
+                   if baseline.get("config", {}).get(key) != results["config"][key]]
+        if changed:
+            print(f"\n⚠️  Baseline was run with different {', '.join(changed)}; throughput is not comparable")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions against {args.baseline} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"\n✅ No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the Zava MCP servers over streamable HTTP")
+    parser.add_argument("--sales-url", help="sales_analysis.py endpoint, e.g. http://127.0.0.1:8000/mcp")
+    parser.add_argument("--customer-url", help="customer_sales.py endpoint")
+    parser.add_argument("--semantic-url", help="customer_sales_semantic_search.py endpoint")
+    parser.add_argument("--users", type=int, default=16, help="Concurrent virtual users (default: 16)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds (default: 30)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before that (default: 5)")
+    parser.add_argument("--iterations-per-session", type=int, default=5,
+                        help="Scenario runs per MCP session before reconnecting (default: 5)")
+    parser.add_argument("--mix", help="Scenario weights, e.g. schema_then_query=5,name_lookup=3,semantic_search=2")
+    parser.add_argument("--rls-ids", help="Comma-separated x-rls-user-id values (default: read from retail.stores)")
+    parser.add_argument("--postgres-url", default=os.getenv("POSTGRES_URL", "postgresql://store_manager:StoreManager123!@db:5432/zava"),
+                        help="Database to read store manager ids from (default: POSTGRES_URL)")
+    parser.add_argument("--output", help="Results JSON (default: load_test_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative latency/throughput change counted as a regression (default: 0.2)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the call mix (default: 1)")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""
+Query benchmark for the Zava retail schema at several data scales.
+
+Measures how the SQL behind the MCP tools behaves as the data grows. For each
+scale (10k, 100k and 1M customers by default) a separate database such as
+zava_bench_100k is built once with data/database/generate_zava_postgres.py,
+then every case is run under two RLS contexts: the super manager, which
+sees every row, and a store manager, for whom the row level security
+policies filter each table.
+
+Cases:
+- the provider methods the tools call (product name lookup, pgvector
+  similarity search, table schema metadata)
+- a canonical set of agent-style analytic queries, run through the same
+  execute_query() path as execute_sales_query
+
+Each case is timed over several runs after a warm-up. The EXPLAIN (ANALYZE,
+BUFFERS) plan of every analytic query is recorded too. Results are saved as
+JSON. With --baseline, any case whose median time grew by more than
+--threshold, or whose plan changed shape (for example an index scan turning
+into a sequential scan), is flagged and the script exits with status 1.
+
+Connect as store_manager (the default): the postgres superuser bypasses row
+level security, so the store manager numbers would be meaningless.
+
+Usage:
+    # Build any missing datasets (slow at 1M customers), then benchmark them
+    python query_benchmark.py --build --output results/queries_baseline.json
+
+    # Only the existing zava database, compared against an earlier run
+    python query_benchmark.py --database zava --baseline results/queries_baseline.json
+
+    # Row level security before/after: the EXISTS policies against the fast store-id policies
+    python query_benchmark.py --database zava --compare-rls-policies
+
+    # Datasets with orders partitioned by year, kept apart from the unpartitioned ones
+    python query_benchmark.py --build --partition-orders year --database-prefix zava_part
+
+    # Cost of running agent queries in a read-only transaction, against the session-level path
+    python query_benchmark.py --database zava --compare-read-only --no-plans
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+_MCP_SERVER_DIR = Path(__file__).resolve().parent.parent
+for _server_dir in ("customer_sales", "sales_analysis"):
+    if str(_MCP_SERVER_DIR / _server_dir) not in sys.path:
+        sys.path.insert(0, str(_MCP_SERVER_DIR / _server_dir))
+
+GENERATOR = _MCP_SERVER_DIR.parent.parent.parent / "data" / "database" / "generate_zava_postgres.py"
+if str(GENERATOR.parent) not in sys.path:
+    sys.path.append(str(GENERATOR.parent))
+
+from customer_sales_postgres import PostgreSQLCustomerSales  # noqa: E402
+import sales_analysis_postgres  # noqa: E402
+from order_partitions import PARTITION_SCHEMES, current_partitioning  # noqa: E402
+from rls_policies import POLICY_SETS, SUPER_MANAGER_UUID, apply_rls_policies, current_policy_set  # noqa: E402
+from sales_analysis_postgres import PostgreSQLSchemaProvider  # noqa: E402
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+SCHEMA_TABLES = ["retail.orders", "retail.order_items", "retail.customers", "retail.products"]
+
+# Agent-style analytic queries, as written after fetching the table schemas
+ANALYTIC_QUERIES = {
+    "revenue_by_store": """
+        SELECT s.store_name, SUM(oi.total_amount) AS revenue, COUNT(DISTINCT o.order_id) AS orders
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id
+        JOIN retail.stores s ON o.store_id = s.store_id
+        GROUP BY s.store_name ORDER BY revenue DESC LIMIT 20""",
+    "revenue_by_category": """
+        SELECT c.category_name, SUM(oi.total_amount) AS revenue, SUM(oi.quantity) AS units
+        FROM retail.order_items oi
+        JOIN retail.products p ON oi.product_id = p.product_id
+        JOIN retail.categories c ON p.category_id = c.category_id
+        GROUP BY c.category_name ORDER BY revenue DESC LIMIT 20""",
+    "monthly_revenue": """
+        SELECT DATE_TRUNC('month', o.order_date) AS month, COUNT(DISTINCT o.order_id) AS orders,
+               SUM(oi.total_amount) AS revenue
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id
+        GROUP BY month ORDER BY month DESC LIMIT 20""",
+    "revenue_one_quarter": """
+        SELECT s.store_name, SUM(oi.total_amount) AS revenue
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id
+        JOIN retail.stores s ON o.store_id = s.store_id
+        WHERE o.order_date >= DATE '2025-10-01' AND o.order_date < DATE '2026-01-01'
+        GROUP BY s.store_name ORDER BY revenue DESC, s.store_name LIMIT 20""",
+    "recent_orders_90_days": """
+        SELECT o.order_date, COUNT(*) AS orders
+        FROM retail.orders o
+        WHERE o.order_date >= (SELECT MAX(order_date) FROM retail.orders) - INTERVAL '90 days'
+        GROUP BY o.order_date ORDER BY o.order_date DESC LIMIT 20""",
+    "top_products": """
+        SELECT p.product_name, SUM(oi.quantity) AS units, SUM(oi.total_amount) AS revenue
+        FROM retail.order_items oi
+        JOIN retail.products p ON oi.product_id = p.product_id
+        GROUP BY p.product_name ORDER BY revenue DESC LIMIT 20""",
+    "top_customers": """
+        SELECT c.customer_id, c.first_name, c.last_name, COUNT(o.order_id) AS orders
+        FROM retail.customers c
+        JOIN retail.orders o ON c.customer_id = o.customer_id
+        GROUP BY c.customer_id, c.first_name, c.last_name ORDER BY orders DESC, c.customer_id LIMIT 20""",
+    "customer_count_by_store": """
+        SELECT s.store_name, COUNT(*) AS customers
+        FROM retail.customers c
+        JOIN retail.stores s ON c.primary_store_id = s.store_id
+        GROUP BY s.store_name ORDER BY customers DESC, s.store_name LIMIT 20""",
+    "average_order_value": """
+        SELECT s.store_name, AVG(order_total) AS average_order_value
+        FROM (SELECT o.order_id, o.store_id, SUM(oi.total_amount) AS order_total
+              FROM retail.orders o JOIN retail.order_items oi ON o.order_id = oi.order_id
+              GROUP BY o.order_id, o.store_id) t
+        JOIN retail.stores s ON t.store_id = s.store_id
+        GROUP BY s.store_name ORDER BY average_order_value DESC LIMIT 20""",
+    "low_stock": """
+        SELECT p.product_name, s.store_name, i.stock_level
+        FROM retail.inventory i
+        JOIN retail.products p ON i.product_id = p.product_id
+        JOIN retail.stores s ON i.store_id = s.store_id
+        WHERE i.stock_level < 10 ORDER BY i.stock_level LIMIT 20""",
+    "dashboard_category_month": """
+        SELECT c.category_name, DATE_TRUNC('month', o.order_date)::date AS month, SUM(oi.total_amount) AS revenue,
+               SUM(oi.quantity) AS units, SUM(oi.total_amount - oi.quantity * p.cost) AS gross_margin
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id
+        JOIN retail.products p ON oi.product_id = p.product_id
+        JOIN retail.categories c ON p.category_id = c.category_id
+        WHERE o.order_date >= DATE '2025-01-01' AND o.order_date < DATE '2026-01-01'
+        GROUP BY c.category_name, month ORDER BY revenue DESC, c.category_name, month LIMIT 20""",
+    "dashboard_store_year": """
+        SELECT s.store_name, SUM(oi.total_amount) AS revenue, SUM(oi.quantity) AS units,
+               SUM(oi.total_amount - oi.quantity * p.cost) AS gross_margin
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id
+        JOIN retail.products p ON oi.product_id = p.product_id
+        JOIN retail.stores s ON o.store_id = s.store_id
+        WHERE o.order_date >= DATE '2025-01-01' AND o.order_date < DATE '2026-01-01'
+        GROUP BY s.store_name ORDER BY revenue DESC, s.store_name LIMIT 20""",
+}
+
+# The dashboard queries answered from the sales rollup tables, for databases that have them.
+# Their results must match the raw versions exactly.
+ROLLUP_QUERIES = {
+    "dashboard_category_month_rollup": """
+        SELECT category_name, sale_month AS month, SUM(revenue) AS revenue, SUM(units) AS units,
+               SUM(gross_margin) AS gross_margin
+        FROM retail.sales_monthly
+        WHERE sale_month >= DATE '2025-01-01' AND sale_month < DATE '2026-01-01'
+        GROUP BY category_name, month ORDER BY revenue DESC, category_name, month LIMIT 20""",
+    "dashboard_store_year_rollup": """
+        SELECT store_name, SUM(revenue) AS revenue, SUM(units) AS units, SUM(gross_margin) AS gross_margin
+        FROM retail.sales_monthly
+        WHERE sale_month >= DATE '2025-01-01' AND sale_month < DATE '2026-01-01'
+        GROUP BY store_name ORDER BY revenue DESC, store_name LIMIT 20""",
+}
+
+# Extra cases for datasets with partitioned orders: the query as written after the schema tool's
+# partitioning hint, so both tables are pruned to the quarter's partitions
+PARTITIONED_QUERIES = {
+    "revenue_one_quarter_pruned": """
+        SELECT s.store_name, SUM(oi.total_amount) AS revenue
+        FROM retail.orders o
+        JOIN retail.order_items oi ON o.order_id = oi.order_id AND o.order_date = oi.order_date
+        JOIN retail.stores s ON o.store_id = s.store_id
+        WHERE o.order_date >= DATE '2025-10-01' AND o.order_date < DATE '2026-01-01'
+          AND oi.order_date >= DATE '2025-10-01' AND oi.order_date < DATE '2026-01-01'
+        GROUP BY s.store_name ORDER BY revenue DESC, s.store_name LIMIT 20""",
+}
+
+
+# Cheapest agent query, where the cost of the query path itself shows most
+POINT_QUERY = "SELECT store_name FROM retail.stores WHERE store_id = 1"
+
+
+def timing_summary(durations: List[float]) -> Dict[str, float]:
+    """Median, p95 and min of a list of durations, in milliseconds."""
+    ordered = sorted(durations)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[p95_index] * 1000,
+        "min_ms": ordered[0] * 1000,
+        "runs": len(ordered),
+    }
+
+
+def plan_summary(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Condense an EXPLAIN (FORMAT JSON) plan into the figures worth comparing between runs."""
+    nodes: List[str] = []
+    seq_scans: List[str] = []
+
+    def walk(node: Dict[str, Any], depth: int) -> None:
+        label = node["Node Type"]
+        if "Relation Name" in node:
+            label += f" on {node['Relation Name']}"
+            if node["Node Type"] == "Seq Scan":
+                seq_scans.append(node["Relation Name"])
+        if "Index Name" in node:
+            label += f" using {node['Index Name']}"
+        nodes.append("  " * depth + label)
+        for child in node.get("Plans", []):
+            walk(child, depth + 1)
+
+    walk(plan["Plan"], 0)
+    return {
+        "total_cost": plan["Plan"]["Total Cost"],
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "rows": plan["Plan"].get("Actual Rows"),
+        "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+        "shared_read_blocks": plan["Plan"].get("Shared Read Blocks"),
+        "seq_scans": sorted(set(seq_scans)),
+        "shape": nodes,
+    }
+
+
+async def explain(url: str, sql: str, rls_user_id: str) -> Dict[str, Any]:
+    """EXPLAIN (ANALYZE, BUFFERS) a query under an RLS context."""
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute("SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+        result = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    finally:
+        await conn.close()
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]
+    return {"summary": plan_summary(plan), "plan": plan}
+
+
+async def time_case(run: Callable[[], Awaitable[str]], warmup: int, repeat: int) -> Tuple[Dict[str, float], str]:
+    """Run a case `warmup` times untimed, then `repeat` times timed."""
+    result = ""
+    for _ in range(warmup):
+        result = await run()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await run()
+        durations.append(time.perf_counter() - started)
+    return timing_summary(durations), result
+
+
+def result_error(result: str) -> Optional[str]:
+    """The error message of a provider result, if it reports one."""
+    if result.startswith("Error"):
+        return result[:300]
+    try:
+        data = json.loads(result)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and data.get("error"):
+        return str(data["error"])[:300]
+    return None
+
+
+async def read_only_overhead(provider: PostgreSQLSchemaProvider, queries: Dict[str, str], rls_user_id: str,
+                             warmup: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Median time of each query through execute_query() in a read-only transaction
+    (BEGIN READ ONLY + SET LOCAL, then COMMIT) and through the session-level
+    set_config path it replaced. The two paths are timed alternately.
+    """
+    original = sales_analysis_postgres.READ_ONLY_QUERIES
+    overhead: Dict[str, Dict[str, float]] = {}
+    try:
+        for name, sql in {"point_lookup": POINT_QUERY, **queries}.items():
+            durations: Dict[bool, List[float]] = {False: [], True: []}
+            for read_only in (False, True):
+                sales_analysis_postgres.READ_ONLY_QUERIES = read_only
+                for _ in range(warmup):
+                    await provider.execute_query(sql, rls_user_id=rls_user_id)
+            for _ in range(repeat):
+                for read_only in (False, True):
+                    sales_analysis_postgres.READ_ONLY_QUERIES = read_only
+                    started = time.perf_counter()
+                    await provider.execute_query(sql, rls_user_id=rls_user_id)
+                    durations[read_only].append(time.perf_counter() - started)
+            session_ms = timing_summary(durations[False])["median_ms"]
+            read_only_ms = timing_summary(durations[True])["median_ms"]
+            overhead[name] = {"session_median_ms": session_ms, "read_only_median_ms": read_only_ms,
+                              "overhead_ms": read_only_ms - session_ms}
+            print(f"   read-only      {name:<42} {read_only_ms - session_ms:+8.2f} ms "
+                  f"({session_ms:.2f} -> {read_only_ms:.2f} ms)")
+    finally:
+        sales_analysis_postgres.READ_ONLY_QUERIES = original
+    return overhead
+
+
+async def benchmark_database(url: str, store_manager_id: Optional[str], warmup: int, repeat: int,
+                             with_plans: bool, compare_read_only: bool = False) -> Dict[str, Any]:
+    """Run every case against one database under the super manager and a store manager."""
+    conn = await asyncpg.connect(url)
+    try:
+        # Row counts as the super manager see the whole dataset
+        await conn.execute("SELECT set_config('app.current_rls_user_id', $1, false)", SUPER_MANAGER_UUID)
+        row_counts = {}
+        for table in ("customers", "orders", "order_items", "inventory", "products"):
+            row_counts[table] = await conn.fetchval(f"SELECT COUNT(*) FROM retail.{table}")
+        partitioning = await current_partitioning(conn, "retail")
+        has_rollups = bool(await conn.fetchval("SELECT to_regclass('retail.sales_monthly')"))
+        if store_manager_id is None:
+            store_manager_id = await conn.fetchval(
+                "SELECT rls_user_id::text FROM retail.stores ORDER BY store_id LIMIT 1")
+        embedding_text = await conn.fetchval(
+            "SELECT description_embedding::text FROM retail.product_description_embeddings "
+            "WHERE description_embedding IS NOT NULL ORDER BY product_id LIMIT 1")
+    finally:
+        await conn.close()
+    query_embedding = json.loads(embedding_text) if embedding_text else None
+
+    contexts = {"super_manager": SUPER_MANAGER_UUID, "store_manager": store_manager_id}
+    customer_sales = PostgreSQLCustomerSales(url)
+    schema_provider = PostgreSQLSchemaProvider(url)
+    await customer_sales.create_pool()
+    await schema_provider.create_pool()
+
+    queries = dict(ANALYTIC_QUERIES)
+    if partitioning != "none":
+        queries.update(PARTITIONED_QUERIES)
+    if has_rollups:
+        queries.update(ROLLUP_QUERIES)
+
+    cases: Dict[str, Dict[str, Any]] = {}
+    try:
+        for context, rls_user_id in contexts.items():
+            runs: Dict[str, Callable[[], Awaitable[str]]] = {
+                "provider.get_products_by_name": lambda rls=rls_user_id: customer_sales.get_products_by_name(
+                    "paint", 20, rls_user_id=rls),
+            }
+            if query_embedding is not None:
+                runs["provider.search_products_by_similarity"] = lambda rls=rls_user_id: (
+                    customer_sales.search_products_by_similarity(query_embedding, rls_user_id=rls, max_rows=10))
+
+            async def table_metadata(rls: str = rls_user_id) -> str:
+                # The servers build a fresh provider per request, so measure without the schema cache
+                schema_provider._schema_cache = {}
+                return await schema_provider.get_table_metadata_from_list(SCHEMA_TABLES, rls_user_id=rls)
+
+            runs["provider.get_table_metadata_from_list"] = table_metadata
+            for name, sql in queries.items():
+                runs[f"query.{name}"] = lambda sql=sql, rls=rls_user_id: schema_provider.execute_query(sql, rls_user_id=rls)
+
+            for name, run in runs.items():
+                timing, result = await time_case(run, warmup, repeat)
+                entry: Dict[str, Any] = dict(timing)
+                # Lets runs under different RLS policy sets check they returned the same rows
+                entry["result_hash"] = hashlib.sha256(result.encode("utf-8")).hexdigest()[:16]
+                error = result_error(result)
+                if error:
+                    entry["error"] = error
+                if with_plans and name.startswith("query."):
+                    entry.update(await explain(url, queries[name[len("query."):]], rls_user_id))
+                cases.setdefault(name, {})[context] = entry
+                status = f"⚠️  {error[:80]}" if error else f"{timing['median_ms']:8.1f} ms median"
+                print(f"   {context:<14} {name:<42} {status}")
+
+        read_only = None
+        if compare_read_only:
+            read_only = await read_only_overhead(schema_provider, queries, store_manager_id, warmup, repeat)
+    finally:
+        await customer_sales.close_pool()
+        await schema_provider.close_pool()
+
+    for context in contexts:
+        for name in ROLLUP_QUERIES:
+            rollup = cases.get(f"query.{name}", {}).get(context)
+            raw = cases.get(f"query.{name[:-len('_rollup')]}", {}).get(context)
+            if rollup and raw:
+                rollup["matches_raw"] = rollup["result_hash"] == raw["result_hash"]
+                speedup = raw["median_ms"] / rollup["median_ms"] if rollup["median_ms"] else float("inf")
+                print(f"   {context:<14} {name:<42} {speedup:8.1f}x faster than raw"
+                      + ("" if rollup["matches_raw"] else "  ⚠️  results differ from raw"))
+
+    data = {"row_counts": row_counts, "partitioning": partitioning, "has_rollups": has_rollups,
+            "store_manager_id": store_manager_id, "cases": cases}
+    if read_only is not None:
+        data["read_only_overhead"] = read_only
+    return data
+
+
+async def database_exists(admin_url: str, database: str) -> bool:
+    conn = await asyncpg.connect(admin_url)
+    try:
+        return bool(await conn.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", database))
+    finally:
+        await conn.close()
+
+
+async def build_dataset(admin_url: str, database: str, num_customers: int, rebuild: bool,
+                        partitioning: str = "none") -> None:
+    """Create `database` and fill it with generate_zava_postgres.py at the given scale."""
+    conn = await asyncpg.connect(admin_url)
+    try:
+        if rebuild:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{database}"')
+        await conn.execute(f'CREATE DATABASE "{database}"')
+        await conn.execute(f'GRANT CONNECT ON DATABASE "{database}" TO store_manager')
+    finally:
+        await conn.close()
+
+    print(f"🏗️  Generating {num_customers:,} customers into {database} (this can take a long time)...")
+    started = time.monotonic()
+    subprocess.run([sys.executable, str(GENERATOR), "--num-customers", str(num_customers), "--database", database,
+                    "--partition-orders", partitioning],
+                   cwd=GENERATOR.parent, check=True)
+    print(f"✅ Built {database} in {time.monotonic() - started:.0f}s")
+
+
+def database_url(admin_url: str, database: str) -> str:
+    """The admin URL pointed at another database."""
+    return f"{admin_url.rsplit('/', 1)[0]}/{database}"
+
+
+async def switch_rls_policies(admin_url: str, database: str, policy_set: str) -> str:
+    """Install `policy_set` on `database` and return the set that was installed before."""
+    conn = await asyncpg.connect(database_url(admin_url, database))
+    try:
+        previous = await current_policy_set(conn, "retail")
+        await apply_rls_policies(conn, "retail", policy_set)
+        return previous
+    finally:
+        await conn.close()
+
+
+def compare_policy_sets(datasets: Dict[str, Any], database: str) -> List[str]:
+    """Print the store manager speedup of the fast policy set and list cases whose results differ."""
+    exists_cases = datasets[f"{database}@exists"]["cases"]
+    fast_cases = datasets[f"{database}@fast"]["cases"]
+    mismatches = []
+    print(f"\n⚖️  {database}: store manager median, exists -> fast policies")
+    for case, contexts in exists_cases.items():
+        for context, before in contexts.items():
+            after = fast_cases.get(case, {}).get(context)
+            if not after:
+                continue
+            if before.get("result_hash") != after.get("result_hash"):
+                mismatches.append(f"{database} {context} {case}: results differ between policy sets")
+            if context == "store_manager" and "error" not in before and "error" not in after:
+                speedup = before["median_ms"] / after["median_ms"] if after["median_ms"] else float("inf")
+                print(f"   {case:<42} {before['median_ms']:8.1f} -> {after['median_ms']:8.1f} ms  ({speedup:.1f}x)")
+    return mismatches
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """List cases that got slower or whose plan changed shape since the baseline run."""
+    regressions = []
+    for dataset, data in current["datasets"].items():
+        before_cases = baseline.get("datasets", {}).get(dataset, {}).get("cases", {})
+        for case, contexts in data["cases"].items():
+            for context, now in contexts.items():
+                before = before_cases.get(case, {}).get(context)
+                if not before:
+                    continue
+                label = f"{dataset} {context} {case}"
+                if "error" in now and "error" not in before:
+                    regressions.append(f"{label}: now fails ({now['error'][:80]})")
+                    continue
+                delta = now["median_ms"] - before["median_ms"]
+                if delta > min_delta_ms and now["median_ms"] > before["median_ms"] * (1 + threshold):
+                    regressions.append(f"{label}: median {before['median_ms']:.1f} -> {now['median_ms']:.1f} ms")
+                if "summary" in now and "summary" in before:
+                    new_scans = set(now["summary"]["seq_scans"]) - set(before["summary"]["seq_scans"])
+                    if new_scans:
+                        regressions.append(f"{label}: new sequential scan on {', '.join(sorted(new_scans))}")
+                    elif now["summary"]["shape"] != before["summary"]["shape"]:
+                        regressions.append(f"{label}: plan changed")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> int:
+    if args.database:
+        datasets = {args.database: None}
+    else:
+        datasets = {f"{args.database_prefix}_{scale}": SCALES[scale] for scale in args.scales.split(",")}
+
+    results: Dict[str, Any] = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {"warmup": args.warmup, "repeat": args.repeat, "store_manager_id": args.store_manager_id,
+                   "partition_orders": args.partition_orders,
+                   "plans": not args.no_plans, "rls_policies": args.rls_policies,
+                   "compare_rls_policies": args.compare_rls_policies,
+                   "compare_read_only": args.compare_read_only},
+        "datasets": {},
+    }
+    mismatches: List[str] = []
+
+    for database, num_customers in datasets.items():
+        if num_customers is not None and (args.rebuild or not await database_exists(args.admin_url, database)):
+            if not (args.build or args.rebuild):
+                print(f"⏭️  Skipping {database}: it does not exist (pass --build to generate it)")
+                continue
+            await build_dataset(args.admin_url, database, num_customers, args.rebuild, args.partition_orders)
+
+        url = args.url_template.format(database=database)
+        if not args.compare_rls_policies:
+            if args.rls_policies:
+                await switch_rls_policies(args.admin_url, database, args.rls_policies)
+            print(f"\n📊 {database}")
+            data = await benchmark_database(url, args.store_manager_id, args.warmup, args.repeat, not args.no_plans,
+                                            args.compare_read_only)
+            data["num_customers"] = num_customers or data["row_counts"]["customers"]
+            print(f"   rows: {', '.join(f'{table}={count:,}' for table, count in data['row_counts'].items())}")
+            results["datasets"][database] = data
+            continue
+
+        # Before/after: the same cases under each policy set, then restore the original set
+        original = None
+        try:
+            for policy_set in POLICY_SETS:
+                previous = await switch_rls_policies(args.admin_url, database, policy_set)
+                original = original or previous
+                print(f"\n📊 {database} ({policy_set} RLS policies)")
+                data = await benchmark_database(url, args.store_manager_id, args.warmup, args.repeat,
+                                                not args.no_plans)
+                data["num_customers"] = num_customers or data["row_counts"]["customers"]
+                data["rls_policies"] = policy_set
+                results["datasets"][f"{database}@{policy_set}"] = data
+        finally:
+            if original:
+                await switch_rls_policies(args.admin_url, database, original)
+        mismatches.extend(compare_policy_sets(results["datasets"], database))
+
+    if not results["datasets"]:
+        print("❌ Nothing was benchmarked")
+        return 2
+
+    output = args.output or f"query_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\n💾 Results saved to {output}")
+
+    if mismatches:
+        print(f"\n❌ {len(mismatches)} cases returned different results under the two RLS policy sets:")
+        for line in mismatches:
+            print(f"   {line}")
+        return 1
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions against {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"\n✅ No regressions against {args.baseline}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the MCP servers' SQL at several data scales")
+    parser.add_argument("--scales", default="10k,100k,1m",
+                        help=f"Comma-separated dataset scales from {', '.join(SCALES)} (default: all)")
+    parser.add_argument("--database", help="Benchmark only this existing database instead of the scaled datasets")
+    parser.add_argument("--database-prefix", default="zava_bench", help="Scaled databases are <prefix>_<scale>")
+    parser.add_argument("--build", action="store_true", help="Generate scaled datasets that do not exist yet")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and regenerate the scaled datasets")
+    parser.add_argument("--partition-orders", choices=PARTITION_SCHEMES, default="none",
+                        help="Order partitioning of datasets built by --build/--rebuild (default: none)")
+    parser.add_argument("--url-template", default=os.getenv(
+        "BENCHMARK_URL_TEMPLATE", "postgresql://store_manager:StoreManager123!@db:5432/{database}"),
+        help="Connection URL for the benchmark, with {database} (default: store_manager at db:5432)")
+    parser.add_argument("--admin-url", default=os.getenv("BENCHMARK_ADMIN_URL", "postgresql://postgres:P@ssw0rd!@db:5432/postgres"),
+                        help="Superuser connection used to create the datasets and switch RLS policies")
+    parser.add_argument("--rls-policies", choices=POLICY_SETS,
+                        help="Install this RLS policy set before benchmarking (default: leave the database as it is)")
+    parser.add_argument("--compare-rls-policies", action="store_true",
+                        help="Benchmark each dataset under every RLS policy set, check the results match and "
+                             "report the store manager speedup; the original policies are restored afterwards")
+    parser.add_argument("--compare-read-only", action="store_true",
+                        help="Also time every analytic query as the store manager through the read-only "
+                             "transaction path and the session-level path, and report the difference")
+    parser.add_argument("--store-manager-id", help="RLS user id for the store manager runs (default: first store)")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per case (default: 2)")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per case (default: 10)")
+    parser.add_argument("--no-plans", action="store_true", help="Skip EXPLAIN ANALYZE of the analytic queries")
+    parser.add_argument("--output", help="Results JSON (default: query_benchmark_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative slowdown of the median counted as a regression (default: 0.25)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="Ignore slowdowns smaller than this many milliseconds (default: 2)")
+    args = parser.parse_args()
+
+    unknown = [scale for scale in args.scales.split(",") if scale not in SCALES]
+    if unknown and not args.database:
+        parser.error(f"Unknown scales {unknown}; choose from {', '.join(SCALES)}")
+
+    if args.rls_policies and args.compare_rls_policies:
+        parser.error("--rls-policies and --compare-rls-policies are mutually exclusive")
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
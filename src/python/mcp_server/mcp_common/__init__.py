@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the Zava MCP servers (customer_sales, sales_analysis and combined).
+
+The servers are started as scripts from their own directories, so each one adds
+src/python/mcp_server to sys.path before importing from this package.
+"""
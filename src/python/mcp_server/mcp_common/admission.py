@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Admission control for requests to the MCP servers (HTTP mode).
+
+Without it a server accepts every request at once. Under a burst each request
+opens its pool and queues for the database until it fails with "Connection
+pool exhausted" (or Postgres runs out of connection slots), and a slow
+analytic query holds up a date lookup. The AdmissionMiddleware sits in front
+of the MCP endpoint, reads the JSON-RPC method of each request, and the tool
+name of tools/call requests, and lets at most a fixed number of calls of each
+tool run at once:
+
+- a call over the limit waits in the tool's queue for a free slot, for at most
+  MCP_ADMISSION_QUEUE_TIMEOUT seconds
+- a call that finds the queue full, or that is still waiting at the deadline,
+  is answered at once with an "Error: server busy ... Retry in N seconds." tool
+  result and a Retry-After header, without opening a pool or touching the
+  database; N is estimated from the tool's recent call time and queue length
+- waiting calls are admitted round robin across RLS user ids, so one user's
+  burst does not queue everyone else behind it, and one user may hold at most
+  MCP_ADMISSION_USER_QUEUE places in a tool's queue
+
+Limits are per tool, so slow analytic calls filling their slots never delay
+quick lookups such as get_current_utc_date or get_products_by_name. A call
+keeps its slot until its response has been sent.
+
+The stateless servers set up their lifespan for the other requests too
+(initialize, tools/list, notifications), so these are limited the same way, by
+method name. A rejected request gets a JSON-RPC error with the same message,
+and a rejected notification is dropped.
+
+Only the server's tools and the MCP methods get their own limit and metric
+series. Calls of any other name, and bodies that are not a JSON-RPC request,
+share the "other" limit, so clients cannot create limits or metric series at
+will. Bodies over MCP_ADMISSION_MAX_BODY bytes are answered with HTTP 413, and
+JSON-RPC batches, which the MCP server does not accept, with HTTP 400, both
+without reaching the server.
+
+The rejection is a tool error rather than an HTTP 503 because the MCP client
+ends the whole session on an HTTP error status; as a tool result the agent sees
+the retry hint and the session stays usable.
+
+Slots and queues are kept per process (per worker, see workers.py) and shared
+by all tool sets in it.
+
+Configuration (environment):
+
+    MCP_ADMISSION                  set to 0 to admit every call at once (default: 1)
+    MCP_ADMISSION_LIMITS           per-tool (or method) limits, comma-separated name=limit,
+                                   0 for none (e.g. execute_sales_query=2,initialize=8)
+    MCP_ADMISSION_DEFAULT_LIMIT    limit of tools and methods without their own (default: 8)
+    MCP_ADMISSION_QUEUE            calls that may wait per tool (default: 32)
+    MCP_ADMISSION_USER_QUEUE       calls that may wait per tool and RLS user (default: 8)
+    MCP_ADMISSION_QUEUE_TIMEOUT    seconds a call may wait for a slot (default: 10)
+    MCP_ADMISSION_MAX_BODY         bytes a request body may have (default: 1048576)
+
+Usage:
+    app = mcp.streamable_http_app()
+    add_admission_control(app, {"execute_sales_query": 6, "get_current_utc_date": 4},
+                          tools=["execute_sales_query", "get_current_utc_date", "sales_by_period"])
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Mapping, Optional, Set, Tuple
+
+from .log import get_logger
+from .metrics import ADMISSION_CALLS, ADMISSION_DECISIONS, ADMISSION_WAIT
+
+logger = get_logger(__name__)
+
+ADMISSION = os.getenv("MCP_ADMISSION", "1") != "0"
+DEFAULT_LIMIT = int(os.getenv("MCP_ADMISSION_DEFAULT_LIMIT", "8"))
+QUEUE_SIZE = int(os.getenv("MCP_ADMISSION_QUEUE", "32"))
+USER_QUEUE_SIZE = int(os.getenv("MCP_ADMISSION_USER_QUEUE", "8"))
+QUEUE_TIMEOUT = float(os.getenv("MCP_ADMISSION_QUEUE_TIMEOUT", "10"))
+MAX_BODY = int(os.getenv("MCP_ADMISSION_MAX_BODY", str(1024 * 1024)))
+
+# Callers without an x-rls-user-id header share one fairness queue
+ANONYMOUS = "anonymous"
+# Limit of calls that are neither a registered tool nor an MCP method
+OTHER = "other"
+# Methods of the MCP protocol, limited by name like the tools
+MCP_METHODS = frozenset({
+    "initialize", "ping", "tools/list", "resources/list", "resources/templates/list", "resources/read",
+    "prompts/list", "prompts/get", "completion/complete", "logging/setLevel",
+    "notifications/initialized", "notifications/cancelled", "notifications/progress",
+    "notifications/roots/list_changed",
+})
+# JSON-RPC error code of a request the server does not accept
+INVALID_REQUEST = -32600
+# Weight of the latest call in a tool's running average call time
+_SERVICE_TIME_WEIGHT = 0.2
+MAX_RETRY_AFTER = 60
+
+
+def parse_limits(text: str) -> Dict[str, int]:
+    """Per-tool limits from "tool=limit,tool=limit"."""
+    limits = {}
+    for item in text.split(","):
+        if "=" in item:
+            tool, limit = item.split("=", 1)
+            limits[tool.strip()] = int(limit)
+    return limits
+
+
+class Rejected(Exception):
+    """A call that was not admitted, with the number of seconds after which a retry may succeed."""
+
+    def __init__(self, tool: str, limit: int, reason: str, retry_after: int) -> None:
+        super().__init__(f"Error: server busy, {limit} {tool} calls are already running "
+                         f"and {reason}. Retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+@dataclass
+class _ToolGate:
+    """Running calls and waiting calls (per RLS user, in admission order) of one tool."""
+
+    limit: int
+    running: int = 0
+    waiting: int = 0
+    queues: "OrderedDict[str, Deque[asyncio.Future]]" = field(default_factory=OrderedDict)
+    service_time: float = 1.0
+
+
+class AdmissionController:
+    """Per-tool concurrency limits with bounded, per-user fair wait queues."""
+
+    def __init__(self, limits: Optional[Mapping[str, int]] = None, default_limit: int = DEFAULT_LIMIT,
+                 queue_size: int = QUEUE_SIZE, user_queue_size: int = USER_QUEUE_SIZE,
+                 queue_timeout: float = QUEUE_TIMEOUT, enabled: bool = ADMISSION) -> None:
+        self.default_limit = default_limit
+        self.queue_size = queue_size
+        self.user_queue_size = user_queue_size
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self._defaults: Dict[str, int] = {}
+        # Limits from the environment win over the defaults the servers set
+        self._overrides = dict(limits if limits is not None else parse_limits(os.getenv("MCP_ADMISSION_LIMITS", "")))
+        self._gates: Dict[str, _ToolGate] = {}
+        # Names with their own gate; everything else is gated as OTHER
+        self._names: Set[str] = set(MCP_METHODS) | set(self._overrides)
+
+    def set_default_limits(self, limits: Mapping[str, int]) -> None:
+        """Limits of a server's tools, unless MCP_ADMISSION_LIMITS names them."""
+        self._defaults.update(limits)
+        self._names.update(limits)
+        for tool, gate in self._gates.items():
+            gate.limit = self.limit(tool)
+
+    def register(self, tools: Iterable[str]) -> None:
+        """Give a server's tools their own gate (with the default limit unless one is set)."""
+        self._names.update(tools)
+
+    def gate_name(self, tool: Optional[str]) -> str:
+        """The gate of a tool or method name from a request: its own if registered, else OTHER."""
+        return tool if isinstance(tool, str) and tool in self._names else OTHER
+
+    def limit(self, tool: str) -> int:
+        return self._overrides.get(tool, self._defaults.get(tool, self.default_limit))
+
+    def _gate(self, tool: str) -> _ToolGate:
+        gate = self._gates.get(tool)
+        if gate is None:
+            gate = self._gates[tool] = _ToolGate(self.limit(tool))
+        return gate
+
+    def stats(self) -> Dict[Tuple[str, ...], float]:
+        """Running and waiting calls per tool (for the gauge)."""
+        values: Dict[Tuple[str, ...], float] = {}
+        for tool, gate in self._gates.items():
+            values[(tool, "running")] = gate.running
+            values[(tool, "waiting")] = gate.waiting
+        return values
+
+    def retry_after(self, tool: str) -> int:
+        """Seconds until a slot is likely free: the queue ahead drained at the tool's average call time."""
+        gate = self._gate(tool)
+        rounds = gate.waiting / max(gate.limit, 1) + 1
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(gate.service_time * rounds)))
+
+    def _reject(self, tool: str, result: str, reason: str) -> Rejected:
+        ADMISSION_DECISIONS.inc(tool=tool, result=result)
+        return Rejected(tool, self._gate(tool).limit, reason, self.retry_after(tool))
+
+    async def acquire(self, tool: str, user: str) -> None:
+        """
+        Take a slot of the tool, waiting in the user's queue while all are in use.
+
+        Raises:
+            Rejected: The queue is full, or no slot became free within the queue timeout
+        """
+        gate = self._gate(tool)
+        if not self.enabled or gate.limit <= 0 or (gate.running < gate.limit and not gate.waiting):
+            gate.running += 1
+            ADMISSION_DECISIONS.inc(tool=tool, result="admitted")
+            return
+
+        queue = gate.queues.get(user)
+        if gate.waiting >= self.queue_size:
+            raise self._reject(tool, "rejected_queue_full", f"{gate.waiting} calls are waiting")
+        if queue is not None and len(queue) >= self.user_queue_size:
+            raise self._reject(tool, "rejected_user_queue_full", f"{len(queue)} of your calls are waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = gate.queues[user] = deque()
+        queue.append(future)
+        gate.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended; pass it on
+                self._hand_over(tool, gate)
+            else:
+                self._withdraw(gate, user, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(tool, "rejected_timeout",
+                                   f"no slot became free within {self.queue_timeout:g} seconds") from None
+            raise
+        finally:
+            ADMISSION_WAIT.observe(time.perf_counter() - started, tool=tool)
+        ADMISSION_DECISIONS.inc(tool=tool, result="queued")
+
+    def release(self, tool: str, seconds: float) -> None:
+        """Free a slot taken with acquire(), after a call that took `seconds`."""
+        gate = self._gate(tool)
+        gate.service_time += _SERVICE_TIME_WEIGHT * (seconds - gate.service_time)
+        self._hand_over(tool, gate)
+
+    def _hand_over(self, tool: str, gate: _ToolGate) -> None:
+        """Give a freed slot to the next waiting call, taking users in turn, or return it."""
+        while gate.queues:
+            user, queue = next(iter(gate.queues.items()))
+            future = queue.popleft()
+            gate.waiting -= 1
+            if queue:
+                gate.queues.move_to_end(user)
+            else:
+                del gate.queues[user]
+            if not future.done():
+                future.set_result(None)
+                return
+        gate.running = max(gate.running - 1, 0)
+
+    @staticmethod
+    def _withdraw(gate: _ToolGate, user: str, future: "asyncio.Future[Any]") -> None:
+        queue = gate.queues.get(user)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        gate.waiting -= 1
+        if not queue:
+            del gate.queues[user]
+
+
+# Shared by every server (and tool set) in the process
+CONTROLLER = AdmissionController()
+ADMISSION_CALLS.set_function(CONTROLLER.stats)
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to MCP requests, by tool or method."""
+
+    def __init__(self, app: Callable[[Scope, Receive, Send], Awaitable[None]],
+                 controller: AdmissionController = CONTROLLER, max_body: int = MAX_BODY) -> None:
+        self.app = app
+        self.controller = controller
+        self.max_body = max_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") != "POST" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        # Read the body to find the tool or method, then hand it on to the MCP app unchanged
+        messages = []
+        size = 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            size += len(message.get("body", b""))
+            if size > self.max_body:
+                await self._send_error(send, 413, f"Request body larger than {self.max_body} bytes")
+                return
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                break
+
+        async def replay() -> Dict[str, Any]:
+            return messages.pop(0) if messages else await receive()
+
+        try:
+            request = json.loads(b"".join(m.get("body", b"") for m in messages if m["type"] == "http.request"))
+        except ValueError:
+            request = None
+        if isinstance(request, list):
+            await self._send_error(send, 400, "Batch requests are not supported")
+            return
+        if not isinstance(request, dict):
+            # Not a JSON-RPC request; the MCP app answers it, within the OTHER limit
+            request = {"id": None}
+        tool = request.get("method")
+        if tool == "tools/call":
+            params = request.get("params")
+            tool = params.get("name") if isinstance(params, dict) else None
+        tool = self.controller.gate_name(tool)
+
+        user = _header(scope, b"x-rls-user-id") or ANONYMOUS
+        try:
+            await self.controller.acquire(tool, user)
+        except Rejected as e:
+            logger.info("Tool call rejected", extra={"fields": {"tool": tool, "rls_user_id": user,
+                                                                "retry_after": e.retry_after}})
+            await self._send_rejection(send, request, e)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            self.controller.release(tool, time.perf_counter() - started)
+
+    @staticmethod
+    async def _send_rejection(send: Send, request: Dict[str, Any], rejection: Rejected) -> None:
+        if "id" not in request:
+            # A notification gets no response; accept and drop it
+            status, body = 202, b""
+        elif request.get("method") == "tools/call":
+            status, body = 200, json.dumps({
+                "jsonrpc": "2.0", "id": request["id"],
+                "result": {"content": [{"type": "text", "text": str(rejection)}], "isError": True}}).encode()
+        else:
+            status, body = 200, json.dumps({
+                "jsonrpc": "2.0", "id": request["id"],
+                "error": {"code": -32000, "message": str(rejection), "data": {"retry_after": rejection.retry_after}}}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"retry-after", str(rejection.retry_after).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _send_error(send: Send, status: int, message: str) -> None:
+        """Answer a request the MCP app is not given with an HTTP error and a JSON-RPC error."""
+        body = json.dumps({"jsonrpc": "2.0", "id": None,
+                           "error": {"code": INVALID_REQUEST, "message": message}}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def add_admission_control(app: Any, limits: Optional[Mapping[str, int]] = None,
+                          controller: AdmissionController = CONTROLLER,
+                          tools: Optional[Iterable[str]] = None) -> None:
+    """
+    Put a Starlette app (FastMCP's streamable_http_app()) behind the admission controller.
+
+    Args:
+        app: The app, before it is started
+        limits: Concurrency limits of the server's tools and methods (0 for none); MCP_ADMISSION_LIMITS wins
+        controller: The controller to use (default: the process-wide one)
+        tools: Names of the server's tools, each gated on its own; other names share the OTHER gate
+    """
+    if limits:
+        controller.set_default_limits(limits)
+    if tools:
+        controller.register(tools)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Process-level caches of the MCP servers, invalidated across worker processes.
+
+The servers create a provider for every request, so anything worth caching is
+kept per process. With several worker processes (see workers.py) each keeps its
+own copy, and an invalidation must reach all of them: SharedCache entries expire
+after a TTL, and every cache drops all its entries when the cache generation
+changes. Any process can change the generation with invalidate_caches(), e.g.
+when it finds that the database schema changed.
+
+The generation is the modification time of a small file named by
+MCP_CACHE_GENERATION_FILE. The multi-worker supervisor creates one and its
+workers inherit the variable; servers started separately can share one by
+setting it to the same path. Without it the generation is local to the process.
+Reading it is one stat() per lookup.
+
+Configuration (environment):
+
+    MCP_CACHE_GENERATION_FILE    file whose modification time is the cache generation (default: none)
+
+Usage:
+    TABLE_SCHEMAS = SharedCache("table_schema", ttl=300)
+
+    text = TABLE_SCHEMAS.get(key)
+    if text is None:
+        text = await load(...)
+        TABLE_SCHEMAS.put(key, text)
+"""
+
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from .metrics import record_cache
+
+GENERATION_ENV = "MCP_CACHE_GENERATION_FILE"
+
+
+class Generation:
+    """Number that changes whenever any process sharing the file calls bump()."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._local = 0
+
+    def current(self) -> int:
+        if self.path is not None:
+            try:
+                return os.stat(self.path).st_mtime_ns
+            except OSError:
+                pass
+        return self._local
+
+    def bump(self) -> None:
+        self._local += 1
+        if self.path is not None:
+            now = time.time_ns()
+            try:
+                os.utime(self.path, ns=(now, now))
+            except FileNotFoundError:
+                with open(self.path, "a"):
+                    pass
+
+
+def create_generation_file() -> str:
+    """A new, empty generation file in the temp directory, for workers to share."""
+    fd, path = tempfile.mkstemp(prefix="mcp-cache-generation-")
+    os.close(fd)
+    return path
+
+
+GENERATION = Generation(os.getenv(GENERATION_ENV) or None)
+
+
+def invalidate_caches() -> None:
+    """Drop the entries of every SharedCache, in this process and all sharing the generation file."""
+    GENERATION.bump()
+
+
+class SharedCache:
+    """TTL cache of one kind of value, emptied when the cache generation changes."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024, generation: Generation = GENERATION) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = generation
+        self._generation = generation.current()
+        # key -> (stored at, value), oldest first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _sync(self) -> None:
+        generation = self.generation.current()
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, key: Hashable, max_age: Optional[float] = None) -> Optional[Any]:
+        """The value stored under key if it is younger than max_age (default: the TTL), else None."""
+        self._sync()
+        entry = self._entries.get(key)
+        hit = entry is not None and time.monotonic() - entry[0] < (self.ttl if max_age is None else max_age)
+        record_cache(self.name, hit)
+        return entry[1] if hit else None
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """The value stored under key whatever its age, without counting a lookup."""
+        self._sync()
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._sync()
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
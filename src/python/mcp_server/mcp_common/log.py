@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Structured, non-blocking logging for the Zava MCP servers.
+
+Tool calls used to print() the manager ID, row limits and full SQL text to stdout.
+In stdio mode that shares the stream with the MCP protocol, and under HTTP load
+every call serializes on a synchronous stdout write. Instead, records are:
+
+- filtered by level and, below WARNING, sampled in the calling thread before a
+  LogRecord is built, so suppressed records cost little more than the level check
+- handed to a bounded in-memory queue (dropped and counted if it is full)
+- redacted and formatted as one JSON object per line on a background thread,
+  written to stderr, never stdout
+
+RLS user ids (UUIDs) are replaced with a short stable pseudonym such as
+"rls:1a2b3c4d" in both the message and structured fields, so log lines can
+still be correlated per manager without exposing the id. Records logged inside
+a traced tool call carry its trace_id and span_id (see tracing.py).
+
+Configuration (environment variables):
+
+    MCP_LOG_LEVEL          DEBUG, INFO (default), WARNING or ERROR
+    MCP_LOG_SAMPLE_RATIO   fraction of DEBUG/INFO records to keep, 0.0-1.0 (default: 1.0)
+    MCP_LOG_REDACT         set to 0 to log RLS ids unredacted (local debugging only)
+
+Usage:
+    from mcp_common.log import configure_logging, get_logger
+
+    logger = get_logger(__name__)
+    configure_logging("mcp-zava-sales")
+
+    logger.info("tool call", extra={"fields": {"tool": "execute_sales_query", "rls_user_id": rls_user_id}})
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from .tracing import current_span
+
+ROOT_LOGGER = "zava_mcp"
+
+_UUID_PATTERN = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def redact_rls_id(value: str) -> str:
+    """Replace an RLS user id with a short, stable pseudonym."""
+    return "rls:" + hashlib.sha256(value.lower().encode("utf-8")).hexdigest()[:8]
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, str):
+        return _UUID_PATTERN.sub(lambda match: redact_rls_id(match.group(0)), value)
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(item) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single JSON object, redacting RLS ids."""
+
+    def __init__(self, service_name: str, redact: bool = True) -> None:
+        super().__init__()
+        self.service_name = service_name
+        self.redact = redact
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "service": self.service_name,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            entry.update(fields)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "fields":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if self.redact:
+            entry = _redact(entry)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _StructuredLogger(logging.Logger):
+    """
+    Logger that samples DEBUG/INFO records before a LogRecord is built, so a
+    sampled-out call costs about as much as one below the configured level.
+    """
+
+    sample_ratio = 1.0
+
+    def _log(self, level: int, msg: object, args: Any, **kwargs: Any) -> None:
+        if level < logging.WARNING and self.sample_ratio < 1.0 and random.random() >= self.sample_ratio:
+            return
+        super()._log(level, msg, args, **kwargs)
+
+    def findCaller(self, stack_info: bool = False, stacklevel: int = 1) -> Any:
+        # The JSON lines carry no file/line, so skip the stack walk
+        return "(unknown file)", 0, "(unknown function)", None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The active span lives in a context variable, so it must be read here;
+        # formatting and redaction happen on the listener thread
+        active = current_span()
+        if active is not None:
+            record.trace_id = active.trace_id
+            record.span_id = active.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[_DroppingQueueHandler] = None
+_loggers: Dict[str, _StructuredLogger] = {}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the shared zava_mcp hierarchy (configured by configure_logging)."""
+    if name == "__main__":
+        # Servers are run as scripts; name their logger after the file instead
+        main_file = getattr(sys.modules["__main__"], "__file__", None)
+        name = os.path.splitext(os.path.basename(main_file))[0] if main_file else "main"
+    full_name = f"{ROOT_LOGGER}.{name.rsplit('.', 1)[-1]}"
+
+    logger = _loggers.get(full_name)
+    if logger is None:
+        # Built directly rather than through logging.getLogger() so only these
+        # loggers use the sampling subclass; records still reach the zava_mcp handlers
+        logger = _StructuredLogger(full_name)
+        logger.parent = logging.getLogger(ROOT_LOGGER)
+        logger = _loggers.setdefault(full_name, logger)
+    return logger
+
+
+def configure_logging(service_name: str, level: Optional[str] = None, sample_ratio: Optional[float] = None,
+                      max_queue: int = 10000) -> None:
+    """
+    Route the zava_mcp loggers through a bounded queue to a JSON stderr writer thread.
+
+    Args:
+        service_name: Written as "service" on every line
+        level: Minimum level (default: MCP_LOG_LEVEL or INFO)
+        sample_ratio: Fraction of DEBUG/INFO records to keep (default: MCP_LOG_SAMPLE_RATIO or 1.0)
+        max_queue: Records buffered before new ones are dropped
+    """
+    global _listener, _handler
+
+    level = (level or os.getenv("MCP_LOG_LEVEL", "INFO")).upper()
+    if sample_ratio is None:
+        sample_ratio = float(os.getenv("MCP_LOG_SAMPLE_RATIO", "1.0"))
+    redact = os.getenv("MCP_LOG_REDACT", "1") != "0"
+
+    root = logging.getLogger(ROOT_LOGGER)
+    if _handler is None:
+        atexit.register(_stop_listener)
+    else:
+        _stop_listener()
+        root.removeHandler(_handler)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max_queue)
+    _handler = _DroppingQueueHandler(log_queue)
+    _StructuredLogger.sample_ratio = min(1.0, max(0.0, sample_ratio))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter(service_name, redact=redact))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+    root.setLevel(getattr(logging, level, logging.INFO))
+    for logger in _loggers.values():
+        logger._cache.clear()
+    root.addHandler(_handler)
+    # Keep these records away from the root logger configured by logging.basicConfig
+    root.propagate = False
+
+
+def _stop_listener() -> None:
+    """Flush the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics for the Zava MCP servers.
+
+A small in-process registry of counters, gauges and histograms rendered in the
+Prometheus text exposition format (version 0.0.4), so the servers need no extra
+dependency. Each server process keeps its own registry and serves it on a
+/metrics route next to the /mcp endpoint (HTTP mode only).
+
+Instruments shared by all servers:
+
+    mcp_tool_duration_seconds{tool,status}   tool call latency
+    mcp_tool_response_bytes{tool}            size of the text returned to the client
+    mcp_db_pool_create_seconds               time spent opening the connection pool
+    mcp_db_acquire_wait_seconds              time spent waiting for a pooled connection
+    mcp_db_query_duration_seconds{query}     time spent in the database per query kind
+    mcp_embedding_duration_seconds           time spent generating query embeddings
+    mcp_cache_requests_total{cache,result}   cache hits and misses
+    mcp_db_prepare_saved_seconds_total       estimated statement preparation time saved by reuse
+    mcp_db_pool_connections{state}           pool connections in use / idle
+    mcp_db_route_total{target}               connections handed out by the primary / replicas
+    mcp_db_replica_lag_seconds{replica}      replay lag of each read replica at its last check
+    mcp_sql_validation_total{result}         agent queries passed or rejected by schema validation
+    mcp_coalesced_calls_total{operation,result}  provider calls executed or shared with an identical one in flight
+    mcp_admission_total{tool,result}         tool calls (other requests by method) admitted, admitted after queueing, or rejected
+    mcp_admission_wait_seconds{tool}         time calls spent in the admission queue
+    mcp_admission_calls{tool,state}          tool calls running / waiting for a slot
+
+Usage:
+    from mcp_common.metrics import DB_QUERY_DURATION, add_metrics_route, instrument_tool, timed
+
+    add_metrics_route(mcp)
+
+    @mcp.tool()
+    @instrument_tool
+    async def my_tool(...) -> str: ...
+
+    with timed(DB_QUERY_DURATION, query="products_by_name"):
+        rows = await conn.fetch(...)
+"""
+
+import functools
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .tracing import SPAN_KIND_SERVER, span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond cache hits up to the 30s statement timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class holding the name, help text and label names of an instrument."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, callback: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        """Read the values from `callback` (label values tuple -> value) on every scrape."""
+        self._callback = callback
+
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = sorted(self._callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, with sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+TOOL_DURATION = REGISTRY.register(Histogram(
+    "mcp_tool_duration_seconds", "MCP tool call latency in seconds.", ["tool", "status"]))
+TOOL_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "mcp_tool_response_bytes", "Size of the text returned by MCP tools in bytes.", ["tool"], buckets=BYTES_BUCKETS))
+DB_POOL_CREATE = REGISTRY.register(Histogram(
+    "mcp_db_pool_create_seconds", "Time spent opening the database connection pool in seconds."))
+DB_ACQUIRE_WAIT = REGISTRY.register(Histogram(
+    "mcp_db_acquire_wait_seconds", "Time spent waiting to acquire a pooled database connection in seconds."))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "mcp_db_query_duration_seconds", "Database query time in seconds, by query kind.", ["query"]))
+EMBEDDING_DURATION = REGISTRY.register(Histogram(
+    "mcp_embedding_duration_seconds", "Time spent generating query embeddings in seconds."))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "mcp_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"]))
+DB_PREPARE_SAVED = REGISTRY.register(Counter(
+    "mcp_db_prepare_saved_seconds_total",
+    "Estimated statement preparation time saved by reusing prepared statements in seconds."))
+POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "mcp_db_pool_connections", "Database pool connections by state (in_use or idle).", ["state"]))
+DB_ROUTE = REGISTRY.register(Counter(
+    "mcp_db_route_total",
+    "Database connections handed out by target (primary, replica, or primary_fallback when no replica is healthy).",
+    ["target"]))
+DB_REPLICA_LAG = REGISTRY.register(Gauge(
+    "mcp_db_replica_lag_seconds", "Replay lag of each read replica at its last health check in seconds.", ["replica"]))
+SQL_VALIDATION = REGISTRY.register(Counter(
+    "mcp_sql_validation_total",
+    "Agent queries checked against the schema model before running, by result (passed or rejected).", ["result"]))
+COALESCED_CALLS = REGISTRY.register(Counter(
+    "mcp_coalesced_calls_total",
+    "Provider calls by operation and result: executed, or shared with an identical call already in flight.",
+    ["operation", "result"]))
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    "mcp_admission_total",
+    "Tool calls by admission result: admitted, queued (admitted after waiting), rejected_queue_full, "
+    "rejected_user_queue_full or rejected_timeout; tool is \"other\" for unregistered names.", ["tool", "result"]))
+ADMISSION_WAIT = REGISTRY.register(Histogram(
+    "mcp_admission_wait_seconds", "Time tool calls spent waiting in the admission queue in seconds.", ["tool"]))
+ADMISSION_CALLS = REGISTRY.register(Gauge(
+    "mcp_admission_calls", "Tool calls by state (running or waiting for a slot).", ["tool", "state"]))
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: Any) -> Iterator[None]:
+    """Observe the wall-clock time of the enclosed block on `histogram`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+_tracked_pools: Dict[int, Callable[[], Any]] = {}
+
+
+def _collect_pools() -> Dict[Tuple[str, ...], float]:
+    in_use = idle = 0
+    for get_pool in list(_tracked_pools.values()):
+        pools = get_pool()
+        if pools is None:
+            continue
+        for pool in pools if isinstance(pools, (list, tuple)) else [pools]:
+            pool_idle = pool.get_idle_size()
+            in_use += pool.get_size() - pool_idle
+            idle += pool_idle
+    return {("in_use",): in_use, ("idle",): idle}
+
+
+POOL_CONNECTIONS.set_function(_collect_pools)
+
+
+def track_pool(get_pool: Callable[[], Any]) -> int:
+    """
+    Include an asyncpg pool in the in-use / idle connection gauge on every scrape.
+
+    Args:
+        get_pool: Returns the current pool, a list of pools, or None while it is not open
+
+    Returns:
+        Handle to pass to untrack_pool() when the pool is closed
+    """
+    handle = id(get_pool)
+    _tracked_pools[handle] = get_pool
+    return handle
+
+
+def untrack_pool(handle: int) -> None:
+    """Stop reporting a pool registered with track_pool()."""
+    _tracked_pools.pop(handle, None)
+
+
+def is_error_result(result: Any) -> bool:
+    """
+    Whether a tool result reports a failure: one of the tools' "Error ..." strings, or
+    results ("Query Results:\n{...}") whose JSON has an error field.
+    """
+    if not isinstance(result, str):
+        return False
+    if result.startswith("Error"):
+        return True
+    # The providers write the error field first; only such results are parsed
+    _, _, body = result.partition("\n")
+    if '"error"' not in body[:32]:
+        return False
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and "error" in payload
+
+
+def instrument_tool(func: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+    """
+    Record latency, outcome and response size of an async MCP tool, and trace the
+    call as the root span of its phases (see tracing.py).
+
+    Apply below @mcp.tool() so FastMCP still sees the original signature. A call
+    counts as an error if it raises or its result reports one (see is_error_result()).
+    """
+    tool = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> str:
+        started = time.perf_counter()
+        status = "error"
+        with span(f"tool {tool}", kind=SPAN_KIND_SERVER, **{"mcp.tool": tool}) as tool_span:
+            try:
+                result = await func(*args, **kwargs)
+                if not is_error_result(result):
+                    status = "ok"
+                if isinstance(result, str):
+                    response_bytes = len(result.encode("utf-8"))
+                    TOOL_RESPONSE_BYTES.observe(response_bytes, tool=tool)
+                    if tool_span is not None:
+                        tool_span.set_attribute("mcp.response_bytes", response_bytes)
+                if tool_span is not None and status == "error":
+                    tool_span.set_error(result[:200] if isinstance(result, str) else "error")
+                return result
+            finally:
+                TOOL_DURATION.observe(time.perf_counter() - started, tool=tool, status=status)
+
+    return wrapper
+
+
+def add_metrics_route(mcp: Any, path: str = "/metrics") -> None:
+    """Serve the registry on `path` of a FastMCP server's HTTP app."""
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+    @mcp.custom_route(path, methods=["GET"])
+    async def metrics_endpoint(_request: Request) -> Response:
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Read replica routing for the MCP servers' database pools.
+
+All MCP tools only read, so they can be served by streaming replicas and leave
+the primary to the write path (the data generator and product maintenance).
+PoolRouter opens one asyncpg pool per DSN and hands out connections:
+
+- read-only acquisitions go to a healthy replica, round robin
+- everything else, and reads while no replica is healthy, go to the primary
+
+A replica is healthy when it is reachable and its replay lag is at most
+POSTGRES_REPLICA_MAX_LAG seconds. The lag is 0 when the replica has replayed
+all WAL the primary has written, and otherwise the age of the last replayed
+transaction. A server that is not in recovery (e.g. a second local Postgres
+standing in for a replica) counts as lag 0. Health is checked at most every
+POSTGRES_REPLICA_CHECK_INTERVAL seconds per replica, on the request path,
+and shared by all routers in the process. A replica whose pool cannot be
+opened or which refuses a connection is skipped until its next check, when
+opening its pool is tried again.
+
+The servers create a provider for every request, so they take their router
+from shared_router(), which opens it on first use and keeps it for the life of
+the process. Its pools are sized from MCP_DB_CONNECTION_BUDGET: the
+connections all worker processes of a server (see workers.py) may hold to
+each database together, split evenly between the MCP_WORKERS workers. Without
+a budget each worker's pool holds at most 3 connections, as the servers' own
+pools did.
+
+Configuration (environment):
+
+    POSTGRES_URL                      primary (as before)
+    POSTGRES_REPLICA_URLS             comma-separated replica DSNs (default: none)
+    POSTGRES_REPLICA_MAX_LAG          seconds of lag a replica may have (default: 30)
+    POSTGRES_REPLICA_CHECK_INTERVAL   seconds between health checks (default: 5)
+    MCP_DB_CONNECTION_BUDGET          connections per database over all workers of a server (default: 3 per worker)
+    MCP_WORKERS                       worker processes sharing the budget (default: 1)
+
+Usage:
+    router = PoolRouter(primary_url, replica_urls)
+    await router.open(min_size=1, max_size=3)
+    conn = await router.acquire(read_only=True)
+    try:
+        ...
+    finally:
+        await router.release(conn)
+    await router.close()
+
+    router = await shared_router(primary_url, max_size=pool_size())
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import asyncpg
+
+from .log import get_logger
+from .metrics import DB_POOL_CREATE, DB_REPLICA_LAG, DB_ROUTE, timed, track_pool
+from .tracing import span
+
+logger = get_logger(__name__)
+
+REPLICA_URLS = [url.strip() for url in os.getenv("POSTGRES_REPLICA_URLS", "").split(",") if url.strip()]
+MAX_LAG = float(os.getenv("POSTGRES_REPLICA_MAX_LAG", "30"))
+CHECK_INTERVAL = float(os.getenv("POSTGRES_REPLICA_CHECK_INTERVAL", "5"))
+DB_CONNECTION_BUDGET = int(os.getenv("MCP_DB_CONNECTION_BUDGET", "0")) or None
+WORKERS = max(1, int(os.getenv("MCP_WORKERS", "1")))
+
+# Replication status of a replica: whether it is a standby, how far it has replayed, and
+# how old the last replayed transaction is
+_REPLICA_STATUS = """
+    SELECT pg_is_in_recovery() AS in_recovery,
+           pg_last_wal_replay_lsn()::text AS replay_lsn,
+           EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8 AS replay_age
+"""
+
+
+@dataclass
+class ReplicaHealth:
+    """Outcome of the last health check of a replica."""
+
+    healthy: bool = False
+    lag_seconds: Optional[float] = None
+    checked_at: float = 0.0
+    error: str = ""
+
+
+# Replica DSN -> last health check, shared by every router in the process
+_health: Dict[str, ReplicaHealth] = {}
+# Replicas being checked right now; concurrent callers use the last result
+_checking: set = set()
+
+
+def describe(url: str) -> str:
+    """host:port/database of a DSN, without credentials (for logs and metric labels)."""
+    parts = urlsplit(url)
+    return f"{parts.hostname or 'localhost'}:{parts.port or 5432}{parts.path or ''}"
+
+
+def _lsn(text: Optional[str]) -> Optional[int]:
+    """Position of a WAL location such as '0/8000060'."""
+    if not text:
+        return None
+    high, low = text.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class PoolRouter:
+    """One pool for the primary and one per replica, with lag-aware routing of reads."""
+
+    def __init__(self, primary_url: str, replica_urls: Optional[Sequence[str]] = None,
+                 max_lag: float = MAX_LAG, check_interval: float = CHECK_INTERVAL) -> None:
+        self.primary_url = primary_url
+        self.replica_urls = list(REPLICA_URLS if replica_urls is None else replica_urls)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary: Optional[asyncpg.Pool] = None
+        self.replicas: Dict[str, asyncpg.Pool] = {}
+        self._pool_options: Dict[str, Any] = {}
+        self._next = 0
+        # Connection -> pool it was acquired from
+        self._owners: Dict[int, asyncpg.Pool] = {}
+
+    @property
+    def pools(self) -> List[asyncpg.Pool]:
+        """Every open pool (for the connection gauges)."""
+        return ([self.primary] if self.primary else []) + list(self.replicas.values())
+
+    async def _open_replica(self, url: str) -> None:
+        try:
+            self.replicas[url] = await asyncpg.create_pool(url, **self._pool_options)
+        except Exception as e:
+            logger.warning("Replica unavailable", extra={"fields": {"replica": describe(url), "error": str(e)}})
+            _health[url] = ReplicaHealth(False, None, time.monotonic(), str(e))
+
+    async def open(self, **pool_options: Any) -> None:
+        """Open the primary pool and, alongside it, the replica pools; replicas that fail are skipped."""
+        self._pool_options = pool_options
+        results = await asyncio.gather(asyncpg.create_pool(self.primary_url, **pool_options),
+                                       *(self._open_replica(url) for url in self.replica_urls),
+                                       return_exceptions=True)
+        if isinstance(results[0], BaseException):
+            await self.close()
+            raise results[0]
+        self.primary = results[0]
+
+    async def close(self) -> None:
+        pools, self.primary, self.replicas = self.pools, None, {}
+        self._owners.clear()
+        await asyncio.gather(*(pool.close() for pool in pools), return_exceptions=True)
+
+    async def _check(self, url: str) -> ReplicaHealth:
+        """Measure a replica's lag against the primary's current WAL position."""
+        health = ReplicaHealth(checked_at=time.monotonic())
+        try:
+            status = await self.replicas[url].fetchrow(_REPLICA_STATUS, timeout=self.check_interval)
+            if not status["in_recovery"]:
+                health.lag_seconds = 0.0
+            else:
+                try:
+                    primary_lsn = _lsn(await self.primary.fetchval("SELECT pg_current_wal_lsn()::text",
+                                                                   timeout=self.check_interval))
+                except Exception:
+                    # Without the primary there is nothing to fall back to; serve what the replica has
+                    primary_lsn = None
+                replay_lsn = _lsn(status["replay_lsn"])
+                if primary_lsn is None or (replay_lsn is not None and replay_lsn >= primary_lsn):
+                    health.lag_seconds = 0.0
+                else:
+                    age = status["replay_age"]
+                    health.lag_seconds = float("inf") if age is None else max(age, 0.0)
+            health.healthy = health.lag_seconds <= self.max_lag
+            if health.lag_seconds == float("inf"):
+                health.error = "behind the primary, and no transaction replayed yet to measure the lag"
+            elif not health.healthy:
+                health.error = f"replay lag {health.lag_seconds:.1f}s exceeds {self.max_lag:.0f}s"
+        except Exception as e:
+            health.error = str(e)
+
+        previous = _health.get(url)
+        if previous is None or previous.healthy != health.healthy:
+            logger.info("Replica healthy" if health.healthy else "Replica unhealthy",
+                        extra={"fields": {"replica": describe(url), "lag_seconds": health.lag_seconds,
+                                          "error": health.error}})
+        _health[url] = health
+        if health.lag_seconds is not None:
+            DB_REPLICA_LAG.set(health.lag_seconds, replica=describe(url))
+        return health
+
+    async def _healthy(self, url: str) -> bool:
+        health = _health.get(url)
+        stale = health is None or time.monotonic() - health.checked_at >= self.check_interval
+        if stale and url not in _checking:
+            _checking.add(url)
+            try:
+                health = await self._check(url)
+            finally:
+                _checking.discard(url)
+        return bool(health and health.healthy)
+
+    def health(self) -> Dict[str, ReplicaHealth]:
+        """Last known health of every configured replica."""
+        return {describe(url): _health.get(url, ReplicaHealth()) for url in self.replica_urls}
+
+    async def acquire(self, read_only: bool = True) -> asyncpg.Connection:
+        """
+        Connection from a healthy replica for reads, else from the primary.
+
+        Raises:
+            RuntimeError: The router is not open
+        """
+        if self.primary is None:
+            raise RuntimeError("No database connection pool available. Call create_pool() first.")
+
+        if read_only and len(self.replicas) < len(self.replica_urls):
+            await self._reopen_replicas()
+        if read_only and self.replicas:
+            urls = list(self.replicas)
+            for i in range(len(urls)):
+                url = urls[(self._next + i) % len(urls)]
+                if not await self._healthy(url):
+                    continue
+                pool = self.replicas[url]
+                try:
+                    conn = await pool.acquire()
+                except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                    logger.warning("Replica refused a connection",
+                                   extra={"fields": {"replica": describe(url), "error": str(e)}})
+                    _health[url] = ReplicaHealth(False, None, time.monotonic(), str(e))
+                    continue
+                self._next = (self._next + i + 1) % len(urls)
+                self._owners[id(conn)] = pool
+                DB_ROUTE.inc(target="replica")
+                return conn
+
+        conn = await self.primary.acquire()
+        self._owners[id(conn)] = self.primary
+        DB_ROUTE.inc(target="primary" if not read_only or not self.replica_urls else "primary_fallback")
+        return conn
+
+    async def _reopen_replicas(self) -> None:
+        """Try again to open the pools of replicas that failed to open, once their health check is due."""
+        now = time.monotonic()
+        due = [url for url in self.replica_urls if url not in self.replicas and url not in _checking
+               and now - _health.get(url, ReplicaHealth()).checked_at >= self.check_interval]
+        for url in due:
+            _checking.add(url)
+        try:
+            await asyncio.gather(*(self._open_replica(url) for url in due))
+        finally:
+            for url in due:
+                _checking.discard(url)
+
+    def source(self, conn: asyncpg.Connection) -> str:
+        """DSN of the server an acquired connection belongs to."""
+        pool = self._owners.get(id(conn))
+        for url, replica in self.replicas.items():
+            if replica is pool:
+                return url
+        return self.primary_url
+
+    async def release(self, conn: asyncpg.Connection) -> None:
+        pool = self._owners.pop(id(conn), None) or self.primary
+        if pool is not None:
+            await pool.release(conn)
+
+
+# Pool size of a worker when no connection budget is set (very conservative, as before)
+DEFAULT_POOL_SIZE = 3
+
+
+def pool_size(budget: Optional[int] = DB_CONNECTION_BUDGET, workers: int = WORKERS) -> int:
+    """Connections one worker's pool may hold to a database: its share of the budget, at least 1."""
+    if budget is None:
+        return DEFAULT_POOL_SIZE
+    return max(1, budget // workers)
+
+
+# (primary, replicas) -> router kept open for the life of the process
+_shared_routers: Dict[Tuple[str, Tuple[str, ...]], PoolRouter] = {}
+_opening: Dict[Tuple[str, Tuple[str, ...]], "asyncio.Future[PoolRouter]"] = {}
+
+
+async def shared_router(primary_url: str, replica_urls: Optional[Sequence[str]] = None,
+                        **pool_options: Any) -> PoolRouter:
+    """
+    The process's router for a primary and its replicas, opened with pool_options on first use.
+
+    Callers must not close it; close_shared_routers() does when the process shuts down.
+    """
+    key = (primary_url, tuple(REPLICA_URLS if replica_urls is None else replica_urls))
+    router = _shared_routers.get(key)
+    if router is not None:
+        return router
+    opening = _opening.get(key)
+    if opening is not None:
+        return await asyncio.shield(opening)
+
+    async def open_router() -> PoolRouter:
+        router = PoolRouter(primary_url, key[1])
+        with span("db.create_pool"), timed(DB_POOL_CREATE):
+            await router.open(**pool_options)
+        _shared_routers[key] = router
+        track_pool(lambda: router.pools)
+        logger.info("Database pools opened", extra={"fields": {
+            "primary": describe(primary_url), "replicas": [describe(url) for url in router.replicas],
+            "max_size": pool_options.get("max_size")}})
+        return router
+
+    def opened(future: "asyncio.Future[PoolRouter]") -> None:
+        del _opening[key]
+        if not future.cancelled():
+            # Mark the error retrieved, in case every caller went away before it was raised
+            future.exception()
+
+    opening = _opening[key] = asyncio.ensure_future(open_router())
+    opening.add_done_callback(opened)
+    return await asyncio.shield(opening)
+
+
+async def close_shared_routers() -> None:
+    """Close every router opened by shared_router()."""
+    routers = list(_shared_routers.values())
+    _shared_routers.clear()
+    await asyncio.gather(*(router.close() for router in routers), return_exceptions=True)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Request helpers of the MCP tools: headers, the RLS user id and the lifespan context.
+
+The tool sets (sales_analysis, customer_sales, customer_sales_semantic_search)
+run as their own servers or mounted together in one (see
+combined/combined_server.py). A tool finds its provider through
+lifespan_context(), which accepts either its own server's context or the
+ToolsetContexts of a combined server holding one context per tool set.
+
+In stdio mode there are no headers; the server passes its --RLS_USER_ID to
+set_stdio_rls_user_id() and every tool call uses it. The id is also put in
+MCP_RLS_USER_ID, so HTTP worker processes (see workers.py), which import the
+server afresh, pin the same id.
+
+Configuration (environment):
+
+    MCP_RLS_USER_ID    RLS user id for every call, ignoring x-rls-user-id (default: none)
+
+Usage:
+    rls_user_id = get_rls_user_id(ctx)
+    app_context = lifespan_context(mcp.get_context(), AppContext)
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Type, TypeVar
+
+from mcp.server.fastmcp import Context
+
+# Used when a request carries no x-rls-user-id header
+DEFAULT_RLS_USER_ID = "00000000-0000-0000-0000-000000000000"
+
+RLS_USER_ID_ENV = "MCP_RLS_USER_ID"
+
+_stdio_rls_user_id: Optional[str] = os.getenv(RLS_USER_ID_ENV) or None
+
+T = TypeVar("T")
+
+
+def set_stdio_rls_user_id(rls_user_id: Optional[str]) -> None:
+    """Use rls_user_id for every call, as in stdio mode where requests have no headers (None: no change)."""
+    global _stdio_rls_user_id
+    if rls_user_id is None:
+        return
+    _stdio_rls_user_id = rls_user_id
+    # Inherited by worker processes
+    os.environ[RLS_USER_ID_ENV] = rls_user_id
+
+
+def get_header(ctx: Context, header_name: str) -> Optional[str]:
+    """Extract a specific header from the request context."""
+
+    request = ctx.request_context.request
+    if request is not None and hasattr(request, "headers"):
+        headers = request.headers
+        if headers:
+            header_value = headers.get(header_name)
+            if header_value is not None:
+                if isinstance(header_value, bytes):
+                    return header_value.decode("utf-8")
+                return str(header_value)
+
+    return None
+
+
+def get_rls_user_id(ctx: Context) -> str:
+    """Get the Row Level Security User ID from the request context."""
+
+    # if running in stdio mode, use the RLS user id passed as an argument
+    if _stdio_rls_user_id is not None:
+        return _stdio_rls_user_id
+
+    rls_user_id = get_header(ctx, "x-rls-user-id")
+    if rls_user_id is None:
+        # Default to a placeholder if not provided
+        rls_user_id = DEFAULT_RLS_USER_ID
+    return rls_user_id
+
+
+@dataclass
+class ToolsetContexts:
+    """Lifespan context of a combined server: the context of each mounted tool set."""
+
+    contexts: List[Any] = field(default_factory=list)
+
+
+def lifespan_context(ctx: Context, context_type: Type[T]) -> T:
+    """The lifespan context of type context_type, from a tool set's own server or a combined one."""
+    app_context = ctx.request_context.lifespan_context
+    if isinstance(app_context, context_type):
+        return app_context
+    if isinstance(app_context, ToolsetContexts):
+        for toolset_context in app_context.contexts:
+            if isinstance(toolset_context, context_type):
+                return toolset_context
+    raise RuntimeError("Invalid lifespan context type")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Coalescing of identical concurrent calls ("single flight") for the MCP servers.
+
+When several agent sessions make the same call at the same moment, for example
+the same schema fetch at the start of a workshop, each one would take a
+connection from the small pool and repeat the work. SingleFlight runs the first
+call and lets every identical call that arrives while it is still running await
+the same result. Nothing is cached: a call made after the first one finished
+runs again.
+
+The key must include everything the result depends on: the arguments, the RLS
+user id and the database. The result is handed to every caller as it is, so it
+must not be mutated (the providers return JSON strings). Errors are shared the
+same way. A caller that goes away (e.g. a dropped HTTP request) does not cancel
+the call for the others.
+
+Flights are kept per process and shared by all providers in it, because the
+servers create a provider (and its pool) for every request.
+
+Configuration (environment):
+
+    MCP_COALESCE    set to 0 to run every call on its own (default: 1)
+
+Usage:
+    PRODUCT_FLIGHTS = SingleFlight("products_by_name")
+
+    result = await PRODUCT_FLIGHTS.run((dsn, rls_user_id, name, max_rows), lambda: lookup(name, max_rows))
+"""
+
+import asyncio
+import functools
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .metrics import COALESCED_CALLS
+from .tracing import span
+
+COALESCE = os.getenv("MCP_COALESCE", "1") != "0"
+
+T = TypeVar("T")
+
+
+def freeze(value: Any) -> Hashable:
+    """A hashable form of an argument for use in a key: lists become tuples, dicts sorted item tuples."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    return value
+
+
+class SingleFlight:
+    """In-flight calls of one operation by key; identical calls share the running one."""
+
+    def __init__(self, operation: str, enabled: bool = COALESCE) -> None:
+        self.operation = operation
+        self.enabled = enabled
+        self._flights: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Result of call(), or of the identical call already in flight under the same key."""
+        if not self.enabled:
+            return await call()
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            COALESCED_CALLS.inc(operation=self.operation, result="shared")
+            with span("coalesced.wait", operation=self.operation):
+                return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(call())
+        self._flights[key] = flight
+        flight.add_done_callback(functools.partial(self._finished, key))
+        COALESCED_CALLS.inc(operation=self.operation, result="executed")
+        return await asyncio.shield(flight)
+
+    def _finished(self, key: Hashable, flight: "asyncio.Future[Any]") -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            # Mark the error retrieved, in case every caller went away before it was raised
+            flight.exception()
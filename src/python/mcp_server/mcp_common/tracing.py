@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Lightweight OpenTelemetry-style tracing for the Zava MCP servers.
+
+Each tool call becomes a trace whose child spans cover the phases a request goes
+through (embedding, pool acquire, set_config, the query itself, JSON serialization),
+so a slow call can be broken down without attaching a profiler.
+
+Finished traces are exported in OTLP/JSON from a background thread, either to an
+OTLP/HTTP collector (POST {endpoint}/v1/traces) or appended to a local JSON-lines
+file. Nothing on the request path waits for the exporter; if it falls behind,
+traces are dropped rather than queued without bound.
+
+Sampling is decided once per trace, when the tool span starts. Spans of unsampled
+traces are not recorded at all, so a low sample ratio costs little more than a
+random() call per tool call. Optionally, traces slower than a threshold are always
+kept: this records every trace but only exports the slow ones.
+
+Configuration (environment variables):
+
+    MCP_TRACE_EXPORTER          none (default), file or otlp
+    MCP_TRACE_FILE              JSON-lines output for the file exporter (default: mcp_traces.jsonl)
+    OTEL_EXPORTER_OTLP_ENDPOINT collector base URL for the otlp exporter (default: http://localhost:4318)
+    MCP_TRACE_SAMPLE_RATIO      fraction of tool calls to trace, 0.0-1.0 (default: 1.0)
+    MCP_TRACE_SLOW_MS           also keep every trace slower than this many milliseconds
+    OTEL_SERVICE_NAME           service.name resource attribute (default: the server name)
+
+Usage:
+    from mcp_common.tracing import configure_tracing, span
+
+    configure_tracing("mcp-zava-sales")
+
+    with span("db.products_by_name", max_rows=max_rows):
+        rows = await conn.fetch(...)
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+DEFAULT_TRACE_FILE = "mcp_traces.jsonl"
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318"
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message", "trace")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int,
+                 trace: List["Span"], attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.status_message = ""
+        # Spans of the same trace, shared by the whole tree and exported with the root
+        self.trace = trace
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def to_otlp(self) -> Dict[str, Any]:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        if self.status_message:
+            data["status"]["message"] = self.status_message
+        return data
+
+
+class _NotSampled:
+    """Marks a trace that was not sampled, so its child spans are skipped cheaply."""
+
+
+_NOT_SAMPLED = _NotSampled()
+
+_current_span: ContextVar[Any] = ContextVar("mcp_current_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        wrapped = {"boolValue": value}
+    elif isinstance(value, int):
+        wrapped = {"intValue": str(value)}
+    elif isinstance(value, float):
+        wrapped = {"doubleValue": value}
+    else:
+        wrapped = {"stringValue": str(value)}
+    return {"key": key, "value": wrapped}
+
+
+class _Exporter:
+    """Drains finished traces on a background thread and writes them in batches."""
+
+    def __init__(self, service_name: str, max_queue: int = 2048, batch_size: int = 64,
+                 flush_interval: float = 1.0) -> None:
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="mcp-trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: List[Span]) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _payload(self, traces: List[List[Span]]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "mcp_common.tracing"},
+                    "spans": [span.to_otlp() for trace in traces for span in trace],
+                }],
+            }]
+        }
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[List[Span]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.write(self._payload(batch))
+                except Exception as e:
+                    # Tracing must never take the server down (stderr keeps the stdio protocol stream clean)
+                    print(f"⚠️  Failed to export {len(batch)} traces: {e}", file=sys.stderr)
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class JsonFileExporter(_Exporter):
+    """Appends one OTLP/JSON ExportTraceServiceRequest per batch to a JSON-lines file."""
+
+    def __init__(self, service_name: str, path: str = DEFAULT_TRACE_FILE) -> None:
+        self.path = path
+        super().__init__(service_name)
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OtlpHttpExporter(_Exporter):
+    """Posts OTLP/JSON batches to an OpenTelemetry collector over HTTP."""
+
+    def __init__(self, service_name: str, endpoint: str = DEFAULT_OTLP_ENDPOINT) -> None:
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        super().__init__(service_name)
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload, separators=(",", ":")).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+
+class _Tracer:
+    """Process-wide tracing configuration."""
+
+    def __init__(self) -> None:
+        self.exporter: Optional[_Exporter] = None
+        self.sample_ratio = 1.0
+        self.slow_ns: Optional[int] = None
+
+
+_tracer = _Tracer()
+
+
+def configure_tracing(service_name: str, exporter: Optional[str] = None,
+                      sample_ratio: Optional[float] = None, slow_ms: Optional[float] = None) -> None:
+    """
+    Set up tracing for this process from arguments or environment variables.
+
+    Args:
+        service_name: Default service.name for exported spans
+        exporter: none, file or otlp (default: MCP_TRACE_EXPORTER)
+        sample_ratio: Fraction of tool calls to trace (default: MCP_TRACE_SAMPLE_RATIO or 1.0)
+        slow_ms: Always keep traces slower than this (default: MCP_TRACE_SLOW_MS)
+    """
+    exporter = (exporter or os.getenv("MCP_TRACE_EXPORTER", "none")).lower()
+    service_name = os.getenv("OTEL_SERVICE_NAME", service_name)
+
+    if _tracer.exporter is not None:
+        _tracer.exporter.shutdown()
+        _tracer.exporter = None
+
+    if exporter == "file":
+        _tracer.exporter = JsonFileExporter(service_name, os.getenv("MCP_TRACE_FILE", DEFAULT_TRACE_FILE))
+    elif exporter == "otlp":
+        _tracer.exporter = OtlpHttpExporter(service_name, os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT))
+    elif exporter != "none":
+        raise ValueError(f"Unknown trace exporter '{exporter}' (expected none, file or otlp)")
+
+    if sample_ratio is None:
+        sample_ratio = float(os.getenv("MCP_TRACE_SAMPLE_RATIO", "1.0"))
+    _tracer.sample_ratio = min(1.0, max(0.0, sample_ratio))
+
+    if slow_ms is None and os.getenv("MCP_TRACE_SLOW_MS"):
+        slow_ms = float(os.environ["MCP_TRACE_SLOW_MS"])
+    _tracer.slow_ns = int(slow_ms * 1_000_000) if slow_ms is not None else None
+
+    if _tracer.exporter is not None:
+        atexit.register(_tracer.exporter.shutdown)
+
+
+def current_span() -> Optional[Span]:
+    """The span of the enclosing operation, if it is being recorded."""
+    active = _current_span.get()
+    return active if isinstance(active, Span) else None
+
+
+class _NoopSpan:
+    """Context manager used when nothing is being recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _UnsampledTrace:
+    """Marks the rest of an unsampled trace so its child spans take the no-op path."""
+
+    __slots__ = ("_token",)
+
+    def __enter__(self) -> None:
+        self._token = _current_span.set(_NOT_SAMPLED)
+        return None
+
+    def __exit__(self, *exc_info: Any) -> None:
+        _current_span.reset(self._token)
+
+
+class _RecordingSpan:
+    """Context manager that makes a span current and records it when it ends."""
+
+    __slots__ = ("_span", "_root", "_token")
+
+    def __init__(self, current: Span, root: bool) -> None:
+        self._span = current
+        self._root = root
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type: Any, exc: Any, _tb: Any) -> None:
+        current = self._span
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            current.set_error(f"{exc_type.__name__}: {exc}")
+        current.end_ns = time.time_ns()
+        current.trace.append(current)
+        if self._root:
+            _finish_trace(current)
+
+
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Any:
+    """
+    Record the enclosed block as a span (use as a context manager).
+
+    Outside of a trace this starts a new one (subject to sampling); inside one it
+    adds a child of the current span. Binds the span with `as`, or None when the
+    block is not being recorded.
+    """
+    if _tracer.exporter is None:
+        return _NOOP
+    parent = _current_span.get()
+    if parent is _NOT_SAMPLED:
+        return _NOOP
+
+    if parent is None:
+        sampled = _tracer.sample_ratio >= 1.0 or random.random() < _tracer.sample_ratio
+        if not sampled and _tracer.slow_ns is None:
+            return _UnsampledTrace()
+        current = Span(name, f"{random.getrandbits(128):032x}", None, kind, [], attributes)
+        current.set_attribute("sampled", sampled)
+        return _RecordingSpan(current, root=True)
+
+    return _RecordingSpan(Span(name, parent.trace_id, parent.span_id, kind, parent.trace, attributes), root=False)
+
+
+def _finish_trace(root: Span) -> None:
+    keep = root.attributes.get("sampled") or (
+        _tracer.slow_ns is not None and root.end_ns - root.start_ns >= _tracer.slow_ns)
+    if keep and _tracer.exporter is not None:
+        _tracer.exporter.submit(root.trace)
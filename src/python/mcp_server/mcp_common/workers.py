@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Multi-process serving of the MCP servers (HTTP mode), and stdio serving.
+
+One asyncio process runs on one core, and JSON serialization and schema
+formatting are CPU-bound, so a single server process saturates long before
+the database does. serve() runs a server as MCP_WORKERS (or --workers) worker
+processes behind one port: uvicorn's supervisor binds the socket and spawns
+the workers, each of which imports the server module and builds its app with
+the server's create_app(), and the kernel spreads connections across them.
+The supervisor restarts a worker that exits.
+
+Each worker keeps its own:
+
+- database pools, sized so that all workers together hold at most
+  MCP_DB_CONNECTION_BUDGET connections per database (see replicas.py)
+- admission slots (see admission.py); the limits apply per worker
+- caches, which are invalidated in every worker at once through the
+  generation file the supervisor creates (see cache.py)
+- metrics registry; each scrape of /metrics reaches one worker
+
+A --RLS_USER_ID given to the server reaches the workers as MCP_RLS_USER_ID
+(see request.py), like MCP_WORKERS and the cache generation file.
+
+With one worker the app is served from the starting process, as before.
+serve_stdio() runs a server in stdio mode and closes its pools when the
+client disconnects.
+
+Configuration (environment):
+
+    MCP_WORKERS                  worker processes (default: 1)
+    MCP_DB_CONNECTION_BUDGET     connections per database over all workers (default: 3 per worker)
+
+Usage:
+    def create_app() -> Starlette:
+        configure_logging(mcp.name)
+        return http_app(mcp, TOOL_LIMITS)
+
+    serve(mcp, create_app, workers=4)
+    serve_stdio(mcp)
+"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Mapping, Optional
+
+import anyio
+import uvicorn
+
+from .admission import add_admission_control
+from .cache import GENERATION_ENV, create_generation_file
+from .log import get_logger
+from .replicas import WORKERS, close_shared_routers
+
+logger = get_logger(__name__)
+
+
+def http_app(mcp: Any, limits: Optional[Mapping[str, int]] = None) -> Any:
+    """
+    Streamable HTTP app of a FastMCP server for this process: admission control in
+    front, and the process's database pools closed when it shuts down.
+    """
+    app = mcp.streamable_http_app()
+    add_admission_control(app, limits, tools=[tool.name for tool in mcp._tool_manager.list_tools()])
+
+    run_session_manager = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app: Any) -> AsyncIterator[Any]:
+        async with run_session_manager(app) as state:
+            try:
+                yield state
+            finally:
+                await close_shared_routers()
+
+    app.router.lifespan_context = lifespan
+    return app
+
+
+def _import_string(create_app: Callable[[], Any]) -> str:
+    """module:function for a worker to import, naming a server run as a script by its file."""
+    module = create_app.__module__
+    if module == "__main__":
+        module = Path(sys.modules["__main__"].__file__).stem
+    return f"{module}:{create_app.__name__}"
+
+
+def serve(mcp: Any, create_app: Callable[[], Any], workers: int = WORKERS) -> None:
+    """
+    Serve a FastMCP server over streamable HTTP on its host and port.
+
+    Args:
+        mcp: The server (for host, port and log level)
+        create_app: Module-level function building the app; each worker imports and calls it
+        workers: Worker processes; with 1 the app is served from this process
+    """
+    options = {"host": mcp.settings.host, "port": mcp.settings.port, "log_level": mcp.settings.log_level.lower()}
+    if workers <= 1:
+        uvicorn.run(create_app(), **options)
+        return
+
+    # Inherited by the workers: their share of the connection budget and the shared cache generation
+    os.environ["MCP_WORKERS"] = str(workers)
+    generation_file = None
+    if not os.getenv(GENERATION_ENV):
+        generation_file = os.environ[GENERATION_ENV] = create_generation_file()
+    logger.info("Starting workers", extra={"fields": {"workers": workers, "app": _import_string(create_app)}})
+    try:
+        uvicorn.run(_import_string(create_app), factory=True, workers=workers, **options)
+    finally:
+        if generation_file is not None:
+            os.unlink(generation_file)
+
+
+def serve_stdio(mcp: Any) -> None:
+    """Serve a FastMCP server over stdio, closing the process's database pools when it ends."""
+
+    async def run() -> None:
+        try:
+            await mcp.run_stdio_async()
+        finally:
+            await close_shared_routers()
+
+    anyio.run(run)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Parameterized query templates for the common analytic questions.
+
+Most agent questions have one of a few shapes: sales over time, best selling
+products, stock per store. The sales analysis server exposes each shape as its
+own tool, which answers from a fixed SQL template instead of SQL written by the
+model. That skips the schema fetch and the SQL the agent would otherwise write,
+and because the SQL text never changes, asyncpg prepares each template once per
+pooled connection and reuses the statement (and, after a few executions,
+PostgreSQL's cached generic plan) for every later call.
+
+All values reach the database as typed bind parameters. Optional filters are
+NULL when not given. Row level security applies as for any other query.
+
+Usage:
+    from query_templates import render_template
+
+    sql, args = render_template("sales_by_period", granularity="month", store="Seattle")
+    rows = await conn.fetch(sql, *args)
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+GRANULARITIES = ("day", "month", "quarter", "year")
+PRODUCT_METRICS = ("revenue", "units", "gross_margin")
+
+MAX_ROWS_LIMIT = 100
+
+
+@dataclass(frozen=True)
+class QueryTemplate:
+    """Fixed SQL text and the names of the values bound to $1, $2, ..."""
+
+    name: str
+    sql: str
+    params: Tuple[str, ...]
+
+
+# Store names are matched by substring ("Seattle" finds "Zava Retail Seattle"),
+# categories by case-insensitive name.
+_SALES_FILTERS = """
+    ($1::text IS NULL OR store_name ILIKE '%' || $1 || '%')
+    AND ($2::text IS NULL OR category_name ILIKE $2)"""
+
+TEMPLATES: Dict[str, QueryTemplate] = {
+    template.name: template
+    for template in (
+        QueryTemplate(
+            "sales_by_day",
+            f"""SELECT sale_date AS period, SUM(revenue) AS revenue, SUM(units) AS units,
+                       SUM(cost) AS cost, SUM(gross_margin) AS gross_margin
+                FROM retail.sales_daily
+                WHERE {_SALES_FILTERS}
+                AND ($3::date IS NULL OR sale_date >= $3)
+                AND ($4::date IS NULL OR sale_date <= $4)
+                GROUP BY sale_date ORDER BY sale_date DESC LIMIT $5""",
+            ("store", "category", "start_date", "end_date", "max_rows"),
+        ),
+        # Months overlapping the date range are included in full
+        QueryTemplate(
+            "sales_by_month",
+            f"""SELECT DATE_TRUNC($6, sale_month)::date AS period, SUM(revenue) AS revenue, SUM(units) AS units,
+                       SUM(cost) AS cost, SUM(gross_margin) AS gross_margin
+                FROM retail.sales_monthly
+                WHERE {_SALES_FILTERS}
+                AND ($3::date IS NULL OR sale_month >= DATE_TRUNC('month', $3::date))
+                AND ($4::date IS NULL OR sale_month <= $4)
+                GROUP BY 1 ORDER BY 1 DESC LIMIT $5""",
+            ("store", "category", "start_date", "end_date", "max_rows", "granularity"),
+        ),
+        QueryTemplate(
+            "top_products",
+            """SELECT p.product_name, c.category_name, SUM(oi.quantity) AS units, SUM(oi.total_amount) AS revenue,
+                      SUM(oi.total_amount - oi.quantity * p.cost) AS gross_margin
+               FROM retail.order_items oi
+               JOIN retail.orders o ON o.order_id = oi.order_id
+               JOIN retail.products p ON p.product_id = oi.product_id
+               JOIN retail.categories c ON c.category_id = p.category_id
+               JOIN retail.stores s ON s.store_id = o.store_id
+               WHERE ($1::text IS NULL OR s.store_name ILIKE '%' || $1 || '%')
+               AND ($2::text IS NULL OR c.category_name ILIKE $2)
+               AND ($3::date IS NULL OR o.order_date >= $3)
+               AND ($4::date IS NULL OR o.order_date <= $4)
+               GROUP BY p.product_id, p.product_name, c.category_name
+               ORDER BY CASE $6
+                            WHEN 'units' THEN SUM(oi.quantity)::numeric
+                            WHEN 'gross_margin' THEN SUM(oi.total_amount - oi.quantity * p.cost)
+                            ELSE SUM(oi.total_amount)
+                        END DESC, p.product_name
+               LIMIT $5""",
+            ("store", "category", "start_date", "end_date", "max_rows", "metric"),
+        ),
+        QueryTemplate(
+            "inventory_by_store",
+            """SELECT s.store_name, c.category_name, COUNT(*) AS products, SUM(i.stock_level) AS units_in_stock,
+                      SUM(i.stock_level * p.cost) AS stock_value_at_cost,
+                      COUNT(*) FILTER (WHERE i.stock_level < $3) AS low_stock_products
+               FROM retail.inventory i
+               JOIN retail.stores s ON s.store_id = i.store_id
+               JOIN retail.products p ON p.product_id = i.product_id
+               JOIN retail.categories c ON c.category_id = p.category_id
+               WHERE ($1::text IS NULL OR s.store_name ILIKE '%' || $1 || '%')
+               AND ($2::text IS NULL OR c.category_name ILIKE $2)
+               GROUP BY s.store_name, c.category_name
+               ORDER BY s.store_name, c.category_name
+               LIMIT $4""",
+            ("store", "category", "low_stock_threshold", "max_rows"),
+        ),
+    )
+}
+
+
+def _text(name: str, value: Any) -> Optional[str]:
+    if value is None or not str(value).strip():
+        return None
+    return str(value).strip()
+
+
+def _date(name: str, value: Any) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        # Accept full timestamps such as the output of get_current_utc_date
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format, got '{value}'") from None
+
+
+def _max_rows(name: str, value: Any) -> int:
+    try:
+        rows = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a whole number, got '{value}'") from None
+    return max(1, min(rows, MAX_ROWS_LIMIT))
+
+
+def _non_negative(name: str, value: Any) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a whole number, got '{value}'") from None
+    if number < 0:
+        raise ValueError(f"{name} must not be negative")
+    return number
+
+
+def _choice(choices: Tuple[str, ...]) -> Callable[[str, Any], str]:
+    def convert(name: str, value: Any) -> str:
+        text = str(value).strip().lower()
+        if text not in choices:
+            raise ValueError(f"{name} must be one of {', '.join(choices)}, got '{value}'")
+        return text
+    return convert
+
+
+_CONVERTERS: Dict[str, Callable[[str, Any], Any]] = {
+    "store": _text,
+    "category": _text,
+    "start_date": _date,
+    "end_date": _date,
+    "max_rows": _max_rows,
+    "granularity": _choice(GRANULARITIES),
+    "metric": _choice(PRODUCT_METRICS),
+    "low_stock_threshold": _non_negative,
+}
+
+
+def render_template(name: str, **values: Any) -> Tuple[str, List[Any]]:
+    """
+    Validate the values for a template and return its SQL and bind arguments.
+
+    sales_by_period picks the daily or monthly template from its granularity.
+
+    Raises:
+        ValueError: Unknown template, missing value or a value of the wrong type
+    """
+    if name == "sales_by_period":
+        granularity = _CONVERTERS["granularity"]("granularity", values.get("granularity", "month"))
+        values["granularity"] = granularity
+        name = "sales_by_day" if granularity == "day" else "sales_by_month"
+
+    template = TEMPLATES.get(name)
+    if template is None:
+        raise ValueError(f"Unknown query template '{name}'")
+
+    bound = {}
+    for param in template.params:
+        if param not in values:
+            raise ValueError(f"Missing value for {param}")
+        bound[param] = _CONVERTERS[param](param, values[param])
+
+    start, end = bound.get("start_date"), bound.get("end_date")
+    if start and end and start > end:
+        raise ValueError(f"start_date {start} is after end_date {end}")
+    return template.sql, list(bound.values())
@@ -4,18 +4,31 @@ Provides comprehensive customer sales database access with individual table sche
 """
 
 import argparse
-import asyncio
+import sys
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Annotated, Optional
+from pathlib import Path
+from typing import Annotated, Any, Literal, Optional
 
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic import Field
 from sales_analysis_postgres import PostgreSQLSchemaProvider
 
-RLS_USER_ID = None
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.log import configure_logging, get_logger  # noqa: E402
+from mcp_common.metrics import add_metrics_route, instrument_tool  # noqa: E402
+from mcp_common.replicas import WORKERS  # noqa: E402
+from mcp_common.request import get_rls_user_id, lifespan_context, set_stdio_rls_user_id  # noqa: E402
+from mcp_common.tracing import configure_tracing  # noqa: E402
+from mcp_common.workers import http_app, serve, serve_stdio  # noqa: E402
+
+logger = get_logger(__name__)
 
 
 @dataclass
@@ -29,8 +42,8 @@ class AppContext:
 async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
     """Manage application lifecycle with type-safe context"""
 
-    db = PostgreSQLSchemaProvider()
-    # Use connection pool instead of single connection for HTTP server
+    # The process's pools (mcp_common/replicas.py) rather than new ones for every request
+    db = PostgreSQLSchemaProvider(shared_pool=True)
     await db.create_pool()
 
     try:
@@ -40,59 +53,40 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
         try:
             await db.close_pool()
         except Exception as e:
-            print(f"⚠️  Error closing database pool: {e}")
+            logger.warning("Error closing database pool", extra={"fields": {"error": str(e)}})
 
 
 # Create MCP server with lifespan support
 mcp = FastMCP("mcp-zava-sales", lifespan=app_lifespan, stateless_http=True)
+add_metrics_route(mcp)
 
-
-def get_header(ctx: Context, header_name: str) -> Optional[str]:
-    """Extract a specific header from the request context."""
-
-    request = ctx.request_context.request
-    if request is not None and hasattr(request, "headers"):
-        headers = request.headers
-        if headers:
-            header_value = headers.get(header_name)
-            if header_value is not None:
-                if isinstance(header_value, bytes):
-                    return header_value.decode("utf-8")
-                return str(header_value)
-
-    return None
-
-
-def get_rls_user_id(ctx: Context) -> str:
-    """Get the Row Level Security User ID from the request context."""
-
-    # if running in stdio mode, use the global RLS_USER_ID passed as an argument
-    if RLS_USER_ID is not None:
-        return RLS_USER_ID
-
-    rls_user_id = get_header(ctx, "x-rls-user-id")
-    if rls_user_id is None:
-        # Default to a placeholder if not provided
-        rls_user_id = "00000000-0000-0000-0000-000000000000"
-    return rls_user_id
+# Calls of each tool that may run at once in HTTP mode; other requests (initialize, tools/list, ...)
+# get MCP_ADMISSION_DEFAULT_LIMIT each (see mcp_common/admission.py). Each running call holds a
+# database connection, so together the limits bound the server's connections.
+TOOL_LIMITS = {
+    "execute_sales_query": 8,
+    "get_multiple_table_schemas": 8,
+    "sales_by_period": 4,
+    "top_products": 4,
+    "inventory_by_store": 4,
+    "get_current_utc_date": 4,
+}
 
 
 def get_db_provider() -> PostgreSQLSchemaProvider:
     """Get the database provider instance from context."""
-    ctx = mcp.get_context()
-    app_context = ctx.request_context.lifespan_context
-    if isinstance(app_context, AppContext):
-        return app_context.db
-    raise RuntimeError("Invalid lifespan context type")
+    app_context = lifespan_context(mcp.get_context(), AppContext)
+    return app_context.db
 
 
 @mcp.tool()
+@instrument_tool
 async def get_multiple_table_schemas(
     ctx: Context,
     table_names: Annotated[
         list[str],
         Field(
-            description="List of table names. Valid table names include 'retail.customers', 'retail.stores', 'retail.categories', 'retail.product_types', 'retail.products', 'retail.orders', 'retail.order_items', 'retail.inventory'."
+            description="List of table names. Valid table names include 'retail.customers', 'retail.stores', 'retail.categories', 'retail.product_types', 'retail.products', 'retail.orders', 'retail.order_items', 'retail.inventory', 'retail.sales_daily', 'retail.sales_monthly'. For revenue, units, cost or margin by store, category, product type, day or month, prefer the pre-aggregated 'retail.sales_monthly' and 'retail.sales_daily' tables."
         ),
     ],
 ) -> str:
@@ -100,7 +94,7 @@ async def get_multiple_table_schemas(
     Retrieve schemas for multiple tables. Use this tool only for schemas you have not already fetched during the conversation.
 
     Args:
-        table_names: List of table names. Valid table names include 'retail.customers', 'retail.stores', 'retail.categories', 'retail.product_types', 'retail.products', 'retail.orders', 'retail.order_items', 'retail.inventory'.
+        table_names: List of table names. Valid table names include 'retail.customers', 'retail.stores', 'retail.categories', 'retail.product_types', 'retail.products', 'retail.orders', 'retail.order_items', 'retail.inventory', 'retail.sales_daily', 'retail.sales_monthly'. For revenue, units, cost or margin by store, category, product type, day or month, prefer the pre-aggregated 'retail.sales_monthly' and 'retail.sales_daily' tables.
 
     Returns:
         Concatenated schema strings for the requested tables.
@@ -120,6 +114,8 @@ async def get_multiple_table_schemas(
         "retail.orders",
         "retail.order_items",
         "retail.inventory",
+        "retail.sales_daily",
+        "retail.sales_monthly",
     }
 
     # Validate table names
@@ -127,8 +123,7 @@ async def get_multiple_table_schemas(
     if invalid_tables:
         return f"Error: Invalid table names: {invalid_tables}. Valid tables are: {sorted(valid_tables)}"
 
-    print(f"Manager ID: {rls_user_id}")
-    print(f"Retrieving schemas for tables: {', '.join(table_names)}")
+    logger.info("get_multiple_table_schemas", extra={"fields": {"rls_user_id": rls_user_id, "tables": table_names}})
 
     try:
         provider = get_db_provider()
@@ -138,13 +133,14 @@ async def get_multiple_table_schemas(
 
 
 @mcp.tool()
+@instrument_tool
 async def execute_sales_query(
-    ctx: Context, postgresql_query: Annotated[str, Field(description="A well-formed PostgreSQL query.")]
+    ctx: Context, postgresql_query: Annotated[str, Field(description="A well-formed, read-only PostgreSQL query.")]
 ) -> str:
-    """Always fetch table schemas first, use exact column names, join related tables for clarity, aggregate results, limit output to 20 rows, and explain that results are limited for readability.
+    """Prefer sales_by_period, top_products and inventory_by_store when they answer the question. Otherwise, always fetch table schemas first, use exact column names, join related tables for clarity, aggregate results, limit output to 20 rows, and explain that results are limited for readability. Answer revenue, units, cost and margin totals by store, category, product type, day or month from the pre-aggregated retail.sales_monthly and retail.sales_daily tables rather than from orders and order_items.
 
     Args:
-        postgresql_query: A well-formed PostgreSQL query.
+        postgresql_query: A well-formed, read-only PostgreSQL query.
 
     Returns:
         Query results as a string.
@@ -152,8 +148,8 @@ async def execute_sales_query(
 
     rls_user_id = get_rls_user_id(ctx)
 
-    print(f"Manager ID: {rls_user_id}")
-    print(f"Executing PostgreSQL query: {postgresql_query}")
+    logger.info("execute_sales_query", extra={"fields": {"rls_user_id": rls_user_id, "query_chars": len(postgresql_query or "")}})
+    logger.debug("PostgreSQL query", extra={"fields": {"sql": postgresql_query}})
 
     try:
         if not postgresql_query:
@@ -167,14 +163,119 @@ async def execute_sales_query(
         return f"Error executing database query: {e!s}"
 
 
+async def run_template(ctx: Context, template_name: str, **values: Any) -> str:
+    """Run a query template for the caller and format the result like execute_sales_query."""
+
+    rls_user_id = get_rls_user_id(ctx)
+
+    logger.info(template_name, extra={"fields": {"rls_user_id": rls_user_id, **values}})
+
+    try:
+        provider = get_db_provider()
+        result = await provider.execute_template(template_name, rls_user_id=rls_user_id, **values)
+        return f"Query Results:\n{result}"
+    except ValueError as e:
+        return f"Error: {e!s}"
+    except Exception as e:
+        return f"Error executing database query: {e!s}"
+
+
+@mcp.tool()
+@instrument_tool
+async def sales_by_period(
+    ctx: Context,
+    granularity: Annotated[
+        Literal["day", "month", "quarter", "year"], Field(description="Length of each period: day, month, quarter or year.")
+    ] = "month",
+    store: Annotated[Optional[str], Field(description="Only this store, e.g. 'Seattle'. Omit for all stores.")] = None,
+    category: Annotated[Optional[str], Field(description="Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.")] = None,
+    start_date: Annotated[Optional[str], Field(description="First date to include (YYYY-MM-DD).")] = None,
+    end_date: Annotated[Optional[str], Field(description="Last date to include (YYYY-MM-DD).")] = None,
+    max_rows: Annotated[int, Field(description="Maximum number of periods to return, most recent first.")] = 24,
+) -> str:
+    """Revenue, units, cost and gross margin per day, month, quarter or year, optionally for one store and/or category. No schema fetch or SQL needed. With month, quarter or year, months that overlap the date range are included in full.
+
+    Args:
+        granularity: Length of each period: day, month, quarter or year.
+        store: Only this store, e.g. 'Seattle'. Omit for all stores.
+        category: Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.
+        start_date: First date to include (YYYY-MM-DD).
+        end_date: Last date to include (YYYY-MM-DD).
+        max_rows: Maximum number of periods to return, most recent first.
+
+    Returns:
+        Query results as a string.
+    """
+
+    return await run_template(ctx, "sales_by_period", granularity=granularity, store=store, category=category,
+                              start_date=start_date, end_date=end_date, max_rows=max_rows)
+
+
+@mcp.tool()
+@instrument_tool
+async def top_products(
+    ctx: Context,
+    metric: Annotated[
+        Literal["revenue", "units", "gross_margin"], Field(description="Rank products by revenue, units sold or gross margin.")
+    ] = "revenue",
+    store: Annotated[Optional[str], Field(description="Only this store, e.g. 'Seattle'. Omit for all stores.")] = None,
+    category: Annotated[Optional[str], Field(description="Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.")] = None,
+    start_date: Annotated[Optional[str], Field(description="First order date to include (YYYY-MM-DD).")] = None,
+    end_date: Annotated[Optional[str], Field(description="Last order date to include (YYYY-MM-DD).")] = None,
+    max_rows: Annotated[int, Field(description="Number of products to return.")] = 10,
+) -> str:
+    """Best selling products by revenue, units or gross margin, optionally for one store, category and/or date range. No schema fetch or SQL needed.
+
+    Args:
+        metric: Rank products by revenue, units sold or gross margin.
+        store: Only this store, e.g. 'Seattle'. Omit for all stores.
+        category: Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.
+        start_date: First order date to include (YYYY-MM-DD).
+        end_date: Last order date to include (YYYY-MM-DD).
+        max_rows: Number of products to return.
+
+    Returns:
+        Query results as a string.
+    """
+
+    return await run_template(ctx, "top_products", metric=metric, store=store, category=category,
+                              start_date=start_date, end_date=end_date, max_rows=max_rows)
+
+
+@mcp.tool()
+@instrument_tool
+async def inventory_by_store(
+    ctx: Context,
+    store: Annotated[Optional[str], Field(description="Only this store, e.g. 'Seattle'. Omit for all stores.")] = None,
+    category: Annotated[Optional[str], Field(description="Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.")] = None,
+    low_stock_threshold: Annotated[int, Field(description="Stock level below which a product counts as low stock.")] = 10,
+    max_rows: Annotated[int, Field(description="Maximum number of rows to return.")] = 50,
+) -> str:
+    """Current stock per store and category: number of products, units in stock, stock value at cost and how many products are low on stock. No schema fetch or SQL needed.
+
+    Args:
+        store: Only this store, e.g. 'Seattle'. Omit for all stores.
+        category: Only this product category, e.g. 'POWER TOOLS'. Omit for all categories.
+        low_stock_threshold: Stock level below which a product counts as low stock.
+        max_rows: Maximum number of rows to return.
+
+    Returns:
+        Query results as a string.
+    """
+
+    return await run_template(ctx, "inventory_by_store", store=store, category=category,
+                              low_stock_threshold=low_stock_threshold, max_rows=max_rows)
+
+
 @mcp.tool()
+@instrument_tool
 async def get_current_utc_date() -> str:
     """Get the current UTC date and time in ISO format. Useful for date-based queries, filtering recent data, or understanding the current context for time-sensitive analysis.
 
     Returns:
         Current UTC date and time in ISO format (YYYY-MM-DDTHH:MM:SS.fffffZ)
     """
-    print("Retrieving current UTC date and time")
+    logger.debug("Retrieving current UTC date and time")
     try:
         current_utc = datetime.now(timezone.utc)
         return f"Current UTC Date/Time: {current_utc.isoformat()}"
@@ -182,31 +283,49 @@ async def get_current_utc_date() -> str:
         return f"Error retrieving current UTC date: {e!s}"
 
 
-async def run_http_server() -> None:
-    """Run the MCP server in HTTP mode."""
+def create_app() -> Any:
+    """Build the HTTP app of one server process (each worker calls this)."""
+    # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+    configure_tracing(mcp.name)
+    # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+    configure_logging(mcp.name)
+    # The FastMCP server as HTTP endpoint, behind per-tool admission control
+    return http_app(mcp, TOOL_LIMITS)
+
+
+def run_http_server(workers: int = WORKERS) -> None:
+    """Run the MCP server in HTTP mode, as one or more worker processes."""
     print(f"📡 MCP endpoint available at: http://{mcp.settings.host}:{mcp.settings.port}/mcp")
+    print(f"📈 Metrics available at: http://{mcp.settings.host}:{mcp.settings.port}/metrics")
 
-    # Run the FastMCP server as HTTP endpoint
-    await mcp.run_streamable_http_async()
+    serve(mcp, create_app, workers)
 
 
 def main() -> None:
     """Main entry point for the MCP server."""
-    global RLS_USER_ID
-
     parser = argparse.ArgumentParser()
     parser.add_argument("--stdio", action="store_true", help="Run server in stdio mode")
     parser.add_argument("--RLS_USER_ID", type=str, default=None, help="Row Level Security User ID")
+    parser.add_argument("--port", type=int, default=None, help="HTTP port (default: 8000)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="HTTP worker processes (default: MCP_WORKERS or 1)")
     args = parser.parse_args()
 
-    # if running in stdio mode, set the global RLS_USER_ID
-    RLS_USER_ID = args.RLS_USER_ID
+    if args.port is not None:
+        mcp.settings.port = args.port
+
+    # if running in stdio mode, use the RLS user id for every call
+    set_stdio_rls_user_id(args.RLS_USER_ID)
 
     if args.stdio:
-        mcp.run()
+        # Trace exporter and sampling come from MCP_TRACE_* / OTEL_* environment variables
+        configure_tracing(mcp.name)
+        # Log level and sampling come from MCP_LOG_* environment variables (JSON lines on stderr)
+        configure_logging(mcp.name)
+        serve_stdio(mcp)
     else:
         # Run the HTTP server
-        asyncio.run(run_http_server())
+        run_http_server(args.workers)
 
 
 if __name__ == "__main__":
@@ -19,11 +19,37 @@ import asyncio
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
 from dotenv import load_dotenv
 
+# Shared modules (mcp_common) live one directory up, next to the server folders
+_MCP_SERVER_DIR = str(Path(__file__).resolve().parent.parent)
+if _MCP_SERVER_DIR not in sys.path:
+    sys.path.insert(0, _MCP_SERVER_DIR)
+
+from mcp_common.cache import SharedCache, invalidate_caches  # noqa: E402
+from mcp_common.metrics import (  # noqa: E402
+    DB_ACQUIRE_WAIT,
+    DB_POOL_CREATE,
+    DB_PREPARE_SAVED,
+    DB_QUERY_DURATION,
+    SQL_VALIDATION,
+    record_cache,
+    timed,
+)
+from mcp_common.replicas import PoolRouter, pool_size, shared_router  # noqa: E402
+from mcp_common.singleflight import SingleFlight, freeze  # noqa: E402
+from mcp_common.tracing import span  # noqa: E402
+from query_templates import render_template  # noqa: E402
+from sql_validator import SchemaModel, load_schema_model, validate_sql  # noqa: E402
+from statement_cache import StatementCache, bind_literals, normalize_sql  # noqa: E402
+
 # Load environment variables (don't override existing ones)
 load_dotenv(override=False)
 
@@ -34,6 +60,53 @@ logger = logging.getLogger(__name__)
 # PostgreSQL connection configuration
 POSTGRES_URL = os.getenv("POSTGRES_URL", "postgresql://store_manager:StoreManager123!@db:5432/zava")
 
+# Prepared statements kept per pooled connection, and whether literals in agent SQL
+# are lifted into parameters so queries of the same shape reuse them
+STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "100"))
+STATEMENT_LIFETIME = 300.0
+NORMALIZE_SQL = os.getenv("MCP_SQL_NORMALIZE", "1") != "0"
+# Shared by all providers in the process: the pool (and its connections) may be
+# recreated per request, but parameter types and reuse counts carry over
+STATEMENT_CACHE = StatementCache(STATEMENT_CACHE_SIZE, STATEMENT_LIFETIME)
+
+# Agent queries run in a read-only transaction whose timeout, work_mem and RLS user are
+# set with SET LOCAL in the same round trip as BEGIN (MCP_READ_ONLY_QUERIES=0 restores the
+# session-level set_config path)
+READ_ONLY_QUERIES = os.getenv("MCP_READ_ONLY_QUERIES", "1") != "0"
+QUERY_TIMEOUT = os.getenv("MCP_QUERY_TIMEOUT", "30s")
+QUERY_WORK_MEM = os.getenv("MCP_QUERY_WORK_MEM", "4MB")
+
+# Agent queries are checked against a model of the retail schema before they take a
+# connection. The model is reloaded after SCHEMA_MODEL_TTL seconds, or after
+# SCHEMA_MODEL_RECHECK seconds when a query fails the check, in case the schema changed.
+VALIDATE_SQL = os.getenv("MCP_SQL_VALIDATE", "1") != "0"
+SCHEMA_MODEL_TTL = float(os.getenv("MCP_SCHEMA_MODEL_TTL", "300"))
+SCHEMA_MODEL_RECHECK = 10.0
+# Database URL -> schema model, shared by all providers in the process. A reload that finds
+# the schema changed invalidates the caches of every worker (see mcp_common/cache.py).
+SCHEMA_MODELS = SharedCache("schema_model", SCHEMA_MODEL_TTL)
+# (database URL, RLS user id, table) -> formatted schema returned by get_multiple_table_schemas;
+# the lists of stores, categories and years in it depend on what the RLS user may see
+TABLE_SCHEMAS = SharedCache("formatted_schema", SCHEMA_MODEL_TTL)
+
+# Identical concurrent calls share one execution (see mcp_common/singleflight.py)
+SCHEMA_FLIGHTS = SingleFlight("table_schemas")
+QUERY_FLIGHTS = SingleFlight("execute_query")
+SCHEMA_MODEL_FLIGHTS = SingleFlight("schema_model")
+
+# Options of every pool; providers created with shared_pool=True use the process's pools
+# (mcp_common/replicas.py), sized from MCP_DB_CONNECTION_BUDGET, instead of their own
+POOL_OPTIONS: Dict[str, Any] = {
+    "command_timeout": 30,  # 30 second query timeout
+    "statement_cache_size": STATEMENT_CACHE_SIZE,
+    "max_cached_statement_lifetime": STATEMENT_LIFETIME,
+    "server_settings": {
+        "jit": "off",  # Disable JIT to reduce memory usage
+        "work_mem": "4MB",  # Limit work memory per query
+        "statement_timeout": "30s",  # 30 second statement timeout
+    },
+}
+
 SCHEMA_NAME = "retail"
 MANAGER_ID = ""
 
@@ -48,15 +121,45 @@ PRODUCT_TYPES_TABLE = "product_types"
 INVENTORY_TABLE = "inventory"
 
 
+def _quote_literal(value: str) -> str:
+    """SQL string literal for a value, for statements that cannot take bind parameters."""
+    if "\x00" in value:
+        raise ValueError("String values must not contain NUL characters")
+    # E'' escapes mean the same whatever standard_conforming_strings is set to
+    return "E'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _begin_read_only(rls_user_id: str) -> str:
+    """
+    Start a read-only transaction with the per-query settings.
+
+    Several statements in one simple query are a single round trip. SET LOCAL and
+    set_config(..., true) end with the transaction, so nothing carries over to the
+    next user of the pooled connection.
+    """
+    return (
+        "BEGIN READ ONLY;"
+        f" SET LOCAL statement_timeout = {_quote_literal(QUERY_TIMEOUT)};"
+        f" SET LOCAL work_mem = {_quote_literal(QUERY_WORK_MEM)};"
+        f" SELECT set_config('app.current_rls_user_id', {_quote_literal(rls_user_id)}, true)"
+    )
+
+
 class PostgreSQLSchemaProvider:
     """Provides PostgreSQL database schema information in AI-friendly formats for dynamic query generation."""
 
-    def __init__(self, postgres_config: Optional[str] = None) -> None:
+    def __init__(self, postgres_config: Optional[str] = None, replica_configs: Optional[List[str]] = None,
+                 shared_pool: bool = False) -> None:
         self.postgres_config = postgres_config or POSTGRES_URL
+        self.replica_configs = replica_configs
+        self.shared_pool = shared_pool
+        # Primary pool plus one pool per read replica (POSTGRES_REPLICA_URLS by default)
+        self.router = PoolRouter(self.postgres_config, replica_configs)
         self.connection_pool: Optional[asyncpg.Pool] = None
         self.all_schemas: Optional[Dict[str, Dict[str, Any]]] = None
         # In-memory cache for per-table schema look-ups
         self._schema_cache: Dict[str, Any] = {}
+        self.statement_cache = STATEMENT_CACHE
 
     async def __aenter__(self) -> "PostgreSQLSchemaProvider":
         """Async context manager entry - just return self, don't auto-create pool."""
@@ -70,17 +173,17 @@ class PostgreSQLSchemaProvider:
         """Create connection pool for better resource management."""
         if self.connection_pool is None:
             try:
-                self.connection_pool = await asyncpg.create_pool(
-                    self.postgres_config,
-                    min_size=1,  # Minimum connections in pool
-                    max_size=3,  # Very conservative pool size
-                    command_timeout=30,  # 30 second query timeout
-                    server_settings={
-                        "jit": "off",  # Disable JIT to reduce memory usage
-                        "work_mem": "4MB",  # Limit work memory per query
-                        "statement_timeout": "30s",  # 30 second statement timeout
-                    },
-                )
+                if self.shared_pool:
+                    self.router = await shared_router(self.postgres_config, self.replica_configs,
+                                                      min_size=1, max_size=pool_size(), **POOL_OPTIONS)
+                else:
+                    with span("db.create_pool"), timed(DB_POOL_CREATE):
+                        await self.router.open(
+                            min_size=1,  # Minimum connections in pool
+                            max_size=3,  # Very conservative pool size
+                            **POOL_OPTIONS,
+                        )
+                self.connection_pool = self.router.primary
                 # Don't preload schemas here to avoid connection exhaustion
                 logger.info(
                     f"✅ PostgreSQL connection pool created: {self.postgres_config}"
@@ -97,29 +200,33 @@ class PostgreSQLSchemaProvider:
     async def close_pool(self) -> None:
         """Close connection pool and cleanup."""
         if self.connection_pool:
-            await self.connection_pool.close()
+            if NORMALIZE_SQL:
+                logger.info(f"Prepared statement reuse: {self.statement_cache.stats()}")
+            if not self.shared_pool:
+                await self.router.close()
             self.connection_pool = None
             self.all_schemas = None
             self._schema_cache = {}
             logger.info("✅ PostgreSQL connection pool closed")
 
-    async def get_connection(self) -> asyncpg.Connection:
-        """Get a connection from pool."""
+    async def get_connection(self, read_only: bool = True) -> asyncpg.Connection:
+        """Get a connection from a healthy read replica, or the primary pool (all tools only read)."""
         if not self.connection_pool:
             raise RuntimeError(
                 "No database connection pool available. Call create_pool() first.")
 
         try:
-            return await self.connection_pool.acquire()
+            with span("db.acquire"), timed(DB_ACQUIRE_WAIT):
+                return await self.router.acquire(read_only)
         except Exception as e:
             logger.error(f"Failed to acquire connection from pool: {e}")
             raise RuntimeError(
                 f"Connection pool exhausted or unavailable: {e}") from e
 
     async def release_connection(self, conn: asyncpg.Connection) -> None:
-        """Release connection back to pool."""
+        """Release connection back to the pool it came from."""
         if self.connection_pool:
-            await self.connection_pool.release(conn)
+            await self.router.release(conn)
 
     def _parse_table_name(self, table: str) -> tuple[str, str]:
         """Parse table name and return (schema, table_name) tuple. Always assumes table is fully qualified with schema.table format."""
@@ -229,9 +336,58 @@ class PostgreSQLSchemaProvider:
             else "one_to_many"
         )
 
+    async def _get_table_notes(self, conn: asyncpg.Connection, schema_name: str, table_name: str) -> Dict[str, str]:
+        """
+        Table comment and partitioning, set by the database generator.
+
+        The comment (e.g. on the sales rollup tables) replaces the generic description; tables
+        partitioned by data/database/order_partitions.py get their partition key and a query hint.
+        """
+        row = await conn.fetchrow(
+            """SELECT obj_description(to_regclass($1), 'pg_class') AS comment,
+                      pg_get_partkeydef(to_regclass($1)) AS partition_key""",
+            f"{schema_name}.{table_name}")
+        notes = {}
+        if row and row["comment"]:
+            notes["description"] = row["comment"]
+        if row and row["partition_key"]:
+            notes["partitioning"] = row["partition_key"]
+            notes["partition_hint"] = (
+                "Partitioned by order_date: join orders to order_items on both order_id and order_date, and "
+                "apply date filters to the order_date of both tables so only the matching partitions are scanned."
+            )
+        return notes
+
+    async def _begin_rls_transaction(self, conn: asyncpg.Connection, rls_user_id: str) -> Any:
+        """
+        Start a read-only transaction on conn with the RLS user id set for it alone.
+
+        set_config(..., true) ends with the transaction, like SET LOCAL in the agent
+        query path, so the id does not stay on the pooled connection.
+        """
+        transaction = conn.transaction(readonly=True)
+        await transaction.start()
+        try:
+            with span("db.set_rls_user"), timed(DB_QUERY_DURATION, query="set_rls_user"):
+                await conn.execute("SELECT set_config('app.current_rls_user_id', $1, true)", rls_user_id)
+        except BaseException:
+            await self._end_rls_transaction(transaction)
+            raise
+        return transaction
+
+    async def _end_rls_transaction(self, transaction: Any) -> None:
+        """Roll back a transaction from _begin_rls_transaction (it only read), if it was started."""
+        if transaction is None:
+            return
+        try:
+            await transaction.rollback()
+        except Exception as e:
+            logger.warning(f"Error ending schema transaction: {e!s}")
+
     async def get_table_schema(self, table_name: str, rls_user_id: str) -> Dict[str, Any]:
         """Return schema information for a given table."""
         # Return cached version if available
+        record_cache("table_schema", table_name in self._schema_cache)
         if table_name in self._schema_cache:
             return self._schema_cache[table_name]
 
@@ -241,11 +397,10 @@ class PostgreSQLSchemaProvider:
             return {"error": f"Table '{table_name}' not found"}
 
         conn = None
+        transaction = None
         try:
             conn = await self.get_connection()
-
-            await conn.execute(
-                "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+            transaction = await self._begin_rls_transaction(conn, rls_user_id)
 
             # Get column information
             columns = await conn.fetch(
@@ -298,6 +453,8 @@ class PostgreSQLSchemaProvider:
                 parsed_table_name,
             )
 
+            notes = await self._get_table_notes(conn, schema_name, parsed_table_name)
+
             columns_format = ", ".join(
                 f"{col['column_name']}:{col['data_type']}" for col in columns)
             lower_table = parsed_table_name.lower()
@@ -373,6 +530,7 @@ class PostgreSQLSchemaProvider:
                 ],
             }
 
+            schema_data.update(notes)
             schema_data.update(enum_data)
             # Cache result for future calls
             self._schema_cache[table_name] = schema_data
@@ -380,6 +538,7 @@ class PostgreSQLSchemaProvider:
 
         finally:
             if conn:
+                await self._end_rls_transaction(transaction)
                 await self.release_connection(conn)
 
     async def get_all_table_names(self, schema_name: str) -> List[str]:
@@ -387,10 +546,12 @@ class PostgreSQLSchemaProvider:
         conn = None
         try:
             conn = await self.get_connection()
+            # Partitions are reached through their parent table, so leave them out
             rows = await conn.fetch(
-                """SELECT table_name FROM information_schema.tables 
-                   WHERE table_schema = $1 AND table_type = 'BASE TABLE'
-                   ORDER BY table_name""",
+                """SELECT t.table_name FROM information_schema.tables t
+                   JOIN pg_class c ON c.oid = to_regclass(quote_ident(t.table_schema) || '.' || quote_ident(t.table_name))
+                   WHERE t.table_schema = $1 AND t.table_type = 'BASE TABLE' AND NOT c.relispartition
+                   ORDER BY t.table_name""",
                 schema_name,
             )
             return [row["table_name"] for row in rows]
@@ -484,6 +645,8 @@ class PostgreSQLSchemaProvider:
                     fk_table_ref = fk["references_table"]
                 lines.append(
                     f"- Join with `{fk_table_ref}` using `{fk['column']}`")
+        if schema.get("partition_hint"):
+            lines.append(f"- {schema['partition_hint']}")
 
         return "\n".join(lines) + "\n"
 
@@ -499,17 +662,29 @@ class PostgreSQLSchemaProvider:
         if not table_names:
             return "Error: table_names parameter is required and cannot be empty"
 
+        return await SCHEMA_FLIGHTS.run(
+            (self.postgres_config, rls_user_id, freeze(table_names)),
+            lambda: self._get_table_metadata_from_list(table_names, rls_user_id))
+
+    async def _get_table_metadata_from_list(self, table_names: List[str], rls_user_id: str) -> str:
+        schemas = [TABLE_SCHEMAS.get((self.postgres_config, rls_user_id, table_name)) for table_name in table_names]
+        if all(schema is not None for schema in schemas):
+            return "".join(schemas)
+
         conn = None
+        transaction = None
         try:
             conn = await self.get_connection()
             
-            # Set rls_user_id once for the connection
-            await conn.execute(
-                "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+            # Set rls_user_id once, for this transaction only
+            transaction = await self._begin_rls_transaction(conn, rls_user_id)
 
-            schemas = []
-            for table_name in table_names:
+            for i, table_name in enumerate(table_names):
+                if schemas[i] is not None:
+                    continue
                 try:
+                    # A failed query aborts only this table's part of the transaction
+                    await conn.execute("SAVEPOINT table_schema")
                     # Check if table exists first
                     schema_name, parsed_table_name = self._parse_table_name(table_name)
                     table_exists_result = await conn.fetchval(
@@ -522,27 +697,32 @@ class PostgreSQLSchemaProvider:
                     )
                     
                     if not table_exists_result:
-                        schemas.append(f"**ERROR:** Table '{table_name}' not found\n")
+                        schemas[i] = f"**ERROR:** Table '{table_name}' not found\n"
                         continue
 
                     # Get schema data efficiently within the same connection
                     # Use the original method but with our existing connection
-                    schema_data = await self._get_table_metadata(conn, table_name)
+                    with span("db.table_metadata"), timed(DB_QUERY_DURATION, query="table_metadata"):
+                        schema_data = await self._get_table_metadata(conn, table_name)
                     formatted_schema = self.format_schema_metadata_for_ai(schema_data)
-                    schemas.append(f"\n\n{formatted_schema}")
+                    schemas[i] = f"\n\n{formatted_schema}"
+                    TABLE_SCHEMAS.put((self.postgres_config, rls_user_id, table_name), schemas[i])
                     
                 except Exception as e:
-                    schemas.append(f"Error retrieving {table_name} schema: {e!s}\n")
+                    schemas[i] = f"Error retrieving {table_name} schema: {e!s}\n"
+                    await conn.execute("ROLLBACK TO SAVEPOINT table_schema")
 
             return "".join(schemas)
 
         finally:
             if conn:
+                await self._end_rls_transaction(transaction)
                 await self.release_connection(conn)
 
     async def _get_table_metadata(self, conn: asyncpg.Connection, table_name: str) -> Dict[str, Any]:
         """Get table schema using an existing connection for efficiency."""
         # Return cached version if available
+        record_cache("table_schema", table_name in self._schema_cache)
         if table_name in self._schema_cache:
             return self._schema_cache[table_name]
 
@@ -599,6 +779,8 @@ class PostgreSQLSchemaProvider:
             parsed_table_name,
         )
 
+        notes = await self._get_table_notes(conn, schema_name, parsed_table_name)
+
         columns_format = ", ".join(
             f"{col['column_name']}:{col['data_type']}" for col in columns)
         lower_table = parsed_table_name.lower()
@@ -671,22 +853,160 @@ class PostgreSQLSchemaProvider:
             ],
         }
 
+        schema_data.update(notes)
         schema_data.update(enum_data)
         # Cache result for future calls
         self._schema_cache[table_name] = schema_data
         return schema_data
 
-    async def execute_query(self, sql_query: str, rls_user_id: str) -> str:
-        """Execute a SQL query and return results in LLM-friendly JSON format."""
+    async def execute_template(self, template_name: str, rls_user_id: str, **values: Any) -> str:
+        """
+        Run one of the query templates (see query_templates.py) with the given values.
+
+        Raises:
+            ValueError: The values do not fit the template
+        """
+        sql_query, args = render_template(template_name, **values)
+        return await self.execute_query(sql_query, rls_user_id, args, query_label=f"template.{template_name}")
+
+    async def get_schema_model(self, max_age: float = SCHEMA_MODEL_TTL) -> SchemaModel:
+        """Model of the retail schema (tables, columns, join keys), loaded at most every max_age seconds."""
+        model = SCHEMA_MODELS.get(self.postgres_config, max_age=max_age)
+        if model is None:
+            model = await SCHEMA_MODEL_FLIGHTS.run(self.postgres_config, self._load_schema_model)
+        return model
+
+    async def _load_schema_model(self) -> SchemaModel:
+        conn = await self.get_connection()
+        try:
+            with span("db.schema_model"), timed(DB_QUERY_DURATION, query="schema_model"):
+                model = await load_schema_model(conn, SCHEMA_NAME)
+        finally:
+            await self.release_connection(conn)
+        previous = SCHEMA_MODELS.peek(self.postgres_config)
+        if previous is not None and (previous.tables, previous.join_keys) != (model.tables, model.join_keys):
+            # Drop the schemas cached from the old tables, in every worker
+            logger.info("Schema changed, invalidating caches")
+            invalidate_caches()
+        SCHEMA_MODELS.put(self.postgres_config, model)
+        return model
+
+    async def validate_query(self, sql_query: str) -> List[str]:
+        """
+        Problems with the tables and columns of a query, found without running it (see sql_validator.py).
+
+        A query that fails against a model older than SCHEMA_MODEL_RECHECK seconds is
+        checked again against a fresh one, so columns added since are not rejected.
+        """
+        model = await self.get_schema_model()
+        with span("sql.validate"):
+            problems = validate_sql(sql_query, model)
+        if problems and time.monotonic() - model.loaded_at >= SCHEMA_MODEL_RECHECK:
+            model = await self.get_schema_model(max_age=SCHEMA_MODEL_RECHECK)
+            problems = validate_sql(sql_query, model)
+        return problems
+
+    async def _parameterize(self, conn: asyncpg.Connection, sql_query: str
+                            ) -> Tuple[str, Sequence[Any], Optional[PreparedStatement]]:
+        """
+        Lift the literals of an agent query into parameters (see statement_cache.py).
+
+        Returns the statement and arguments to run: the normalized shape when its
+        literals convert to the inferred parameter types, else the query unchanged.
+        The third item is the shape's prepared statement when it was prepared here
+        to infer its parameter types; the query runs on it rather than being
+        prepared again.
+        """
+        normalized = normalize_sql(sql_query)
+        if normalized is None:
+            return sql_query, (), None
+
+        prepared = None
+        known, parameter_types = self.statement_cache.parameter_types(normalized.sql)
+        if not known:
+            # First time this shape is seen: let PostgreSQL infer the parameter types
+            started = time.perf_counter()
+            try:
+                with span("db.prepare"):
+                    prepared = await conn.prepare(normalized.sql)
+                parameter_types = tuple(param.name for param in prepared.get_parameters())
+            except asyncpg.PostgresError:
+                # e.g. the same expression in SELECT and GROUP BY now uses two parameters;
+                # run the original so any error message is the query's own
+                parameter_types = None
+            self.statement_cache.remember(normalized.sql, parameter_types, time.perf_counter() - started)
+
+        args = bind_literals(normalized, parameter_types) if parameter_types is not None else None
+        if args is None:
+            return sql_query, (), None
+
+        # conn.prepare() bypasses asyncpg's statement cache, so a statement prepared here does
+        # not count as prepared on the connection
+        hit, saved = self.statement_cache.use((self.router.source(conn), conn.get_server_pid()), normalized.sql,
+                                              cached=prepared is None)
+        record_cache("prepared_statement", hit)
+        if saved:
+            DB_PREPARE_SAVED.inc(saved)
+        return normalized.sql, args, prepared
+
+    async def execute_query(self, sql_query: str, rls_user_id: str, params: Sequence[Any] = (),
+                            query_label: str = "execute_query") -> str:
+        """Execute a SQL query (with optional bind parameters) and return results in LLM-friendly JSON format."""
+        return await QUERY_FLIGHTS.run(
+            (self.postgres_config, rls_user_id, sql_query, freeze(params)),
+            lambda: self._execute_query(sql_query, rls_user_id, params, query_label))
+
+    async def _execute_query(self, sql_query: str, rls_user_id: str, params: Sequence[Any],
+                             query_label: str) -> str:
+        if VALIDATE_SQL and not params:
+            try:
+                problems = await self.validate_query(sql_query)
+            except Exception as e:
+                # Without a schema model the query is left to PostgreSQL to check
+                logger.warning(f"SQL validation skipped: {e!s}")
+                problems = []
+            SQL_VALIDATION.inc(result="rejected" if problems else "passed")
+            if problems:
+                return json.dumps(
+                    {
+                        "error": f"Query not run, it does not match the {SCHEMA_NAME} schema: {' '.join(problems)}",
+                        "query": sql_query,
+                        "results": [],
+                        "row_count": 0,
+                        "columns": [],
+                    }
+                )
+
         conn = None
+        in_transaction = False
         try:
             conn = await self.get_connection()
 
-            await conn.execute(
-                "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+            # Before BEGIN: a shape that fails to prepare would otherwise abort the transaction
+            # the original query then runs in
+            statement, prepared = sql_query, None
+            if NORMALIZE_SQL and not params:
+                statement, params, prepared = await self._parameterize(conn, sql_query)
+
+            if READ_ONLY_QUERIES:
+                with span("db.begin_read_only"), timed(DB_QUERY_DURATION, query="begin_read_only"):
+                    await conn.execute(_begin_read_only(rls_user_id))
+                in_transaction = True
+            else:
+                with span("db.set_rls_user"), timed(DB_QUERY_DURATION, query="set_rls_user"):
+                    await conn.execute(
+                        "SELECT set_config('app.current_rls_user_id', $1, false)", rls_user_id)
+
+            with span("db.execute_query", query=query_label), timed(DB_QUERY_DURATION, query=query_label):
+                if prepared is not None:
+                    rows = await prepared.fetch(*params)
+                else:
+                    rows = await conn.fetch(statement, *params)
 
-            # logger.info(f"\n🔍 Executing PostgreSQL query: {sql_query}\n")
-            rows = await conn.fetch(sql_query)
+            if in_transaction:
+                with span("db.commit"), timed(DB_QUERY_DURATION, query="commit"):
+                    await conn.execute("COMMIT")
+                in_transaction = False
 
             if not rows:
                 return json.dumps(
@@ -703,10 +1023,23 @@ class PostgreSQLSchemaProvider:
             columns = list(rows[0].keys()) if rows else []
 
             # Return LLM-friendly format
+            with span("serialize.json", rows=len(results)):
+                return json.dumps(
+                    {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
+                )
+
+        except asyncpg.ReadOnlySQLTransactionError as e:
+            # Raised by the read-only transaction, and by replicas whatever the mode
+            logger.warning(f"Rejected write attempt: {e!s}")
             return json.dumps(
-                {"results": results, "row_count": len(results), "columns": columns}, indent=2, default=str
+                {
+                    "error": f"Write rejected: only read-only queries (SELECT) can be run. PostgreSQL said: {e!s}",
+                    "query": sql_query,
+                    "results": [],
+                    "row_count": 0,
+                    "columns": [],
+                }
             )
-
         except Exception as e:
             return json.dumps(
                 {
@@ -719,6 +1052,11 @@ class PostgreSQLSchemaProvider:
             )
         finally:
             if conn:
+                if in_transaction and conn.is_in_transaction():
+                    try:
+                        await conn.execute("ROLLBACK")
+                    except Exception as e:
+                        logger.warning(f"Rollback failed: {e!s}")
                 await self.release_connection(conn)
 
 
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Schema-aware pre-validation of agent SQL.
+
+When the model invents a column or a table, PostgreSQL only says so after the
+query has taken a pooled connection and a round trip. validate_sql() checks
+the query locally, against a model of the retail schema (tables, columns and
+the foreign keys they join on), and returns errors naming the closest columns:
+
+    column o.store_name does not exist: retail.orders has no column store_name.
+    Did you mean o.store_id? store_name is a column of retail.stores
+    (JOIN retail.stores ON stores.store_id = o.store_id).
+
+The check walks the tokens of the query rather than parsing it fully, and only
+reports what it can be sure of:
+
+- schema-qualified tables (retail.x) that do not exist, and retail tables
+  named without the schema while it is not on the search_path
+- alias.column references to a retail table that has no such column
+- in queries that read retail tables only (no subqueries or functions in FROM,
+  no CTEs), plain names that are no column of those tables although they are
+  close to one, or are a column of another retail table
+
+Everything else is left to PostgreSQL.
+
+Usage:
+    model = await load_schema_model(conn, "retail")
+    problems = validate_sql(sql, model)
+"""
+
+import difflib
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import asyncpg
+
+from statement_cache import tokenize
+
+# Words that are never column references: keywords, date/time fields and type names.
+# Function names need not be listed, they are always followed by "(".
+_KEYWORDS = frozenset("""
+    all analyse analyze and any array as asc asymmetric at between both by case cast collate create cross
+    cube current current_date current_role current_time current_timestamp current_user default delete desc
+    distinct do else end escape except exclude exists explain false fetch filter first following for format
+    from full grant group grouping groups having ilike in inner insert intersect interval into is isnull
+    join last lateral leading left like limit local localtime localtimestamp locked materialized natural
+    next no not notnull nowait null nulls of offset on only or order others outer over overlaps partition
+    preceding range recursive repeatable returning right rollup row rows select session_user set sets
+    similar skip some symmetric table tablesample then ties to trailing true unbounded union unknown update
+    user using values variadic verbose when where window with within without zone
+    century day decade dow doy epoch hour isodow isoyear microseconds millennium milliseconds minute month
+    quarter second timezone timezone_hour timezone_minute week year
+    bigint bool boolean char character date decimal double float int int2 int4 int8 integer json jsonb
+    numeric precision real smallint text time timestamp timestamptz uuid varchar varying
+""".split())
+
+# Tables listed in FROM (after a comma) or JOINed follow these
+_RELATION_START = frozenset({"from", "join"})
+
+
+@dataclass(frozen=True)
+class JoinKey:
+    """One column of a foreign key: table.column references references_table.references_column."""
+
+    table: str
+    column: str
+    references_table: str
+    references_column: str
+
+
+@dataclass
+class SchemaModel:
+    """Tables and columns of one schema, and the foreign keys between them."""
+
+    schema: str
+    tables: Dict[str, Tuple[str, ...]]
+    join_keys: Tuple[JoinKey, ...] = ()
+    # Whether unqualified table names resolve to this schema
+    on_search_path: bool = False
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    def tables_with_column(self, column: str) -> List[str]:
+        return [table for table, columns in self.tables.items() if column in columns]
+
+    def join_condition(self, table: str, qualifier: str, other: str) -> Optional[str]:
+        """ON condition joining `other` to `table` (referred to as `qualifier`) along a foreign key."""
+        for key in self.join_keys:
+            if key.table == table and key.references_table == other:
+                return f"{other}.{key.references_column} = {qualifier}.{key.column}"
+            if key.table == other and key.references_table == table:
+                return f"{other}.{key.column} = {qualifier}.{key.references_column}"
+        return None
+
+
+async def load_schema_model(conn: asyncpg.Connection, schema: str) -> SchemaModel:
+    """Read the tables (and views), columns and foreign keys of a schema from the catalog."""
+    columns = await conn.fetch(
+        """SELECT c.relname AS table_name, a.attname AS column_name
+           FROM pg_class c
+           JOIN pg_namespace n ON n.oid = c.relnamespace
+           JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+           WHERE n.nspname = $1 AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+           ORDER BY c.relname, a.attnum""",
+        schema,
+    )
+    join_keys = await conn.fetch(
+        """SELECT src.relname AS table_name, sa.attname AS column_name,
+                  dst.relname AS references_table, da.attname AS references_column
+           FROM pg_constraint k
+           JOIN pg_class src ON src.oid = k.conrelid
+           JOIN pg_class dst ON dst.oid = k.confrelid
+           JOIN pg_namespace n ON n.oid = src.relnamespace
+           CROSS JOIN LATERAL unnest(k.conkey, k.confkey) AS key_columns(src_attnum, dst_attnum)
+           JOIN pg_attribute sa ON sa.attrelid = k.conrelid AND sa.attnum = key_columns.src_attnum
+           JOIN pg_attribute da ON da.attrelid = k.confrelid AND da.attnum = key_columns.dst_attnum
+           WHERE k.contype = 'f' AND n.nspname = $1 AND NOT src.relispartition
+           ORDER BY src.relname, k.conname""",
+        schema,
+    )
+    on_search_path = await conn.fetchval("SELECT $1 = ANY(current_schemas(false))", schema)
+
+    tables: Dict[str, List[str]] = {}
+    for row in columns:
+        tables.setdefault(row["table_name"], []).append(row["column_name"])
+    return SchemaModel(
+        schema=schema,
+        tables={table: tuple(names) for table, names in tables.items()},
+        join_keys=tuple(JoinKey(row["table_name"], row["column_name"], row["references_table"],
+                                row["references_column"]) for row in join_keys),
+        on_search_path=bool(on_search_path),
+    )
+
+
+def _identifier(kind: str, text: str) -> str:
+    """Name an identifier token refers to: unquoted names fold to lower case."""
+    return text[1:-1].replace('""', '"') if kind == "quoted" else text.lower()
+
+
+def _closest(name: str, columns: List[str]) -> List[str]:
+    """Columns a mistyped or invented name most likely meant: price -> base_price, categry -> category_id."""
+    containing = [column for column in columns if name in column.split("_") and column != name]
+    close = difflib.get_close_matches(name, columns, n=3, cutoff=0.6)
+    return list(dict.fromkeys(containing + close))[:3]
+
+
+def _did_you_mean(candidates: List[str]) -> str:
+    return f" Did you mean {' or '.join(candidates)}?" if candidates else ""
+
+
+class _Query:
+    """The tables, aliases and names of one query, collected in a single walk over its tokens."""
+
+    def __init__(self, sql: str, model: SchemaModel) -> None:
+        self.model = model
+        self.tokens = [(kind, text) for kind, text in tokenize(sql) if kind not in ("space", "comment")]
+        # Per token: kind, lower-cased text of words and operators (for keyword tests), and whether it
+        # is an identifier (a quoted name, or a word that is not a keyword). Three empty entries at the
+        # end make positions just past either end read as nothing.
+        self.kinds = [kind for kind, _ in self.tokens] + ["", "", ""]
+        self.words = [text.lower() if kind in ("word", "op") else "" for kind, text in self.tokens] + ["", "", ""]
+        self.identifiers = [kind == "quoted" or (kind == "word" and word not in _KEYWORDS)
+                            for kind, word in zip(self.kinds, self.words)]
+        # Alias or table name -> retail table it stands for (None: CTE, subquery, other schema)
+        self.aliases: Dict[str, Optional[str]] = {}
+        self.ambiguous: Set[str] = set()
+        # Names that are not columns: output aliases, CTE and window names
+        self.names: Set[str] = set()
+        # Token positions that are part of a table reference
+        self.consumed: Set[int] = set()
+        # Commas that separate the items of a FROM list
+        self.relation_commas: Set[int] = set()
+        self.tables: List[str] = []
+        # Whether every relation the query reads is a known retail table
+        self.simple = True
+        self.problems: List[str] = []
+
+    def name(self, i: int) -> str:
+        return _identifier(*self.tokens[i])
+
+    def add_problem(self, problem: str) -> None:
+        if problem not in self.problems:
+            self.problems.append(problem)
+
+    def bind(self, alias: str, table: Optional[str]) -> None:
+        if alias in self.aliases and self.aliases[alias] != table:
+            self.ambiguous.add(alias)
+        self.aliases.setdefault(alias, table)
+
+    def collect(self) -> None:
+        """Find CTE names, output aliases and the tables each FROM and JOIN reads."""
+        words, kinds, identifiers = self.words, self.kinds, self.identifiers
+        for i in range(len(self.tokens)):
+            if kinds[i] not in ("word", "quoted"):
+                continue
+            before = words[i - 1]
+            if before in ("with", "recursive", ",") and words[i + 1] == "as" and words[i + 2] in (
+                    "(", "materialized", "not"):
+                self.names.add(self.name(i))
+                self.simple = False
+            elif before == "window" or (before == "as" and identifiers[i]):
+                self.names.add(self.name(i))
+            elif identifiers[i] and words[i + 1] != "(" and (
+                    kinds[i - 1] in ("number", "string", "quoted") or before == ")" or identifiers[i - 1]):
+                # Two names in a row: the second one is an alias
+                self.names.add(self.name(i))
+
+        # Parentheses that belong to a function call (their FROM is EXTRACT(... FROM ...) and the like),
+        # and those after which a derived table's alias may follow
+        stack: List[str] = []
+        i = 0
+        while i < len(self.tokens):
+            word = words[i]
+            if word == "(":
+                if self.words[i - 1] in _RELATION_START or self.words[i - 1] in ("lateral", ","):
+                    stack.append("derived" if self._in_from_list(i) else "group")
+                else:
+                    stack.append("call" if self.identifiers[i - 1] else "group")
+            elif word == ")":
+                kind = stack.pop() if stack else "group"
+                if kind == "derived":
+                    i = self._after_relation(i + 1, None, None)
+                    continue
+            elif word in _RELATION_START and not (stack and stack[-1] == "call") and not (
+                    word == "from" and self.words[i - 1] == "distinct"):
+                i = self._relation(i + 1)
+                continue
+            i += 1
+
+    def _in_from_list(self, i: int) -> bool:
+        """Whether the "(" at i starts a FROM item: a subquery or parenthesized join."""
+        before = self.words[i - 1]
+        if before == "lateral":
+            before = self.words[i - 2]
+        return before in _RELATION_START or (before == "," and i - 1 in self.relation_commas)
+
+    def _relation(self, i: int) -> int:
+        """Read one FROM item starting at i; returns the position after it (and its alias)."""
+        while self.words[i] in ("lateral", "only"):
+            i += 1
+        if self.words[i] == "(":
+            self.simple = False
+            return i  # the walk pushes a derived parenthesis and reads the alias after it
+        if self.kinds[i] not in ("word", "quoted"):
+            return i
+
+        start, parts = i, [self.name(i)]
+        while self.words[i + 1] == "." and self.kinds[i + 2] in ("word", "quoted"):
+            i += 2
+            parts.append(self.name(i))
+        self.consumed.update(range(start, i + 1))
+        i += 1
+        if self.words[i] == "(":
+            # A set-returning function such as generate_series(...)
+            self.simple = False
+            return i
+
+        model = self.model
+        table: Optional[str] = None
+        if len(parts) == 2 and parts[0] == model.schema:
+            if parts[1] in model.tables:
+                table = parts[1]
+            else:
+                close = _closest(parts[1], list(model.tables))
+                hint = (_did_you_mean([f"{model.schema}.{name}" for name in close]) if close
+                        else f" The {model.schema} tables are: {', '.join(sorted(model.tables))}.")
+                self.add_problem(f"relation {model.schema}.{parts[1]} does not exist.{hint}")
+                self.simple = False
+        elif len(parts) == 1 and parts[0] in self.names:
+            self.simple = False  # a CTE
+        elif len(parts) == 1 and parts[0] in model.tables:
+            table = parts[0]
+            if not model.on_search_path:
+                self.add_problem(f"relation {parts[0]} does not exist: tables must be schema-qualified, "
+                                 f"as {model.schema}.{parts[0]}.")
+        else:
+            self.simple = False
+        if table:
+            self.tables.append(table)
+        return self._after_relation(i, table, parts[-1])
+
+    def _after_relation(self, i: int, table: Optional[str], table_name: Optional[str]) -> int:
+        """Read the alias of a FROM item, then the next item of a comma-separated FROM list."""
+        alias = None
+        if self.words[i] == "as" and self.identifiers[i + 1]:
+            alias, i = self.name(i + 1), i + 2
+        elif self.identifiers[i]:
+            alias, i = self.name(i), i + 1
+        if alias is not None and self.words[i] == "(":
+            # Column aliases: the table's columns are renamed
+            table = None
+            depth = 0
+            while i < len(self.tokens):
+                depth += {"(": 1, ")": -1}.get(self.words[i], 0)
+                i += 1
+                if depth == 0:
+                    break
+        if alias is not None:
+            self.bind(alias, table)
+        elif table_name is not None:
+            self.bind(table_name, table)
+        if self.words[i] == ",":
+            self.relation_commas.add(i)
+            return self._relation(i + 1)
+        return i
+
+    def check_columns(self) -> None:
+        model, words = self.model, self.words
+        in_scope = {column for table in self.tables for column in model.tables[table]}
+        for i, kind in enumerate(self.kinds[:len(self.tokens)]):
+            if kind not in ("word", "quoted") or i in self.consumed or words[i + 1] == "(":
+                continue
+            if words[i - 1] in (".", "::"):
+                continue
+
+            if words[i + 1] == ".":
+                if self.kinds[i + 2] not in ("word", "quoted") or words[i + 3] == "(":
+                    continue
+                qualifier, column = self.name(i), self.name(i + 2)
+                if qualifier == model.schema and words[i + 3] == ".":
+                    continue  # retail.table.column is left to PostgreSQL
+                self._check_qualified(qualifier, column)
+                continue
+
+            if kind != "word" or not self.simple or not self.tables or not self.identifiers[i]:
+                continue
+            if words[i - 1] in ("as", "over", "window"):
+                continue
+            name = self.name(i)
+            if name in self.names or name in self.aliases or name in in_scope:
+                continue
+            close = _closest(name, sorted(in_scope))
+            elsewhere = [table for table in model.tables_with_column(name) if table not in self.tables]
+            if close or elsewhere:
+                tables = ", ".join(f"{model.schema}.{table}" for table in dict.fromkeys(self.tables))
+                self.add_problem(f"column {name} does not exist in {tables}."
+                                 f"{_did_you_mean(close)}{self._elsewhere(name, elsewhere, None)}")
+
+    def _check_qualified(self, qualifier: str, column: str) -> None:
+        model = self.model
+        if qualifier in self.ambiguous:
+            return
+        if qualifier not in self.aliases:
+            if self.simple and self.tables and qualifier not in self.names and qualifier != model.schema:
+                known = ", ".join(sorted(self.aliases))
+                self.add_problem(f"missing FROM-clause entry for {qualifier} in {qualifier}.{column}: "
+                                 f"the query's tables and aliases are {known}.")
+            return
+        table = self.aliases[qualifier]
+        if table is None or column in model.tables[table]:
+            return
+        close = _closest(column, list(model.tables[table]))
+        elsewhere = [other for other in model.tables_with_column(column) if other != table]
+        self.add_problem(
+            f"column {qualifier}.{column} does not exist: {model.schema}.{table} has no column {column}."
+            f"{_did_you_mean([f'{qualifier}.{name}' for name in close])}"
+            f"{self._elsewhere(column, elsewhere, (table, qualifier))}")
+
+    def _elsewhere(self, column: str, tables: List[str], joined_from: Optional[Tuple[str, str]]) -> str:
+        """Where else a column exists, with the join condition when there is a foreign key to follow."""
+        if not tables:
+            return ""
+        sources = [joined_from] if joined_from else [
+            (table, alias) for alias, table in self.aliases.items() if table and alias not in self.ambiguous]
+        joinable, others = [], []
+        for other in tables:
+            hint = f"{self.model.schema}.{other}"
+            for table, qualifier in sources:
+                condition = self.model.join_condition(table, qualifier, other)
+                if condition:
+                    joinable.append(f"{hint} (JOIN {hint} ON {condition})")
+                    break
+            else:
+                others.append(hint)
+        # Tables the query can join to along a foreign key first
+        return f" {column} is a column of {' and '.join((joinable + others)[:2])}."
+
+
+def validate_sql(sql: str, model: SchemaModel) -> List[str]:
+    """
+    Check a query's tables and columns against the schema model.
+
+    Returns:
+        The problems found, each a message for the agent; empty when nothing is wrong
+        as far as the model can tell
+    """
+    query = _Query(sql, model)
+    query.collect()
+    query.check_columns()
+    return query.problems
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Prepared statement reuse for agent-written SQL.
+
+Queries written by the model often differ only in their literals:
+
+    SELECT ... WHERE o.order_date >= '2025-01-01' AND s.store_name = 'Zava Retail Seattle' LIMIT 20
+    SELECT ... WHERE o.order_date >= '2024-01-01' AND s.store_name = 'Zava Retail Tacoma' LIMIT 10
+
+normalize_sql() lifts such literals into bind parameters, so both become the
+same statement text ("shape") with different arguments:
+
+    SELECT ... WHERE o.order_date >= $1 AND s.store_name = $2 LIMIT $3
+
+asyncpg keeps a prepared statement cache per connection keyed by statement
+text, so every pooled connection parses and analyses a shape once and reuses
+the prepared statement afterwards. PostgreSQL also switches a prepared
+statement to a cached generic plan once that is no more expensive than
+planning each call (after five executions by default).
+
+Only literals whose meaning cannot change are lifted: values compared with
+=, <>, <, >, <=, >=, LIKE or ILIKE, BETWEEN bounds, IN lists, LIMIT and OFFSET,
+and DATE / TIMESTAMP literals in those places. Literals elsewhere (function
+arguments such as DATE_TRUNC('month', ...), ORDER BY 1, type modifiers,
+INTERVAL '1 month', ...) stay in the text. PostgreSQL infers the parameter
+types when the shape is first prepared; literals are then converted to those
+types. Queries that cannot be parameterized this way run unchanged.
+
+StatementCache remembers the parameter types of each shape and counts reuse
+per pooled connection, for the hit rate and the preparation time saved.
+"""
+
+import functools
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z0-9_]*)?\$.*?\$(?P=tag)?\$)
+    | (?P<param>\$\d+)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<op><=|>=|<>|!=|::|\S)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# A literal directly after one of these is a value, whatever its position in the query
+_VALUE_CONTEXT = {"=", "<>", "!=", "<", ">", "<=", ">=", "like", "ilike", "between", "limit", "offset"}
+# Typed literals that can be replaced by $n::type
+_TYPED_LITERALS = {"date": "date", "timestamp": "timestamp"}
+
+
+@dataclass(frozen=True)
+class NormalizedQuery:
+    """Statement text with literals replaced by $1, $2, ... and the lifted literals in order."""
+
+    sql: str
+    literals: Tuple[Tuple[str, str], ...]  # (kind, text): kind is 'number' or 'string'
+
+
+@functools.lru_cache(maxsize=128)
+def tokenize(sql: str) -> Tuple[Tuple[str, str], ...]:
+    """
+    Split a query into (kind, text) tokens, whitespace and comments included.
+
+    kind is one of space, comment, dollar, param, string, quoted, number, word or op.
+    Cached, as validation and normalization both tokenize the same query.
+    """
+    return tuple((match.lastgroup, match.group()) for match in _TOKEN.finditer(sql))
+
+
+def normalize_sql(sql: str) -> Optional[NormalizedQuery]:
+    """
+    Lift the value literals of a query into bind parameters.
+
+    Returns:
+        The normalized query, or None when there is nothing to lift or the
+        query already uses bind parameters
+    """
+    tokens = tokenize(sql)
+    if any(kind == "param" for kind, _ in tokens):
+        return None
+
+    output: List[str] = []
+    literals: List[Tuple[str, str]] = []
+    previous: List[str] = []  # lower-cased significant tokens so far
+    paren_is_list: List[bool] = []
+
+    def value_position(offset: int = 0) -> bool:
+        """Whether a literal at previous[-1 - offset] + 1 is a value."""
+        before = previous[-1 - offset] if len(previous) > offset else ""
+        if before in _VALUE_CONTEXT:
+            return True
+        # Upper bound of BETWEEN ... AND ...
+        if before == "and" and "between" in previous[-4 - offset:-1 - offset]:
+            return True
+        # Items of IN (...) lists
+        return before in ("(", ",") and bool(paren_is_list) and paren_is_list[-1]
+
+    for kind, text in tokens:
+        if kind in ("space", "comment"):
+            output.append(text)
+            continue
+
+        lowered = text.lower()
+        if kind == "op" and text == "(":
+            paren_is_list.append(bool(previous) and previous[-1] == "in")
+        elif kind == "op" and text == ")" and paren_is_list:
+            paren_is_list.pop()
+
+        if kind in ("number", "string") and value_position():
+            literals.append((kind, text))
+            output.append(f"${len(literals)}")
+        elif kind == "string" and previous and previous[-1] in _TYPED_LITERALS and value_position(1):
+            # DATE '2025-01-01' -> $n::date (drop the keyword and the whitespace after it)
+            while output and output[-1].isspace():
+                output.pop()
+            output.pop()
+            literals.append((kind, text))
+            output.append(f"${len(literals)}::{_TYPED_LITERALS[previous[-1]]}")
+        else:
+            output.append(text)
+        previous.append(lowered if kind in ("word", "op") else kind)
+
+    if not literals:
+        return None
+    return NormalizedQuery("".join(output), tuple(literals))
+
+
+def _string_value(text: str) -> str:
+    return text[1:-1].replace("''", "'")
+
+
+def _to_int(kind: str, text: str) -> int:
+    return int(_string_value(text) if kind == "string" else text)
+
+
+def _to_decimal(kind: str, text: str) -> Decimal:
+    try:
+        return Decimal(_string_value(text) if kind == "string" else text)
+    except InvalidOperation:
+        raise ValueError(text) from None
+
+
+def _to_float(kind: str, text: str) -> float:
+    return float(_string_value(text) if kind == "string" else text)
+
+
+def _to_text(kind: str, text: str) -> str:
+    # A bare number compared with a text column is a type error in the original query
+    if kind != "string":
+        raise ValueError(text)
+    return _string_value(text)
+
+
+def _to_date(kind: str, text: str) -> date:
+    if kind != "string":
+        raise ValueError(text)
+    return date.fromisoformat(_string_value(text).strip())
+
+
+def _to_timestamp(kind: str, text: str) -> datetime:
+    if kind != "string":
+        raise ValueError(text)
+    value = datetime.fromisoformat(_string_value(text).strip())
+    if value.tzinfo is not None:
+        raise ValueError(text)
+    return value
+
+
+# PostgreSQL type name -> converter from literal (kind, text) to the Python value asyncpg expects
+_CONVERTERS: Dict[str, Callable[[str, str], Any]] = {
+    "int2": _to_int,
+    "int4": _to_int,
+    "int8": _to_int,
+    "numeric": _to_decimal,
+    "float4": _to_float,
+    "float8": _to_float,
+    "text": _to_text,
+    "varchar": _to_text,
+    "bpchar": _to_text,
+    "name": _to_text,
+    "date": _to_date,
+    "timestamp": _to_timestamp,
+}
+
+
+def bind_literals(query: NormalizedQuery, parameter_types: Tuple[str, ...]) -> Optional[List[Any]]:
+    """Convert the lifted literals to their parameter types; None if any of them does not convert."""
+    if len(parameter_types) != len(query.literals):
+        return None
+    args = []
+    for (kind, text), type_name in zip(query.literals, parameter_types):
+        converter = _CONVERTERS.get(type_name)
+        if converter is None:
+            return None
+        try:
+            args.append(converter(kind, text))
+        except ValueError:
+            return None
+    return args
+
+
+class StatementCache:
+    """
+    Parameter types of known shapes, and which shapes each pooled connection has prepared.
+
+    asyncpg holds the prepared statements themselves. This mirrors its
+    per-connection LRU (same size) to tell hits from misses, and keeps the time
+    it took to prepare each shape as the estimate of what a hit saves.
+    """
+
+    def __init__(self, statements_per_connection: int = 100, statement_lifetime: float = 300.0,
+                 max_shapes: int = 1000, max_connections: int = 64) -> None:
+        self.statements_per_connection = statements_per_connection
+        # asyncpg drops cached statements unused for this long (max_cached_statement_lifetime)
+        self.statement_lifetime = statement_lifetime
+        self.max_shapes = max_shapes
+        # Pools replace idle connections, so old backends are dropped oldest first
+        self.max_connections = max_connections
+        # shape -> parameter type names, or None when the shape cannot be parameterized
+        self._shapes: "OrderedDict[str, Optional[Tuple[str, ...]]]" = OrderedDict()
+        self._prepare_seconds: Dict[str, float] = {}
+        # connection (server, backend pid) -> shapes prepared on it and when they were last used
+        self._connections: "OrderedDict[Hashable, OrderedDict[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def parameter_types(self, shape: str) -> Tuple[bool, Optional[Tuple[str, ...]]]:
+        """(known, types) for a shape; types is None for shapes that run unnormalized."""
+        if shape not in self._shapes:
+            return False, None
+        self._shapes.move_to_end(shape)
+        return True, self._shapes[shape]
+
+    def remember(self, shape: str, parameter_types: Optional[Tuple[str, ...]], prepare_seconds: float = 0.0) -> None:
+        self._shapes[shape] = parameter_types
+        self._prepare_seconds[shape] = prepare_seconds
+        while len(self._shapes) > self.max_shapes:
+            evicted, _ = self._shapes.popitem(last=False)
+            self._prepare_seconds.pop(evicted, None)
+
+    def use(self, connection: Hashable, shape: str, cached: bool = True) -> Tuple[bool, float]:
+        """
+        Record that a connection runs a shape.
+
+        Args:
+            cached: False when the shape runs on a statement prepared outside the connection's
+                    statement cache, so that its next run on the connection prepares it again
+
+        Returns:
+            (hit, seconds saved): whether the connection had the shape prepared already
+        """
+        if not cached:
+            self.misses += 1
+            return False, 0.0
+        prepared = self._connections.setdefault(connection, OrderedDict())
+        self._connections.move_to_end(connection)
+        while len(self._connections) > self.max_connections:
+            self._connections.popitem(last=False)
+        now = time.monotonic()
+        last_used = prepared.get(shape)
+        hit = last_used is not None and (not self.statement_lifetime or now - last_used < self.statement_lifetime)
+        prepared[shape] = now
+        prepared.move_to_end(shape)
+        while len(prepared) > self.statements_per_connection:
+            prepared.popitem(last=False)
+
+        saved = self._prepare_seconds.get(shape, 0.0) if hit else 0.0
+        if hit:
+            self.hits += 1
+            self.seconds_saved += saved
+        else:
+            self.misses += 1
+        return hit, saved
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "shapes": len(self._shapes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "prepare_ms_saved": round(self.seconds_saved * 1000, 1),
+        }